@@ -0,0 +1,71 @@
+"""
+Registro de contas Bling (origens e destinos).
+
+As contas vêm da variável `BLING_ACCOUNTS`, no formato `nome:papel` separado
+por vírgulas, com papel `origem` ou `destino` — por exemplo
+`lojahi:origem,select:destino,outlet:destino`. Para cada conta são lidas
+`BLING_<NOME>_CLIENT_ID` e `BLING_<NOME>_CLIENT_SECRET` (as mesmas variáveis já
+usadas por LOJAHI e SELECT). Sem `BLING_ACCOUNTS`, vale o par LOJAHI → SELECT.
+
+Cada conta tem seu próprio state OAuth fixo, arquivo de tokens
+(`token_<nome>.json`) e TokenManager.
+"""
+import os
+
+from token_manager import get_token_manager
+
+DEFAULT_ACCOUNTS = "lojahi:origem,select:destino"
+ORIGIN = "origem"
+DESTINATION = "destino"
+
+
+class Account:
+    '''Conta Bling registrada: nome, papel (origem/destino) e credenciais OAuth.'''
+
+    def __init__(self, name, role):
+        env_prefix = f"BLING_{name.upper()}"
+        self.name = name
+        self.role = role
+        self.label = name.upper()
+        self.client_id = os.getenv(f"{env_prefix}_CLIENT_ID")
+        self.client_secret = os.getenv(f"{env_prefix}_CLIENT_SECRET")
+        self.oauth_state = os.getenv(f"{env_prefix}_OAUTH_STATE", f"state_{name}_fixed_v1")
+
+    def token_manager(self, storage_path):
+        '''TokenManager da conta (compartilhado pelo processo).'''
+        return get_token_manager(self.name, self.client_id, self.client_secret, storage_path)
+
+
+def parse_accounts(spec):
+    '''Interpreta `nome:papel,...` e retorna as contas na ordem informada.'''
+    accounts = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        name, _, role = entry.strip().partition(":")
+        role = role.strip().lower() or DESTINATION
+        if role not in (ORIGIN, DESTINATION):
+            raise ValueError(f"Papel inválido para a conta {name}: {role} (use '{ORIGIN}' ou '{DESTINATION}')")
+        accounts[name.strip().lower()] = Account(name.strip().lower(), role)
+    return accounts
+
+
+ACCOUNTS = parse_accounts(os.getenv("BLING_ACCOUNTS", DEFAULT_ACCOUNTS))
+
+
+def origin_accounts():
+    '''Contas que podem ser usadas como origem.'''
+    return [account for account in ACCOUNTS.values() if account.role == ORIGIN]
+
+
+def destination_accounts():
+    '''Contas que podem receber imagens.'''
+    return [account for account in ACCOUNTS.values() if account.role == DESTINATION]
+
+
+def account_for_state(state):
+    '''Conta cujo state OAuth fixo corresponde ao recebido no redirecionamento (ou None).'''
+    for account in ACCOUNTS.values():
+        if account.oauth_state == state:
+            return account
+    return None
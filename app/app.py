@@ -1,55 +1,54 @@
 import streamlit as st
 import requests
 import os
-import json
+import shutil
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urlencode
 
-# --- Configurações ---
-BLING_API_BASE_URL = "https://www.bling.com.br/Api/v3"
-APP_URL_BASE = os.getenv("APP_URL", "http://localhost:8501")
+import token_manager
+from accounts import ACCOUNTS
+from bling_api import fetch_variations_with_media
+from circuit_breaker import breakers_snapshot, guarded_request
+from coalescing import RequestCoalescer
+from config import (BLING_API_BASE_URL, BLING_LOJAHI_CLIENT_ID, BLING_LOJAHI_CLIENT_SECRET,
+                    BLING_LOJAHI_REDIRECT_URI, LOG_FILE, STATE_LOJAHI_FIXED, STORAGE_PATH, log_message)
+from export import EXPORT_UI_MAX_MB, StreamReader, export_size, iter_export_stream, list_export_entries
+from image_dedup import find_duplicates, fingerprint_images, is_phash_enabled
+from image_integrity import IMAGE_VALIDATION, IMAGE_VALIDATION_RETRIES, CorruptImageError, validate_image
+from image_links import add_unique_image, is_link_expiring, normalize_image_link, signed_url_expiry
+from image_workers import is_transform_enabled, submit_transform, transformed_file_name
+from leases import DISTRIBUTED_WORKERS, PROGRESS_POLL_SECONDS, get_lease_worker
+from pipeline import (PIPELINE_DEDUP_WORKERS, PIPELINE_DETAIL_WORKERS, PIPELINE_DOWNLOAD_WORKERS,
+                      PIPELINE_RESOLVE_WORKERS, PIPELINE_WRITE_WORKERS, PipelineEngine, Stage)
+from planner import format_duration, plan_batch
+from progress import PROGRESS_REFRESH_SECONDS, ProgressTracker, format_progress, progress_fraction
+from resource_governor import describe_pressure, get_resource_governor
+from scheduler import ScheduledTokens, get_scheduler, priority_for_batch
+from sku_import import SKU_IMPORT_CHUNK_SIZE, SKU_IMPORT_FORMATS, SkuImportError, format_import_report, import_skus
+from state_store import get_state_store
+from storage_budget import StorageFullError, get_storage_budget
+from storage_layout import FileIndex, ensure_sku_directory, sku_directory
+from token_manager import TokenRefreshError, get_token_manager, stamp_expiry
 
-# Configurações OAuth para conta ORIGEM (LOJAHI)
-BLING_LOJAHI_CLIENT_ID = os.getenv("BLING_LOJAHI_CLIENT_ID")
-BLING_LOJAHI_CLIENT_SECRET = os.getenv("BLING_LOJAHI_CLIENT_SECRET")
-BLING_LOJAHI_REDIRECT_URI = f"{APP_URL_BASE}/lojahi"
-STATE_LOJAHI_FIXED = "lojahi_state_fixed_12345"
-
-# Diretório de armazenamento
-DEFAULT_STORAGE_PATH = "./app/data/storage"
-STORAGE_PATH = os.getenv("STORAGE_PATH", DEFAULT_STORAGE_PATH)
-os.makedirs(STORAGE_PATH, exist_ok=True)
-
-# Arquivo de log
-LOG_FILE = os.path.join(STORAGE_PATH, "migration.log")
 
 
 # --- Funções Auxiliares ---
-def log_message(message):
-    """Registra mensagens no arquivo de log com timestamp."""
-    timestamp = datetime.now().isoformat()
-    log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(log_entry)
-    print(log_entry.strip())
-
-
 def save_tokens(account_name, tokens):
-    """Salva tokens OAuth em arquivo JSON."""
-    token_file = os.path.join(STORAGE_PATH, f"token_{account_name}.json")
-    with open(token_file, "w", encoding="utf-8") as f:
-        json.dump(tokens, f, indent=2)
+    """Salva tokens OAuth em arquivo JSON (com data de expiração)."""
+    token_file = token_manager.save_tokens(STORAGE_PATH, account_name, stamp_expiry(tokens))
     log_message(f"Tokens de {account_name} salvos em {token_file}")
 
 
 def load_tokens(account_name):
     """Carrega tokens OAuth de arquivo JSON."""
-    token_file = os.path.join(STORAGE_PATH, f"token_{account_name}.json")
-    if os.path.exists(token_file):
-        with open(token_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    return token_manager.load_tokens(STORAGE_PATH, account_name)
+
+
+def get_origin_token_manager():
+    """Gerenciador de tokens (renovação automática) da conta de origem."""
+    return get_token_manager("lojahi", BLING_LOJAHI_CLIENT_ID, BLING_LOJAHI_CLIENT_SECRET, STORAGE_PATH)
 
 
 def get_authorization_url(client_id, redirect_uri, state):
@@ -87,40 +86,100 @@ def get_access_token(client_id, client_secret, code, redirect_uri, state):
     return response.json()
 
 
-def download_image(url, local_path):
-    """Baixa uma imagem de uma URL e salva localmente."""
-    response = requests.get(url, timeout=30)
+def fetch_image(url):
+    """Baixa o conteúdo de uma imagem de uma URL (conferindo a integridade, se habilitado)."""
+    response = guarded_request("GET", url, timeout=30)
     response.raise_for_status()
+    if IMAGE_VALIDATION:
+        validate_image(response.content, response.headers)
+    return response.content
+
+
+def save_image(content, local_path):
+    """Salva o conteúdo de uma imagem localmente."""
     with open(local_path, 'wb') as f:
-        f.write(response.content)
+        f.write(content)
 
 
-def get_product_images(access_token, sku):
-    """Extrai todas as imagens de um produto (pai + variações) pelo SKU."""
-    log_message(f"🔍 [EXTRAÇÃO] Iniciando busca de imagens para SKU: {sku}")
-    
-    headers = {"Authorization": f"Bearer {access_token}"}
-    all_images = []
-    
-    # 1. Buscar produto pelo SKU
+def download_image(url, local_path):
+    """Baixa uma imagem de uma URL e salva localmente."""
+    save_image(fetch_image(url), local_path)
+
+
+def find_product(tokens, sku):
+    """Busca o registro do produto pelo SKU na listagem. Retorna None se não encontrado."""
     log_message(f"📡 [API] GET {BLING_API_BASE_URL}/produtos?codigo={sku}")
-    response = requests.get(f"{BLING_API_BASE_URL}/produtos?codigo={sku}", headers=headers)
+    response = tokens.request("GET", f"{BLING_API_BASE_URL}/produtos?codigo={sku}")
     response.raise_for_status()
     
     products = response.json().get('data', [])
     if not products:
         log_message(f"❌ [BUSCA] Nenhum produto encontrado com SKU: {sku}")
-        return []
+        return None
     
-    product_id = products[0]['id']
-    log_message(f"✅ [BUSCA] Produto encontrado - ID: {product_id}")
-    
-    # 2. Obter ficha completa do produto
+    log_message(f"✅ [BUSCA] Produto encontrado - ID: {products[0]['id']}")
+    return products[0]
+
+
+def find_product_id(tokens, sku):
+    """Busca o ID do produto pelo SKU. Retorna None se não encontrado."""
+    product = find_product(tokens, sku)
+    return product['id'] if product else None
+
+
+def get_parent_product_id(product):
+    """Retorna o ID do produto pai de um registro de variação (ou None)."""
+    parent_id = product.get('idProdutoPai')
+    if not parent_id:
+        variacao = product.get('variacao') or {}
+        parent_id = (variacao.get('produtoPai') or {}).get('id')
+    return parent_id or None
+
+
+def fetch_product(tokens, product_id, throttle=0.0):
+    """Obtém a ficha completa de um produto (GET /produtos/{id})."""
+    if throttle:
+        # Rate limiting
+        time.sleep(throttle)
     log_message(f"📡 [API] GET {BLING_API_BASE_URL}/produtos/{product_id}")
-    response = requests.get(f"{BLING_API_BASE_URL}/produtos/{product_id}", headers=headers)
+    response = tokens.request("GET", f"{BLING_API_BASE_URL}/produtos/{product_id}")
     response.raise_for_status()
+    return response.json().get('data', {})
+
+
+def get_product_images(tokens, sku):
+    """Extrai todas as imagens de um produto (pai + variações) pelo SKU."""
+    log_message(f"🔍 [EXTRAÇÃO] Iniciando busca de imagens para SKU: {sku}")
     
-    product_data = response.json().get('data', {})
+    # 1. Buscar produto pelo SKU
+    product_id = find_product_id(tokens, sku)
+    if product_id is None:
+        return []
+    
+    return get_product_images_by_id(tokens, product_id, sku)
+
+
+def get_product_images_by_id(tokens, product_id, sku, fetch=None, fetch_many=None):
+    """
+    Extrai todas as imagens de um produto (pai + variações) a partir do ID já resolvido.
+    
+    `fetch(product_id, throttle)` permite trocar a busca das fichas (ex.: por uma
+    versão com coalescência de requisições); o padrão é `fetch_product`.
+    `fetch_many(ids)` busca as variações em lote e retorna ID → ficha para as que
+    vieram com mídia; as que faltarem usam `fetch`. O padrão usa a listagem com
+    vários IDs por requisição.
+    Cada imagem retornada traz `produto_id`: o produto (pai ou variação) de onde
+    o link veio, para que um link expirado possa ser renovado só com essa ficha.
+    """
+    if fetch is None:
+        fetch = lambda pid, throttle=0.0: fetch_product(tokens, pid, throttle)
+    if fetch_many is None:
+        fetch_many = lambda ids: fetch_variations_with_media(tokens.request, ids)
+    all_images = []
+    seen_keys = set()
+    
+    # 2. Obter ficha completa do produto
+    product_data = fetch(product_id)
     log_message(f"✅ [FICHA] Ficha completa obtida para produto ID {product_id}")
     
     # 3. Extrair imagens do produto pai
@@ -134,16 +193,14 @@ def get_product_images(access_token, sku):
         internas = imagens.get('internas', [])
         log_message(f"📸 [PAI] Imagens internas encontradas: {len(internas)}")
         for img in internas:
-            if img.get('link'):
-                all_images.append(img)
+            if img.get('link') and add_unique_image(dict(img, produto_id=product_id), all_images, seen_keys):
                 log_message(f"   ✓ Imagem interna adicionada: {img.get('link')[:100]}...")
         
         # Imagens externas
         externas = imagens.get('externas', [])
         log_message(f"📸 [PAI] Imagens externas encontradas: {len(externas)}")
         for img in externas:
-            if img.get('link'):
-                all_images.append(img)
+            if img.get('link') and add_unique_image(dict(img, produto_id=product_id), all_images, seen_keys):
                 log_message(f"   ✓ Imagem externa adicionada: {img.get('link')[:100]}...")
     
     log_message(f"📊 [PAI] Total de imagens do produto pai: {len(all_images)}")
@@ -152,6 +209,11 @@ def get_product_images(access_token, sku):
     variacoes = product_data.get('variacoes', [])
     if variacoes:
         log_message(f"🔄 [VARIAÇÕES] Produto tem {len(variacoes)} variações. Buscando imagens...")
+        try:
+            prefetched = fetch_many([variacao.get('id') for variacao in variacoes])
+        except requests.exceptions.RequestException as e:
+            log_message(f"   ⚠️ Falha na busca das variações em lote ({e}). Usando as fichas individuais...")
+            prefetched = {}
         
         for idx, variacao in enumerate(variacoes, 1):
             variacao_id = variacao.get('id')
@@ -160,13 +222,9 @@ def get_product_images(access_token, sku):
             log_message(f"📡 [VARIAÇÃO {idx}/{len(variacoes)}] ID: {variacao_id} | Nome: {variacao_nome}...")
             
             try:
-                # Rate limiting
-                time.sleep(0.5)
-                
-                response = requests.get(f"{BLING_API_BASE_URL}/produtos/{variacao_id}", headers=headers)
-                response.raise_for_status()
-                
-                variacao_data = response.json().get('data', {})
+                variacao_data = prefetched.get(variacao_id)
+                if variacao_data is None:
+                    variacao_data = fetch(variacao_id, 0.5)
                 variacao_midia = variacao_data.get('midia', {})
                 
                 if isinstance(variacao_midia, dict):
@@ -176,15 +234,15 @@ def get_product_images(access_token, sku):
                     variacao_internas = variacao_imagens.get('internas', [])
                     log_message(f"   📸 Imagens internas: {len(variacao_internas)}")
                     for img in variacao_internas:
-                        if img.get('link') and img not in all_images:
-                            all_images.append(img)
+                        if img.get('link'):
+                            add_unique_image(dict(img, produto_id=variacao_id), all_images, seen_keys)
                     
                     # Imagens externas da variação
                     variacao_externas = variacao_imagens.get('externas', [])
                     log_message(f"   📸 Imagens externas: {len(variacao_externas)}")
                     for img in variacao_externas:
-                        if img.get('link') and img not in all_images:
-                            all_images.append(img)
+                        if img.get('link'):
+                            add_unique_image(dict(img, produto_id=variacao_id), all_images, seen_keys)
                 
                 log_message(f"   ✅ Variação {idx} processada com sucesso")
                 
@@ -197,71 +255,552 @@ def get_product_images(access_token, sku):
     else:
         log_message(f"ℹ️ [INFO] Produto não possui variações")
     
-    # 5. Remover duplicatas (comparando por link)
-    unique_images = []
-    seen_links = set()
-    for img in all_images:
-        link = img.get('link')
-        if link and link not in seen_links:
-            unique_images.append(img)
-            seen_links.add(link)
-    
-    log_message(f"🎯 [RESULTADO] Total de imagens únicas encontradas: {len(unique_images)}")
+    # 5. Duplicatas já foram descartadas na descoberta (por ID do Bling ou link sem assinatura)
+    log_message(f"🎯 [RESULTADO] Total de imagens únicas encontradas: {len(all_images)}")
     log_message(f"📦 [EXTRAÇÃO] Finalizando busca para SKU {sku}")
     
-    return unique_images
+    return all_images
+
+
+def plan_sku_groups(resolved_jobs):
+    """
+    Planejamento do lote: agrupa os SKUs resolvidos pelo produto pai (ou pelo
+    próprio produto), para que pai e variações do mesmo produto sejam extraídos
+    juntos e compartilhem as mesmas fichas.
+    """
+    groups = {}
+    for job in resolved_jobs:
+        group_key = job.get("parent_id") or job["product_id"]
+        groups.setdefault(group_key, []).append(job)
+    return list(groups.values())
+
+
+def link_or_copy(source_path, target_path, budget):
+    """
+    Reaproveita um arquivo já salvo: hard link no mesmo volume, cópia como
+    alternativa (só a cópia ocupa espaço novo, reservado no orçamento `budget`).
+    """
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        size = os.path.getsize(source_path)
+        budget.reserve(size)
+        try:
+            shutil.copyfile(source_path, target_path)
+        except Exception:
+            budget.release(size)
+            raise
 
 
-def download_sku_images(sku, access_token_origin, download_base_path):
-    """Baixa todas as imagens de um SKU para um diretório local."""
-    log_message(f"Iniciando download de imagens para SKU: {sku}")
+def download_deadline(item):
+    """Prioridade na fila de download: links que expiram antes vêm primeiro; links sem validade por último."""
+    if "url" not in item:
+        return 0.0
+    return item["expires_at"] if item["expires_at"] is not None else float("inf")
+
+
+def build_resolve_stage(tokens_origin, coalescer, store):
+    """Etapa de resolução SKU → registro do produto (com coalescência e cache por SKU)."""
+    def resolve_stage(job):
+        sku = job["sku"]
+        log_message(f"🔍 [EXTRAÇÃO] Iniciando busca de imagens para SKU: {sku}")
+        product = coalescer.do(("codigo", sku), lambda: store.cached_call(
+            f"{tokens_origin.account_name}:codigo:{sku}", lambda: find_product(tokens_origin, sku)))
+        job["product_id"] = product['id'] if product else None
+        job["parent_id"] = get_parent_product_id(product) if product else None
+        return [job]
+    
+    return Stage("resolução", resolve_stage, PIPELINE_RESOLVE_WORKERS)
+
+
+def build_download_stages(tokens_origin, download_base_path, coalescer, store, budget, index, progress,
+                          near_duplicates=None):
+    """
+    Monta as etapas do pipeline de download a partir dos grupos planejados:
+    ficha/variações → download de cada imagem → escrita em disco → (com
+    `PHASH_DEDUP`) quase duplicadas.
     
-    # Criar diretório para o SKU
-    sku_path = os.path.join(download_base_path, sku)
-    os.makedirs(sku_path, exist_ok=True)
+    Todo item carrega o SKU e o total de imagens esperado, para que o resultado
+    por SKU possa ser consolidado à medida que as imagens terminam. As imagens
+    já salvas são identificadas pelo manifesto no banco de estado e a existência
+    de arquivos pelo índice em memória (`index`), sem stat em disco por imagem.
+    Cada gravação reserva espaço no orçamento de disco (`budget`) antes de escrever.
     
-    try:
-        # 1. Obter imagens da conta de origem
-        st.info(f"Obtendo imagens do SKU {sku} na conta de origem...")
-        images_data_origin = get_product_images(access_token_origin, sku)
+    Os links do S3 são assinados e expiram: a etapa de download atende primeiro
+    os que expiram antes e, se um link já expirou (ou o S3 responde 403), busca
+    de novo só a ficha do produto dono da imagem para obter um link novo.
+    Conteúdo que não passa na validação de integridade é baixado de novo na
+    hora, em vez de ir para o disco e para o manifesto.
+    
+    As fichas e imagens em andamento e o total de imagens de cada SKU são
+    registrados em `progress` (ProgressTracker) para a situação ao vivo.
+    Download e escrita (que mantêm o conteúdo das imagens em memória) ocupam
+    vagas do controle de recursos: sob pressão de memória ou disco, rodam com
+    menos workers ou pausam.
+    
+    A etapa de quase duplicadas deixa as imagens passarem e, quando a última
+    imagem de um SKU com imagens novas chega, compara a galeria inteira, remove
+    as cópias e anota em `near_duplicates` (SKU → {cópia: mantida}) o que o
+    manifesto deve redirecionar — o hash roda nas threads da etapa, fora do
+    loop de eventos que consolida os resultados.
+    """
+    governor = get_resource_governor()
+    governor.watch_path(download_base_path, budget)
+    
+    def detail_stage(group):
+        fetched_keys = []
         
-        if not images_data_origin:
-            log_message(f"Nenhuma imagem encontrada para SKU {sku} na origem.")
-            st.warning(f"Nenhuma imagem encontrada para SKU {sku}.")
-            return False, 0
+        def coalesced_fetch(product_id, throttle=0.0):
+            key = ("produto", product_id)
+            fetched_keys.append(key)
+            return coalescer.do(key, lambda: store.cached_call(
+                f"{tokens_origin.account_name}:produto:{product_id}",
+                lambda: fetch_product(tokens_origin, product_id, throttle)))
         
-        # 2. Baixar todas as imagens
-        downloaded_count = 0
-        for img_data in images_data_origin:
-            image_url = img_data.get('link')
-            if image_url:
-                file_name = os.path.basename(image_url).split('?')[0]
-                local_image_path = os.path.join(sku_path, file_name)
-                
-                # Verificar se já foi baixada
-                if os.path.exists(local_image_path):
-                    log_message(f"✅ [CACHE] Imagem {file_name} já existe. Pulando download.")
+        def cached_fetch_many(variation_ids):
+            # Variações já em cache não entram na busca em lote; as obtidas com mídia vão para o cache
+            prefetched = {}
+            missing = []
+            for variation_id in variation_ids:
+                cached = store.cache_get(f"{tokens_origin.account_name}:produto:{variation_id}")
+                if cached is not None:
+                    prefetched[variation_id] = cached
                 else:
-                    st.info(f"Baixando imagem {file_name} do SKU {sku}...")
-                    download_image(image_url, local_image_path)
-                    downloaded_count += 1
-                    log_message(f"📥 [DOWNLOAD] Imagem {file_name} baixada para {local_image_path}")
+                    missing.append(variation_id)
+            for variation_id, variation in fetch_variations_with_media(tokens_origin.request, missing).items():
+                store.cache_set(f"{tokens_origin.account_name}:produto:{variation_id}", variation)
+                prefetched[variation_id] = variation
+            return prefetched
+        
+        items = []
+        for job in group:
+            sku = job["sku"]
+            progress.begin(("ficha", sku), f"{sku} (ficha)")
+            try:
+                images = get_product_images_by_id(tokens_origin, job["product_id"], sku, fetch=coalesced_fetch,
+                                                  fetch_many=cached_fetch_many)
+            except Exception as e:
+                items.append({"sku": sku, "total": 0, "error": e, "stage": "ficha"})
+                continue
+            finally:
+                progress.end(("ficha", sku))
+            
+            progress.expect_images(sku, len(images))
+            if not images:
+                log_message(f"Nenhuma imagem encontrada para SKU {sku} na origem.")
+                items.append({"sku": sku, "total": 0})
+                continue
+            
+            sku_path = sku_directory(download_base_path, sku, index)
+            manifest = store.sku_manifest(sku)
+            if not manifest and index.is_dir(sku_path):
+                # Pasta criada antes do banco de estado: registra o conteúdo uma única vez
+                manifest = store.import_sku_directory(sku, sku_path)
+            ensure_sku_directory(sku_path, index)
+            
+            for img_data in images:
+                image_url = img_data.get('link')
+                file_name = os.path.basename(image_url).split('?')[0]
+                stored_name = transformed_file_name(file_name)
+                items.append({
+                    "sku": sku,
+                    "total": len(images),
+                    "url": image_url,
+                    "url_key": normalize_image_link(image_url),
+                    "expires_at": signed_url_expiry(image_url),
+                    "source_product_id": img_data.get("produto_id") or job["product_id"],
+                    "file_name": file_name,
+                    "download_path": os.path.join(sku_path, file_name),
+                    "local_path": os.path.join(sku_path, stored_name),
+                    "cached": stored_name in manifest or file_name in manifest,
+                })
+        
+        # As fichas do grupo não serão mais usadas neste lote
+        coalescer.forget(fetched_keys)
+        return items
+    
+    def refresh_link(item):
+        # Ficha atualizada do produto dono da imagem (renovações simultâneas do mesmo produto compartilham a busca)
+        product_id = item["source_product_id"]
+        key = ("renovação", product_id)
         
-        total_images = len(images_data_origin)
-        st.success(f"✅ SKU {sku}: {total_images} imagens salvas em {sku_path}")
-        log_message(f"Download concluído para SKU {sku}: {total_images} imagens em {sku_path}")
-        return True, total_images
+        def fetch_fresh():
+            log_message(f"🔁 [LINK] Link expirado para {item['file_name']}. Renovando ficha do produto {product_id}...")
+            data = fetch_product(tokens_origin, product_id)
+            store.cache_set(f"{tokens_origin.account_name}:produto:{product_id}", data)
+            return data
         
-    except requests.exceptions.HTTPError as e:
-        error_message = f"Erro HTTP no download do SKU {sku}: {e.response.status_code} - {e.response.text}"
-        st.error(error_message)
+        try:
+            product_data = coalescer.do(key, fetch_fresh)
+        finally:
+            # Os links assinados da ficha também expiram: um link que vencer depois busca a ficha de novo
+            coalescer.forget([key])
+        midia = product_data.get('midia') or {}
+        imagens = midia.get('imagens', {}) if isinstance(midia, dict) else {}
+        for img in imagens.get('internas', []) + imagens.get('externas', []):
+            if img.get('link') and normalize_image_link(img['link']) == item["url_key"]:
+                item["url"] = img['link']
+                item["expires_at"] = signed_url_expiry(img['link'])
+                return True
+        log_message(f"⚠️ [LINK] Imagem {item['file_name']} não está mais na ficha do produto {product_id}")
+        return False
+    
+    def fetch_linked_image(item):
+        try:
+            return fetch_image(item["url"])
+        except requests.exceptions.HTTPError as e:
+            # 403 do S3: assinatura vencida antes do previsto; renova o link uma vez
+            if e.response.status_code != 403 or not refresh_link(item):
+                raise
+            return fetch_image(item["url"])
+    
+    def download_stage(item):
+        if item["total"] == 0:
+            return [item]
+        # Verificar se já foi baixada (manifesto) ou se outro SKU já tem a mesma imagem (índice de URLs)
+        if item["cached"]:
+            log_message(f"✅ [CACHE] Imagem {item['file_name']} já existe. Pulando download.")
+            return [item]
+        progress.begin(item["local_path"], f"{item['sku']}/{item['file_name']}")
+        blob = store.lookup_blob(item["url_key"])
+        if blob and blob["blob_path"] != item["local_path"] and index.exists(blob["blob_path"]):
+            link_or_copy(blob["blob_path"], item["local_path"], budget)
+            index.add(item["local_path"])
+            item.update(stored_path=item["local_path"], size=blob["size"])
+            log_message(f"🔗 [CACHE] Imagem {item['file_name']} reaproveitada de {blob['blob_path']}")
+        else:
+            if is_link_expiring(item["expires_at"]):
+                refresh_link(item)
+            for attempt in range(1, IMAGE_VALIDATION_RETRIES + 2):
+                try:
+                    item["content"] = fetch_linked_image(item)
+                    break
+                except CorruptImageError as e:
+                    # Conteúdo inválido (página de erro, corpo truncado): baixa de novo na hora
+                    if attempt > IMAGE_VALIDATION_RETRIES:
+                        raise
+                    log_message(f"⚠️ [INTEGRIDADE] {item['file_name']}: {e}. Nova tentativa {attempt}/{IMAGE_VALIDATION_RETRIES}...")
+        return [item]
+    
+    def write_stage(item):
+        if item["total"] == 0 or item["cached"] or "stored_path" in item:
+            return [item]
+        content = item.pop("content")
+        budget.reserve(len(content))
+        try:
+            save_image(content, item["download_path"])
+        except Exception:
+            budget.release(len(content))
+            raise
+        item["stored_path"] = item["download_path"]
+        index.add(item["download_path"])
+        log_message(f"📥 [DOWNLOAD] Imagem {item['file_name']} baixada para {item['download_path']}")
+        if is_transform_enabled():
+            try:
+                result = submit_transform(item["download_path"], item["local_path"]).result()
+                item["stored_path"] = result["path"]
+                index.add(result["path"])
+                if result["path"] != item["download_path"]:
+                    index.discard(item["download_path"])
+                log_message(f"🗜️ [TRANSFORMAÇÃO] {item['file_name']}: {result['bytes_before']:,} → {result['bytes_after']:,} bytes")
+            except Exception as e:
+                log_message(f"⚠️ [TRANSFORMAÇÃO] Falha ao transformar {item['file_name']}, mantendo original: {e}")
+        item["size"] = os.path.getsize(item["stored_path"])
+        if item["size"] < len(content):
+            budget.release(len(content) - item["size"])
+        return [item]
+    
+    # Imagens de cada SKU que já passaram pela etapa de quase duplicadas
+    dedup_lock = threading.Lock()
+    dedup_pending = {}
+    
+    def dedup_stage(item):
+        if item["total"] == 0:
+            return [item]
+        with dedup_lock:
+            arrived = dedup_pending.setdefault(item["sku"], [])
+            arrived.append(item)
+            if len(arrived) < item["total"]:
+                return [item]
+            del dedup_pending[item["sku"]]
+        # Só SKUs com todas as imagens gravadas e alguma nova (falhas não chegam a esta etapa)
+        if any(not arrived_item["cached"] for arrived_item in arrived):
+            try:
+                remove_near_duplicates(item["sku"], arrived)
+            except Exception as e:
+                log_message(f"⚠️ [DUPLICATAS] Falha ao comparar as imagens do SKU {item['sku']}: {e}")
+        return [item]
+    
+    def remove_near_duplicates(sku, items):
+        # Quase duplicadas (mesma foto recomprimida/redimensionada): fica só a de maior resolução
+        paths = {img["local_path"] for img in store.sku_manifest(sku).values()}
+        paths.update(arrived_item["stored_path"] for arrived_item in items if not arrived_item["cached"])
+        duplicates = find_duplicates(fingerprint_images(sorted(path for path in paths if index.exists(path))))
+        if not duplicates:
+            return
+        freed = 0
+        for duplicate, kept in duplicates.items():
+            try:
+                size = os.path.getsize(duplicate)
+                os.remove(duplicate)
+            except FileNotFoundError:
+                continue
+            index.discard(duplicate)
+            freed += size
+            log_message(f"🧬 [DUPLICATAS] {os.path.basename(duplicate)} é cópia de {os.path.basename(kept)}. Removida.")
+        budget.release(freed)
+        near_duplicates[sku] = duplicates
+        log_message(f"🧬 [DUPLICATAS] SKU {sku}: {len(duplicates)} imagens quase duplicadas removidas ({freed:,} bytes)")
+    
+    stages = [
+        Stage("ficha", detail_stage, PIPELINE_DETAIL_WORKERS),
+        Stage("download", download_stage, PIPELINE_DOWNLOAD_WORKERS, priority=download_deadline, governor=governor),
+        Stage("escrita", write_stage, PIPELINE_WRITE_WORKERS, governor=governor),
+    ]
+    if near_duplicates is not None and is_phash_enabled():
+        stages.append(Stage("duplicatas", dedup_stage, PIPELINE_DEDUP_WORKERS))
+    return stages
+
+
+def download_sku_images(skus, tokens_origin, download_base_path, on_sku_done=None, priority=None,
+                        job_id=None, lease_owner=None, progress=None):
+    """
+    Baixa todas as imagens dos SKUs para diretórios locais usando o pipeline assíncrono.
+    `tokens_origin` é o TokenManager da conta de origem (renova o token durante o lote).
+    
+    Primeiro todos os SKUs são resolvidos e agrupados por produto pai; depois os
+    grupos passam pelas etapas de ficha, download e escrita.
+    
+    `on_sku_done(sku, status, image_count)` é chamado (na thread do chamador)
+    assim que cada SKU termina, com status "ok", "vazio" ou "erro".
+    As requisições à API passam pelo escalonador de jobs com a `priority`
+    informada ("alta", "normal" ou "baixa"; padrão: automática pelo tamanho do lote).
+    O job e a situação de cada SKU ficam registrados no banco de estado.
+    Com `job_id`, os SKUs pertencem a um job já criado (que não é finalizado
+    aqui); com `lease_owner`, o resultado de cada SKU só é gravado se a reserva
+    ainda for desse worker (jobs distribuídos entre réplicas).
+    `progress` (ProgressTracker) recebe os eventos por imagem e por SKU, para
+    a interface exibir a situação ao vivo sem depender de `on_sku_done`.
+    Levanta StorageFullError se o orçamento de disco já estiver esgotado antes
+    de começar. Retorna um dict SKU → (status, total de imagens).
+    """
+    skus = list(dict.fromkeys(skus))
+    store = get_state_store()
+    budget = get_storage_budget(store, download_base_path)
+    if not budget.has_room():
+        raise StorageFullError(
+            f"Armazenamento cheio ({budget.used_bytes():,} de {budget.quota_bytes:,} bytes) e nenhuma pasta "
+            f"exportada/enviada para despejar. Exporte ou remova SKUs antes de iniciar um novo job.")
+
+    sku_states = {sku: {"done": 0, "downloaded": 0, "failed": 0, "total": None, "error": None, "new_images": []}
+                  for sku in skus}
+    if progress is None:
+        progress = ProgressTracker(len(skus))
+    results = {}
+    # SKU → {cópia quase duplicada: cópia mantida}, preenchido pela etapa de duplicatas
+    near_duplicates = {}
+    coalescer = RequestCoalescer()
+    # Existência de pastas e arquivos: a listagem da raiz responde pelas pastas planas; as demais
+    # pastas são listadas uma vez, quando consultadas, e valem para o job inteiro
+    index = FileIndex()
+    index.preload([download_base_path])
+    own_job = job_id is None
+    if own_job:
+        job_id = store.create_job("download", skus, account=tokens_origin.account_name)
+    scheduler = get_scheduler()
+    ticket = scheduler.register(job_id, tokens_origin.account_name, priority or priority_for_batch(len(skus)))
+    tokens_origin = ScheduledTokens(tokens_origin, scheduler, ticket)
+    
+    def finish_sku(sku):
+        state = sku_states[sku]
+        if state["failed"]:
+            status = "erro"
+        elif not state["total"]:
+            status = "vazio"
+        else:
+            status = "ok"
+            log_message(f"Download concluído para SKU {sku}: {state['total']} imagens ({state['downloaded']} novas)")
+        results[sku] = (status, state["total"] or 0)
+        # Manifesto e situação do SKU gravados em lote, uma vez por SKU
+        store.record_images(sku, state["new_images"])
+        if sku in near_duplicates:
+            store.redirect_duplicates(sku, near_duplicates.pop(sku))
+        if lease_owner is None:
+            store.update_sku_status(job_id, sku, status, image_count=state["total"] or 0, error=state["error"])
+        elif not store.complete_leased_sku(lease_owner, job_id, sku, status, image_count=state["total"] or 0,
+                                           error=state["error"]):
+            log_message(f"⚠️ [WORKER] Reserva do SKU {sku} venceu e foi assumida por outro worker. Resultado descartado.")
+        store.touch_skus([sku])
+        progress.sku_done(sku, status, error=state["error"])
+        if on_sku_done:
+            on_sku_done(sku, status, state["total"] or 0)
+    
+    def on_error(stage_name, item, error):
+        sku = item["sku"]
+        if isinstance(error, requests.exceptions.HTTPError):
+            error_message = f"Erro HTTP na etapa de {stage_name} do SKU {sku}: {error.response.status_code} - {error.response.text}"
+        else:
+            error_message = f"Erro inesperado na etapa de {stage_name} do SKU {sku}: {error}"
         log_message(error_message)
+        
+        state = sku_states[sku]
+        state["error"] = error_message
+        if "url" not in item:
+            # Falha antes de conhecer as imagens: o SKU inteiro falhou
+            state["total"] = 0
+            state["failed"] += 1
+            finish_sku(sku)
+            return
+        state["total"] = item["total"]
+        state["done"] += 1
+        state["failed"] += 1
+        progress.image_done(item["local_path"], failed=True)
+        if state["done"] == state["total"]:
+            finish_sku(sku)
+    
+    def on_output(item):
+        if "error" in item:
+            on_error(item["stage"], item, item["error"])
+            return
+        state = sku_states[item["sku"]]
+        state["total"] = item["total"]
+        if item["total"] == 0:
+            finish_sku(item["sku"])
+            return
+        state["done"] += 1
+        progress.image_done(item["local_path"], size=item.get("size", 0), cached=item["cached"])
+        if not item["cached"]:
+            state["downloaded"] += 1
+            state["new_images"].append({
+                "file_name": os.path.basename(item["stored_path"]),
+                "url_key": item["url_key"],
+                "local_path": item["stored_path"],
+                "size": item["size"],
+            })
+        if state["done"] == state["total"]:
+            finish_sku(item["sku"])
+    
+    # 1. Resolução de todos os SKUs e planejamento por produto pai
+    resolved_jobs = []
+    
+    def on_resolved(job):
+        if job["product_id"] is None:
+            log_message(f"Nenhuma imagem encontrada para SKU {job['sku']} na origem.")
+            finish_sku(job["sku"])
+        else:
+            resolved_jobs.append(job)
+    
+    # As pastas dos SKUs deste job não podem ser despejadas enquanto ele roda
+    budget.protect(skus)
+    try:
+        PipelineEngine([build_resolve_stage(tokens_origin, coalescer, store)],
+                       on_output=on_resolved, on_error=on_error).run_sync([{"sku": sku} for sku in skus])
+        groups = plan_sku_groups(resolved_jobs)
+        log_message(f"🗂️ [PLANEJAMENTO] {len(resolved_jobs)} SKUs resolvidos em {len(groups)} grupo(s) de produto")
+        
+        # 2. Ficha, download e escrita por grupo
+        stages = build_download_stages(tokens_origin, download_base_path, coalescer, store, budget, index, progress,
+                                       near_duplicates)
+        engine = PipelineEngine(stages, on_output=on_output, on_error=on_error)
+        engine.run_sync(groups)
+    finally:
+        budget.unprotect(skus)
+        scheduler.unregister(ticket)
+        store.record_api_calls(tokens_origin.account_name, tokens_origin.request_count)
+    if own_job:
+        store.finish_job(job_id)
+    log_message(f"♻️ [COALESCÊNCIA] {coalescer.hits} requisições reaproveitadas, {coalescer.misses} enviadas")
+    return results
+
+
+def process_leased_chunk(claim, owner):
+    """Processa um lote de SKUs reservado por este worker (job distribuído)."""
+    account = ACCOUNTS.get(claim["account"])
+    tokens_origin = account.token_manager(STORAGE_PATH) if account else get_origin_token_manager()
+    try:
+        download_sku_images(claim["skus"], tokens_origin, claim["storage_path"], priority=claim["priority"],
+                            job_id=claim["job_id"], lease_owner=owner)
     except Exception as e:
-        error_message = f"Erro inesperado no download do SKU {sku}: {e}"
-        st.error(error_message)
-        log_message(error_message)
+        # Falha do lote inteiro (token, disco): marca os SKUs como erro para reprocessar depois
+        store = get_state_store()
+        for sku in claim["skus"]:
+            store.complete_leased_sku(owner, claim["job_id"], sku, "erro", error=str(e))
+        raise
+
+
+def start_lease_worker():
+    """
+    Inicia o worker de reservas desta réplica (um por processo, compartilhado por
+    todas as sessões) quando os workers distribuídos estão ligados. Chamado ao
+    carregar o app, e não ao abrir um job, para que toda réplica processe a fila.
+    """
+    if DISTRIBUTED_WORKERS:
+        return get_lease_worker(get_state_store(), process_leased_chunk)
+    return None
+
+
+def run_distributed_download(skus, tokens_origin, download_base_path, on_sku_done=None, priority=None,
+                             progress=None):
+    """
+    Abre um job de download para os workers de todas as réplicas (reservas de
+    SKUs no banco de estado) e acompanha o progresso até o último SKU.
+    `on_sku_done(sku, status, image_count)` é chamado à medida que os SKUs
+    terminam, em qualquer réplica. Em `progress` (ProgressTracker) a situação
+    é por SKU, e os itens em andamento são os SKUs reservados pelos workers.
+    Retorna um dict SKU → (status, total de imagens).
+    """
+    skus = list(dict.fromkeys(skus))
+    job_id = get_state_store().create_job("download", skus, account=tokens_origin.account_name)
+    return run_distributed_job(job_id, download_base_path, priority or priority_for_batch(len(skus)),
+                               on_sku_done=on_sku_done, progress=progress)
+
+
+def run_distributed_job(job_id, download_base_path, priority, on_sku_done=None, progress=None):
+    """Coloca um job já criado na fila dos workers e acompanha o progresso (ver `run_distributed_download`)."""
+    store = get_state_store()
+    store.enqueue_job(job_id, download_base_path, priority)
+    get_lease_worker(store, process_leased_chunk)
+    results = store.job_results(job_id)
+    log_message(f"📋 [WORKER] Job {job_id} com {len(results)} SKUs aberto para os workers")
     
-    return False, 0
+    if progress is None:
+        progress = ProgressTracker(len(results))
+    reported = set()
+    while True:
+        progress.set_in_flight(f"{sku} ({owner})" for sku, owner in store.leased_skus(job_id))
+        for sku, (status, image_count) in results.items():
+            if status != "pendente" and sku not in reported:
+                reported.add(sku)
+                progress.sku_done(sku, status, image_count=image_count)
+                if on_sku_done:
+                    on_sku_done(sku, status, image_count)
+        if len(reported) == len(results):
+            break
+        time.sleep(PROGRESS_POLL_SECONDS)
+        results = store.job_results(job_id)
+    store.finish_job_if_done(job_id)
+    return results
+
+
+def download_job(job_id, tokens_origin, download_base_path, priority=None, progress=None):
+    """
+    Baixa os SKUs de um job já criado (ex.: importado de um arquivo). Os SKUs
+    são lidos do banco de estado e processados em lotes de SKU_IMPORT_CHUNK_SIZE
+    (um pipeline por lote); com workers distribuídos, o job vai para a fila das
+    réplicas. Retorna um dict SKU → (status, total de imagens).
+    """
+    store = get_state_store()
+    priority = priority or priority_for_batch(store.job_sku_count(job_id))
+    if DISTRIBUTED_WORKERS:
+        return run_distributed_job(job_id, download_base_path, priority, progress=progress)
+    if progress is None:
+        progress = ProgressTracker(store.job_sku_count(job_id))
+    results = {}
+    for skus in store.iter_job_skus(job_id, SKU_IMPORT_CHUNK_SIZE):
+        results.update(download_sku_images(skus, tokens_origin, download_base_path, priority=priority,
+                                           job_id=job_id, progress=progress))
+    store.finish_job(job_id)
+    return results
 
 
 # --- Interface Streamlit ---
@@ -270,6 +809,9 @@ st.title("📥 Bling Picture Downloader")
 st.markdown("Ferramenta para baixar imagens de produtos do Bling e organizar por SKU.")
 st.markdown("---")
 
+# Worker da fila distribuída: sobe com o processo, independente de qual sessão abriu o job
+start_lease_worker()
+
 # --- Lógica de redirecionamento OAuth ---
 query_params = st.query_params
 auth_code = query_params.get("code")
@@ -320,57 +862,221 @@ download_path = st.text_input(
 
 st.info(f"💡 As imagens serão organizadas em: `{download_path}/[SKU]/imagem.jpg`")
 
+storage_budget = get_storage_budget(get_state_store(), download_path)
+st.progress(
+    min(1.0, storage_budget.used_bytes() / storage_budget.quota_bytes),
+    text=f"💾 Armazenamento: {storage_budget.used_bytes() / 1024 / 1024:.1f} MB de "
+         f"{storage_budget.quota_bytes / 1024 / 1024:.0f} MB (livre no volume: {storage_budget.free_bytes() / 1024 / 1024:.0f} MB)"
+)
+
 st.markdown("---")
 
 # --- Download de Imagens ---
 st.header("3️⃣ Download de Imagens")
 
+for breaker in breakers_snapshot():
+    if breaker["estado"] != "fechado":
+        st.warning(f"🔌 Host {breaker['host']} instável (circuito {breaker['estado']}): "
+                   f"o trabalho fica aguardando a recuperação antes de falhar.")
+
 skus_input = st.text_area(
     "SKUs para Download (um por linha)",
     height=150,
     placeholder="CP-ZFD-17\nHUB-USB-C-5-1\nOUTRO-SKU"
 )
+sku_file = st.file_uploader(
+    "...ou envie um arquivo com os SKUs",
+    type=list(SKU_IMPORT_FORMATS),
+    help="CSV (coluna SKU/código ou a primeira), XLSX (primeira planilha) ou TXT (um por linha). "
+         "Os SKUs são normalizados, validados e deduplicados, e vão direto para o job em lotes."
+)
+
+PRIORITY_OPTIONS = {"Automática (pelo tamanho do lote)": None, "Alta": "alta", "Normal": "normal", "Baixa": "baixa"}
+priority_label = st.selectbox(
+    "Prioridade do job",
+    list(PRIORITY_OPTIONS),
+    help="Jobs simultâneos dividem o limite de requisições do Bling conforme a prioridade. "
+         "Na opção automática, lotes pequenos recebem prioridade alta."
+)
+
+if st.button("🧮 Planejar Lote (dry-run)"):
+    plan_skus = [sku.strip() for sku in skus_input.split('\n') if sku.strip()]
+    if not plan_skus:
+        st.error("❌ Digite pelo menos um SKU!")
+    else:
+        plan = plan_batch(get_state_store(), "lojahi", plan_skus)
+        plan_cols = st.columns(4)
+        plan_cols[0].metric("Chamadas à API", plan["total_calls"])
+        plan_cols[1].metric("Imagens a baixar", plan["images_to_download"])
+        plan_cols[2].metric("Download estimado", f"{plan['bytes_to_download'] / 1024 / 1024:.1f} MB")
+        plan_cols[3].metric("Duração estimada", format_duration(plan["estimated_seconds"]))
+        st.caption(
+            f"{plan['resolved_from_cache']}/{plan['skus']} SKUs resolvidos pelo cache · "
+            f"busca {plan['calls']['busca']}, ficha {plan['calls']['ficha']}, variações {plan['calls']['variacoes']} · "
+            f"{plan['api_calls_today']} chamadas usadas hoje, {plan['remaining_quota']} restantes na cota diária"
+        )
+        if plan["exceeds_quota"]:
+            st.error("⚠️ Este lote excede a cota diária restante da API. Divida o lote ou aguarde o próximo dia.")
 
 if st.button("📥 Baixar Imagens", type="primary"):
     if not tokens_lojahi:
         st.error("❌ Você precisa autenticar a conta LOJAHI primeiro!")
-    elif not skus_input.strip():
-        st.error("❌ Digite pelo menos um SKU!")
+    elif not skus_input.strip() and sku_file is None:
+        st.error("❌ Digite pelo menos um SKU ou envie um arquivo!")
     else:
-        access_token_origin = tokens_lojahi.get("access_token")
-        skus = [sku.strip() for sku in skus_input.split('\n') if sku.strip()]
+        tokens_origin = get_origin_token_manager()
+        try:
+            # Garante um token válido (renovado se necessário) antes de iniciar o lote
+            tokens_origin.get_access_token()
+        except TokenRefreshError as e:
+            st.error(f"❌ {e}")
+            st.stop()
         
-        st.info(f"Iniciando download de {len(skus)} SKU(s)...")
+        priority = PRIORITY_OPTIONS[priority_label]
+        if sku_file is not None:
+            # Arquivo: os SKUs vão em streaming direto para um job, sem virar uma lista na sessão
+            store = get_state_store()
+            try:
+                report = import_skus(store, sku_file, sku_file.name, tokens_origin.account_name)
+            except SkuImportError as e:
+                st.error(f"❌ {e}")
+                st.stop()
+            st.info(f"📄 {format_import_report(report)}")
+            if report["invalid_samples"]:
+                with st.expander(f"⚠️ {report['invalid']} valor(es) inválido(s) no arquivo"):
+                    st.dataframe(report["invalid_samples"], use_container_width=True)
+            if not report["imported"]:
+                store.finish_job(report["job_id"])
+                st.error("❌ Nenhum SKU válido no arquivo!")
+                st.stop()
+            total_skus = report["imported"]
+            
+            def run_download(progress):
+                return download_job(report["job_id"], tokens_origin, download_path, priority=priority,
+                                    progress=progress)
+        else:
+            skus = list(dict.fromkeys(sku.strip() for sku in skus_input.split('\n') if sku.strip()))
+            total_skus = len(skus)
+            # Com workers distribuídos, os SKUs são repartidos entre as réplicas
+            download = run_distributed_download if DISTRIBUTED_WORKERS else download_sku_images
+            
+            def run_download(progress):
+                return download(skus, tokens_origin, download_path, priority=priority, progress=progress)
         
-        success_count = 0
-        total_images = 0
+        st.info(f"Iniciando download de {total_skus} SKU(s)...")
         
+        # Situação ao vivo em espaços fixos da página, redesenhados a cada PROGRESS_REFRESH_SECONDS
+        progress = ProgressTracker(total_skus)
         progress_bar = st.progress(0)
-        status_text = st.empty()
+        summary_text = st.empty()
+        rate_text = st.empty()
+        activity_text = st.empty()
         
-        for idx, sku in enumerate(skus, 1):
-            status_text.text(f"Processando {idx}/{len(skus)}: {sku}")
-            success, img_count = download_sku_images(sku, access_token_origin, download_path)
-            
-            if success:
-                success_count += 1
-                total_images += img_count
-            
-            progress_bar.progress(idx / len(skus))
+        def render_progress():
+            snapshot = progress.snapshot()
+            summary, rate, activity = format_progress(snapshot)
+            progress_bar.progress(progress_fraction(snapshot))
+            summary_text.markdown(summary)
+            rate_text.caption(" · ".join(filter(None, [rate, describe_pressure(get_resource_governor().status())])))
+            activity_text.caption(activity)
+            return snapshot
+        
+        # O job roda em segundo plano; esta thread só lê a situação e redesenha
+        job_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            job_future = job_executor.submit(run_download, progress)
+            while wait([job_future], timeout=PROGRESS_REFRESH_SECONDS).not_done:
+                render_progress()
+        finally:
+            job_executor.shutdown(wait=False)
+        try:
+            results = job_future.result()
+        except StorageFullError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        snapshot = render_progress()
+        success_count = sum(1 for status, _ in results.values() if status == "ok")
+        total_images = sum(count for status, count in results.values() if status == "ok")
         
         progress_bar.empty()
-        status_text.empty()
+        activity_text.empty()
         
         st.markdown("---")
         st.success(f"✅ Download concluído!")
-        st.metric("SKUs processados", f"{success_count}/{len(skus)}")
+        st.metric("SKUs processados", f"{success_count}/{total_skus}")
         st.metric("Total de imagens", total_images)
         st.info(f"📁 Imagens salvas em: `{download_path}`")
+        if snapshot["errors"]:
+            with st.expander(f"❌ {len(snapshot['errors'])} SKU(s) com erro"):
+                st.dataframe(snapshot["errors"], use_container_width=True)
         
-        log_message(f"Download finalizado. {success_count}/{len(skus)} SKUs processados, {total_images} imagens baixadas.")
+        log_message(f"Download finalizado. {success_count}/{total_skus} SKUs processados, {total_images} imagens baixadas.")
+
+st.markdown("---")
+
+# --- Exportação ---
+st.header("4️⃣ Exportar Imagens")
+
+export_jobs = get_state_store().recent_jobs()
+export_source = st.radio("Exportar", ["Job", "SKUs"], horizontal=True)
+if export_source == "Job" and export_jobs:
+    export_job = st.selectbox(
+        "Job",
+        export_jobs,
+        format_func=lambda job: f"#{job['id']} - {job['created_at'][:16]} ({job['ok'] or 0} SKUs ok)"
+    )
+    export_skus = get_state_store().job_skus(export_job["id"], status="ok")
+elif export_source == "Job":
+    st.info("Nenhum job registrado ainda.")
+    export_skus = []
+else:
+    export_skus_input = st.text_area("SKUs para exportar (um por linha)", height=100)
+    export_skus = list(dict.fromkeys(sku.strip() for sku in export_skus_input.split('\n') if sku.strip()))
+
+export_format = st.radio("Formato", ["zip", "tar"], horizontal=True)
+
+if export_skus:
+    export_entries = list_export_entries(get_state_store(), export_skus, download_path)
+    export_mb = export_size(export_entries) / 1024 / 1024
+    st.caption(f"{len(export_entries)} imagens de {len(export_skus)} SKU(s), {export_mb:.1f} MB")
+
+    if export_mb > EXPORT_UI_MAX_MB:
+        job_option = f"--job {export_job['id']}" if export_source == "Job" else " ".join(f"--sku {sku}" for sku in export_skus)
+        st.warning(f"⚠️ Exportação maior que {EXPORT_UI_MAX_MB} MB. Use a linha de comando:")
+        st.code(f"python app/cli.py export {job_option} --format {export_format} -o imagens.{export_format}")
+    elif export_entries:
+        def export_archive():
+            # Executado só no clique: gera o arquivo direto das pastas e marca os SKUs como exportados
+            for chunk in iter_export_stream(export_entries, export_format):
+                yield chunk
+            get_state_store().mark_sku_exported(export_skus)
+            log_message(f"📦 [EXPORTAÇÃO] {len(export_entries)} imagens de {len(export_skus)} SKU(s) exportadas em {export_format.upper()}")
+
+        st.download_button(
+            "📦 Baixar arquivo",
+            data=lambda: StreamReader(export_archive()),
+            file_name=f"imagens.{export_format}",
+            mime="application/zip" if export_format == "zip" else "application/x-tar",
+        )
 
 st.markdown("---")
 
+# --- Histórico de Jobs ---
+with st.expander("🗂️ Histórico de Jobs"):
+    active_jobs = get_scheduler().snapshot()
+    if active_jobs:
+        st.markdown("**Jobs em execução**")
+        st.dataframe(active_jobs, use_container_width=True)
+    leases = get_state_store().lease_snapshot()
+    if leases:
+        st.markdown("**SKUs reservados por worker**")
+        st.dataframe(leases, use_container_width=True)
+    recent_jobs = get_state_store().recent_jobs()
+    if recent_jobs:
+        st.dataframe(recent_jobs, use_container_width=True)
+    else:
+        st.info("Nenhum job registrado ainda.")
+
 # --- Visualizar Log ---
 with st.expander("📋 Ver Log de Operações"):
     if os.path.exists(LOG_FILE):
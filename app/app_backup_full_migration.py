@@ -3,42 +3,45 @@ import streamlit as st
 import requests
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta
-import json
-import uuid # Mantido para referência, mas não usado diretamente para state
+from datetime import datetime
 import base64 # Importado para codificação Base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import token_manager
+from accounts import ACCOUNTS, account_for_state, destination_accounts, origin_accounts
+from bling_api import fetch_variations_with_media, resolve_products_by_code
+from circuit_breaker import guarded_request
+from scheduler import ScheduledTokens, get_scheduler, priority_for_batch
+from state_store import get_state_store
+from token_manager import TokenRefreshError, stamp_expiry
+from storage_layout import FileIndex, ensure_sku_directory, sku_directory
+from upload_diff import UPLOAD_SKIP_IDENTICAL, destination_signatures, local_signature, missing_images
+from image_dedup import is_phash_enabled, unique_images
+from image_links import add_unique_image
+from image_integrity import IMAGE_VALIDATION, IMAGE_VALIDATION_RETRIES, CorruptImageError, validate_image
+from image_workers import is_transform_enabled, submit_encoding, submit_transform, transformed_file_name
+from progress import ProgressTracker, format_progress, progress_fraction
+from resource_governor import describe_pressure, get_resource_governor
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-# --- Constantes de State Fixo para OAuth ---
-STATE_LOJAHI_FIXED = "state_lojahi_fixed_v1"
-STATE_SELECT_FIXED = "state_select_fixed_v1"
-
 # --- Configurações Bling e OAuth 2.0 ---
 BLING_AUTH_URL = "https://www.bling.com.br/Api/v3/oauth/authorize"
 BLING_TOKEN_URL = "https://www.bling.com.br/Api/v3/oauth/token"
 BLING_API_BASE_URL = "https://www.bling.com.br/Api/v3"
 
-# Credenciais Bling Origem (LOJAHI)
-BLING_LOJAHI_CLIENT_ID = os.getenv("BLING_LOJAHI_CLIENT_ID")
-BLING_LOJAHI_CLIENT_SECRET = os.getenv("BLING_LOJAHI_CLIENT_SECRET")
-
-# Credenciais Bling Destino (SELECT)
-BLING_SELECT_CLIENT_ID = os.getenv("BLING_SELECT_CLIENT_ID")
-BLING_SELECT_CLIENT_SECRET = os.getenv("BLING_SELECT_CLIENT_SECRET")
+# Contas de origem e destino: registro em accounts.py (BLING_ACCOUNTS + BLING_<NOME>_CLIENT_ID/SECRET)
 
 # Caminho para armazenamento local
 APP_URL_BASE = os.getenv("APP_URL", "http://localhost:8080") # Padrão para desenvolvimento local, Railway usa $PORT=8080
 
-# Redirect URIs
-BLING_LOJAHI_REDIRECT_URI = f"{APP_URL_BASE}/oauth_callback"
-BLING_SELECT_REDIRECT_URI = f"{APP_URL_BASE}/oauth_callback"
+# Redirect URI (o mesmo para todas as contas; a conta é identificada pelo state)
+BLING_REDIRECT_URI = f"{APP_URL_BASE}/oauth_callback"
 
 STORAGE_PATH = os.getenv("STORAGE_PATH", "app/data/storage") # Caminho como /app/data/storage no Railway
 LOG_FILE_PATH = os.path.join(STORAGE_PATH, "migration_log.txt")
-TOKEN_LOJAHI_PATH = os.path.join(STORAGE_PATH, "token_lojahi.json")
-TOKEN_SELECT_PATH = os.path.join(STORAGE_PATH, "token_select.json")
 
 # Garantir que o diretório de armazenamento e log exista
 os.makedirs(STORAGE_PATH, exist_ok=True)
@@ -51,84 +54,67 @@ def log_message(message):
 
 
 def save_tokens(account_name, tokens):
-    '''Salva os tokens OAuth em um arquivo JSON no volume persistente.'''
-    token_path = TOKEN_LOJAHI_PATH if account_name == "lojahi" else TOKEN_SELECT_PATH
-    tokens["expires_at"] = (datetime.now() + timedelta(seconds=tokens["expires_in"])).isoformat()
-    with open(token_path, "w", encoding="utf-8") as f:
-        json.dump(tokens, f, indent=4)
+    '''Salva os tokens OAuth em um arquivo JSON no volume persistente (escrita atômica + cache).'''
+    token_path = token_manager.save_tokens(STORAGE_PATH, account_name, stamp_expiry(tokens))
     log_message(f"Tokens de {account_name} salvos em {token_path}")
 
 
+def account_token_manager(account_name):
+    '''Gerenciador de tokens (renovação automática) da conta informada.'''
+    return ACCOUNTS[account_name].token_manager(STORAGE_PATH)
+
+
 def load_tokens(account_name):
-    '''Carrega os tokens OAuth de um arquivo JSON e verifica a expiração.'''
-    token_path = TOKEN_LOJAHI_PATH if account_name == "lojahi" else TOKEN_SELECT_PATH
-    if not os.path.exists(token_path):
-        return None
-    try:
-        with open(token_path, "r", encoding="utf-8") as f:
-            tokens = json.load(f)
-        if "expires_at" in tokens:
-            expires_at = datetime.fromisoformat(tokens["expires_at"])
-            if expires_at < datetime.now():
-                log_message(f"Tokens de {account_name} expirados. Forçando reautenticação.")
-                st.warning(f"Tokens de {account_name} expirados. Por favor, reautentique.")
-                os.remove(token_path) # Limpa o token expirado
-                st.rerun()
-                return None
+    '''Carrega os tokens OAuth (cache em memória do processo) e renova o token se estiver expirado.'''
+    tokens = token_manager.load_tokens(STORAGE_PATH, account_name)
+    if tokens is None or "expires_at" not in tokens:
         return tokens
-    except json.JSONDecodeError:
-        log_message(f"Erro ao decodificar tokens de {account_name} de {token_path}. Arquivo corrompido ou inválido.")
-        os.remove(token_path) # Limpa o arquivo corrompido
+
+    manager = account_token_manager(account_name)
+    if manager.needs_refresh(tokens):
+        try:
+            return manager.refresh(stale_access_token=tokens.get("access_token"))
+        except TokenRefreshError as e:
+            log_message(f"Falha ao renovar tokens de {account_name}: {e}")
+    if datetime.fromisoformat(tokens["expires_at"]) < datetime.now():
+        log_message(f"Tokens de {account_name} expirados. Forçando reautenticação.")
+        st.warning(f"Tokens de {account_name} expirados. Por favor, reautentique.")
+        token_manager.delete_tokens(STORAGE_PATH, account_name) # Limpa o token expirado
         st.rerun()
         return None
-    except FileNotFoundError:
-        return None
+    return tokens
 
 
 def clear_all_tokens():
     '''Remove todos os arquivos de token para resetar as conexões.'''
-    if os.path.exists(TOKEN_LOJAHI_PATH):
-        os.remove(TOKEN_LOJAHI_PATH)
-        log_message("Token LOJAHI removido.")
-    if os.path.exists(TOKEN_SELECT_PATH):
-        os.remove(TOKEN_SELECT_PATH)
-        log_message("Token SELECT removido.")
+    for account in ACCOUNTS.values():
+        if token_manager.delete_tokens(STORAGE_PATH, account.name):
+            log_message(f"Token {account.label} removido.")
     st.rerun()
 
 
 # --- Funções OAuth 2.0 ---
-def get_authorization_url(client_id, redirect_uri):
-    '''Gera a URL de autorização Bling OAuth 2.0.'''
+def get_authorization_url(account, redirect_uri):
+    '''Gera a URL de autorização Bling OAuth 2.0 de uma conta do registro.'''
     params = {
         "response_type": "code",
-        "client_id": client_id,
-        "redirect_uri": redirect_uri
+        "client_id": account.client_id,
+        "redirect_uri": redirect_uri,
+        # State fixo da conta: identifica a conta no redirecionamento
+        "state": account.oauth_state
     }
-    # Usando state fixo
-    if client_id == BLING_LOJAHI_CLIENT_ID:
-        params["state"] = STATE_LOJAHI_FIXED
-    elif client_id == BLING_SELECT_CLIENT_ID:
-        params["state"] = STATE_SELECT_FIXED
-    else: # Fallback para client_id inesperado
-        params["state"] = "generic_state"
 
     return f"{BLING_AUTH_URL}?" + "&".join([f"{k}={v}" for k, v in params.items()])
 
 
-def get_access_token(client_id, client_secret, code, redirect_uri, received_state):
+def get_access_token(account, code, redirect_uri, received_state):
     '''Troca o código de autorização por um token de acesso Bling.'''
     # Verifica o estado para proteção CSRF
-    expected_state = None
-    if client_id == BLING_LOJAHI_CLIENT_ID:
-        expected_state = STATE_LOJAHI_FIXED
-    elif client_id == BLING_SELECT_CLIENT_ID:
-        expected_state = STATE_SELECT_FIXED
-
-    if expected_state and expected_state != received_state:
+    if account.oauth_state != received_state:
         raise ValueError("OAuth state mismatch! Possible CSRF attack or invalid redirect.")
     
     # Prepara as credenciais para Basic Auth
-    client_auth_string = f"{client_id}:{client_secret}"
+    client_auth_string = f"{account.client_id}:{account.client_secret}"
     encoded_client_auth = base64.b64encode(client_auth_string.encode("utf-8")).decode("utf-8")
 
     headers = {
@@ -150,28 +136,8 @@ def get_access_token(client_id, client_secret, code, redirect_uri, received_stat
     return response.json()
 
 
-def refresh_access_token(client_id, client_secret, refresh_token):
-    '''Usa o refresh token para obter um novo token de acesso Bling.'''
-    # Prepara as credenciais para Basic Auth
-    client_auth_string = f"{client_id}:{client_secret}"
-    encoded_client_auth = base64.b64encode(client_auth_string.encode("utf-8")).decode("utf-8")
-
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Authorization": f"Basic {encoded_client_auth}" # Adiciona o cabeçalho Basic Auth
-    }
-    data = {
-        "grant_type": "refresh_token",
-        "refresh_token": refresh_token
-        # client_id e client_secret removidos do corpo, pois estão no cabeçalho Authorization
-    }
-    response = requests.post(BLING_TOKEN_URL, headers=headers, data=data)
-    response.raise_for_status()
-    return response.json()
-
-
 # --- Funções API Bling (Mantidas as mesmas) ---
-def get_product_images(access_token, sku):
+def get_product_images(tokens, sku):
     """
     Busca TODAS as imagens de um produto (pai + variações) na API do Bling v3.
     
@@ -182,16 +148,15 @@ def get_product_images(access_token, sku):
     - Variações têm suas próprias imagens e precisam de chamadas separadas
     
     Args:
-        access_token: Token OAuth da conta Bling
+        tokens: Gerenciador de tokens da conta de origem (renova o token antes
+            de expirar e, em 401, renova e repete a requisição)
         sku: Código SKU do produto
     
     Returns:
-        Lista de dicts com campo 'link' contendo URLs únicas de imagens
+        Lista de dicts com campo 'link' contendo URLs únicas de imagens (a mesma
+        imagem com assinaturas diferentes no link conta uma vez só)
     """
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json"
-    }
+    headers = {"Accept": "application/json"}
     
     log_message(f"🔍 [EXTRAÇÃO] Iniciando busca de imagens para SKU: {sku}")
     
@@ -200,7 +165,7 @@ def get_product_images(access_token, sku):
     log_message(f"📡 [API] GET {url_search}")
     
     try:
-        resp_search = requests.get(url_search, headers=headers)
+        resp_search = tokens.request("GET", url_search, headers=headers)
         resp_search.raise_for_status()
         search_data = resp_search.json()
         
@@ -220,7 +185,7 @@ def get_product_images(access_token, sku):
     log_message(f"📡 [API] GET {url_detail}")
     
     try:
-        resp_detail = requests.get(url_detail, headers=headers)
+        resp_detail = tokens.request("GET", url_detail, headers=headers)
         resp_detail.raise_for_status()
         product_data = resp_detail.json().get('data', {})
         
@@ -232,6 +197,7 @@ def get_product_images(access_token, sku):
     
     # PASSO 3: Extrair imagens do produto PAI
     found_images = []
+    seen_keys = set()
     
     midia = product_data.get('midia', {})
     log_message(f"🔍 [ANÁLISE] Tipo do campo 'midia': {type(midia).__name__}")
@@ -243,16 +209,14 @@ def get_product_images(access_token, sku):
         internas = imagens_obj.get('internas', [])
         log_message(f"📸 [PAI] Imagens internas encontradas: {len(internas)}")
         for img in internas:
-            if isinstance(img, dict) and 'link' in img:
-                found_images.append(img['link'])
+            if isinstance(img, dict) and img.get('link') and add_unique_image(img, found_images, seen_keys):
                 log_message(f"   ✓ Imagem interna adicionada: {img['link'][:80]}...")
         
         # Imagens externas
         externas = imagens_obj.get('externas', [])
         log_message(f"📸 [PAI] Imagens externas encontradas: {len(externas)}")
         for img in externas:
-            if isinstance(img, dict) and 'link' in img:
-                found_images.append(img['link'])
+            if isinstance(img, dict) and img.get('link') and add_unique_image(img, found_images, seen_keys):
                 log_message(f"   ✓ Imagem externa adicionada: {img['link'][:80]}...")
     else:
         log_message(f"⚠️ [AVISO] Campo 'midia' não é um objeto dict. Tipo: {type(midia)}")
@@ -265,6 +229,13 @@ def get_product_images(access_token, sku):
     
     if total_variacoes > 0:
         log_message(f"🔄 [VARIAÇÕES] Produto tem {total_variacoes} variações. Buscando imagens...")
+        try:
+            prefetched = fetch_variations_with_media(
+                lambda method, url, **kwargs: tokens.request(method, url, headers=headers, **kwargs),
+                [variacao.get('id') for variacao in variacoes])
+        except requests.exceptions.RequestException as e:
+            log_message(f"   ⚠️ Falha na busca das variações em lote ({e}). Usando as fichas individuais...")
+            prefetched = {}
         
         for idx, variacao in enumerate(variacoes, 1):
             variacao_id = variacao.get('id')
@@ -273,11 +244,12 @@ def get_product_images(access_token, sku):
             log_message(f"📡 [VARIAÇÃO {idx}/{total_variacoes}] ID: {variacao_id} | Nome: {variacao_nome[:50]}...")
             
             try:
-                url_variacao = f"{BLING_API_BASE_URL}/produtos/{variacao_id}"
-                resp_var = requests.get(url_variacao, headers=headers)
-                resp_var.raise_for_status()
-                
-                var_data = resp_var.json().get('data', {})
+                var_data = prefetched.get(variacao_id)
+                if var_data is None:
+                    url_variacao = f"{BLING_API_BASE_URL}/produtos/{variacao_id}"
+                    resp_var = tokens.request("GET", url_variacao, headers=headers)
+                    resp_var.raise_for_status()
+                    var_data = resp_var.json().get('data', {})
                 var_midia = var_data.get('midia', {})
                 
                 if isinstance(var_midia, dict):
@@ -287,20 +259,20 @@ def get_product_images(access_token, sku):
                     var_internas = var_imagens.get('internas', [])
                     log_message(f"   📸 Imagens internas: {len(var_internas)}")
                     for img in var_internas:
-                        if isinstance(img, dict) and 'link' in img:
-                            found_images.append(img['link'])
+                        if isinstance(img, dict) and img.get('link'):
+                            add_unique_image(img, found_images, seen_keys)
                     
                     # Imagens externas da variação
                     var_externas = var_imagens.get('externas', [])
                     log_message(f"   📸 Imagens externas: {len(var_externas)}")
                     for img in var_externas:
-                        if isinstance(img, dict) and 'link' in img:
-                            found_images.append(img['link'])
+                        if isinstance(img, dict) and img.get('link'):
+                            add_unique_image(img, found_images, seen_keys)
                 
                 log_message(f"   ✅ Variação {idx} processada com sucesso")
                 
                 # Rate limiting: aguardar 0.5s entre requisições para evitar 429
-                if idx < total_variacoes:
+                if idx < total_variacoes and variacao_id not in prefetched:
                     import time
                     time.sleep(0.5)
                 
@@ -317,9 +289,8 @@ def get_product_images(access_token, sku):
     else:
         log_message(f"ℹ️ [INFO] Produto não possui variações")
     
-    # PASSO 5: Remover duplicatas e retornar
-    unique_urls = sorted(list(set(found_images)))
-    total_unique = len(unique_urls)
+    # PASSO 5: Retornar (duplicatas já descartadas pela identidade: ID do Bling ou link sem assinatura)
+    total_unique = len(found_images)
     
     log_message(f"🎯 [RESULTADO] Total de imagens únicas encontradas: {total_unique}")
     log_message(f"📦 [EXTRAÇÃO] Finalizando busca para SKU {sku}")
@@ -328,78 +299,103 @@ def get_product_images(access_token, sku):
         log_message(f"⚠️ [AVISO] Nenhuma imagem encontrada para SKU {sku}")
         return []
     
-    return [{'link': url} for url in unique_urls]
+    return [{'link': img['link']} for img in found_images]
 
 
 def download_image(url, save_path):
-    '''Baixa uma imagem de uma URL para um caminho local.'''
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    with open(save_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    '''
+    Baixa uma imagem de uma URL para um caminho local. Se o arquivo não passar na
+    validação de integridade, é apagado e baixado de novo na hora.
+    '''
+    for attempt in range(1, IMAGE_VALIDATION_RETRIES + 2):
+        response = guarded_request("GET", url, stream=True)
+        response.raise_for_status()
+        with open(save_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+        if not IMAGE_VALIDATION:
+            return
+        try:
+            with open(save_path, 'rb') as f:
+                validate_image(f.read(), response.headers)
+            return
+        except CorruptImageError as e:
+            os.remove(save_path)
+            if attempt > IMAGE_VALIDATION_RETRIES:
+                raise
+            log_message(f"⚠️ [INTEGRIDADE] {os.path.basename(save_path)}: {e}. Nova tentativa {attempt}/{IMAGE_VALIDATION_RETRIES}...")
 
 
-def upload_all_images_to_bling(access_token, product_id, image_paths):
+def build_upload_payload(image_paths, encoding_futures=None):
     '''
-    Faz upload de TODAS as imagens de uma vez para um produto específico no Bling Destino.
-    Usa PATCH com imagens codificadas em base64.
+    Monta o payload do PATCH com TODAS as imagens codificadas em base64.
     
-    IMPORTANTE: Envia todas as imagens em um único PATCH para evitar sobrescrita.
+    A codificação roda no pool de processos (image_workers). Se `encoding_futures`
+    for informado, reaproveita a codificação já iniciada em `prepare_sku_migration`.
+    O mesmo payload serve para todos os destinos de um SKU.
     '''
-    import base64
-    import time
-    
     total_images = len(image_paths)
-    log_message(f"📦 [UPLOAD LOTE] Preparando upload de {total_images} imagens para produto {product_id}")
+    if encoding_futures is None:
+        encoding_futures = submit_encoding(image_paths)
     
-    # Codificar todas as imagens em base64
+    # Coletar as imagens codificadas em base64
     internas = []
     total_size = 0
     
-    for idx, image_path in enumerate(image_paths, 1):
-        log_message(f"   💾 [{idx}/{total_images}] Codificando {os.path.basename(image_path)}...")
-        
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-            image_b64 = base64.b64encode(image_data).decode('utf-8')
-        
-        file_size = len(image_data)
+    for idx, future in enumerate(encoding_futures, 1):
+        encoded = future.result()
+        file_size = encoded["tamanho"]
         total_size += file_size
         
         internas.append({
-            "arquivo": image_b64,
-            "nome": os.path.basename(image_path)
+            "arquivo": encoded["arquivo"],
+            "nome": encoded["nome"]
         })
         
-        log_message(f"   ✅ [{idx}/{total_images}] {os.path.basename(image_path)} codificada ({file_size:,} bytes)")
+        log_message(f"   ✅ [{idx}/{total_images}] {encoded['nome']} codificada ({file_size:,} bytes)")
     
     log_message(f"📊 [UPLOAD LOTE] Tamanho total: {total_size:,} bytes ({total_size/1024/1024:.2f} MB)")
     log_message(f"📊 [UPLOAD LOTE] Payload JSON: ~{len(str(internas))/1024/1024:.2f} MB")
     
-    # Preparar payload com TODAS as imagens
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
+    return {
         "midia": {
             "imagens": {
                 "internas": internas  # Array com TODAS as imagens
             }
         }
     }
+
+
+def upload_all_images_to_bling(tokens_dest, product_id, image_paths, encoding_futures=None, payload=None):
+    '''
+    Faz upload de TODAS as imagens de uma vez para um produto específico no Bling Destino.
+    Usa PATCH com imagens codificadas em base64.
+    
+    `tokens_dest` é o gerenciador de tokens da conta de destino: renova o token e,
+    com o escalonador, respeita o limite de requisições da própria conta.
+    `payload` permite reaproveitar o payload já montado (vários destinos).
+    
+    IMPORTANTE: Envia todas as imagens em um único PATCH para evitar sobrescrita.
+    '''
+    import time
+    
+    total_images = len(image_paths)
+    account_label = tokens_dest.account_name.upper()
+    log_message(f"📦 [UPLOAD LOTE] Preparando upload de {total_images} imagens para produto {product_id} ({account_label})")
+    
+    if payload is None:
+        payload = build_upload_payload(image_paths, encoding_futures)
     
     url = f"{BLING_API_BASE_URL}/produtos/{product_id}"
-    log_message(f"📡 [UPLOAD LOTE] PATCH {url} com {total_images} imagens")
+    log_message(f"📡 [UPLOAD LOTE] PATCH {url} com {total_images} imagens ({account_label})")
     
     # Fazer requisição com retry
     max_retries = 3
     for attempt in range(1, max_retries + 1):
         try:
-            log_message(f"🔄 [UPLOAD LOTE] Tentativa {attempt}/{max_retries}...")
-            response = requests.patch(url, headers=headers, json=payload, timeout=60)
+            log_message(f"🔄 [UPLOAD LOTE] Tentativa {attempt}/{max_retries} ({account_label})...")
+            response = tokens_dest.request("PATCH", url, headers={"Content-Type": "application/json"},
+                                           json=payload, timeout=60)
             
             if response.status_code == 429:
                 # Rate limit - aguardar e tentar novamente
@@ -409,7 +405,7 @@ def upload_all_images_to_bling(access_token, product_id, image_paths):
                 continue
             
             response.raise_for_status()
-            log_message(f"✅ [UPLOAD LOTE] {total_images} imagens enviadas com sucesso! Response: {response.json()}")
+            log_message(f"✅ [UPLOAD LOTE] {total_images} imagens enviadas com sucesso para {account_label}! Response: {response.json()}")
             return response.json()
             
         except requests.exceptions.HTTPError as e:
@@ -428,62 +424,91 @@ def upload_all_images_to_bling(access_token, product_id, image_paths):
     raise Exception(f"Upload em lote falhou após {max_retries} tentativas")
 
 
-# --- Lógica de Migração (Mantida a mesma) ---
-def migrate_sku_images(sku, access_token_origin, access_token_dest):
-    '''Orquestra o download de imagens de origem e upload para o destino para um SKU.'''
+# --- Lógica de Migração ---
+def prepare_sku_migration(sku, tokens_origin, progress=None):
+    '''
+    Etapa de preparação de um SKU: baixa as imagens de origem uma única vez e
+    inicia a codificação no pool de processos. `tokens_origin` é o gerenciador
+    de tokens da conta de origem. O resultado é enviado a todos os
+    destinos por `upload_prepared_sku`. As imagens em andamento e concluídas
+    são registradas em `progress` (ProgressTracker), se informado.
+    
+    Retorna um dict com os dados para `upload_prepared_sku` ou None em caso de falha.
+    Executa na thread principal (usa chamadas Streamlit).
+    '''
     log_message(f"Iniciando migração para SKU: {sku}")
-    sku_storage_path = os.path.join(STORAGE_PATH, sku)
-    os.makedirs(sku_storage_path, exist_ok=True)
+    # Uma listagem da pasta do SKU responde quais imagens já foram baixadas
+    index = FileIndex()
+    sku_storage_path = sku_directory(STORAGE_PATH, sku, index)
+    ensure_sku_directory(sku_storage_path, index)
 
     try:
         # 1. Obter imagens da conta de origem
-        st.info(f"Obtendo imagens do SKU {sku} na conta de origem...")
-        images_data_origin = get_product_images(access_token_origin, sku)
+        progress = progress or ProgressTracker()
+        progress.begin(sku, f"{sku} (ficha de origem)")
+        try:
+            images_data_origin = get_product_images(tokens_origin, sku)
+        finally:
+            progress.end(sku)
+        progress.expect_images(sku, len(images_data_origin))
 
         if not images_data_origin:
             log_message(f"Nenhuma imagem encontrada para SKU {sku} na origem. Ignorando.")
-            return False
+            return None
 
         downloaded_images = []
+        transform_futures = []
         for img_data in images_data_origin:
             image_url = img_data.get('link')
             if image_url:
                 file_name = os.path.basename(image_url).split('?')[0]
-                local_image_path = os.path.join(sku_storage_path, file_name)
+                local_image_path = os.path.join(sku_storage_path, transformed_file_name(file_name))
                 
                 # Verificar se já foi baixada (evitar duplicação)
-                if os.path.exists(local_image_path):
+                if index.exists(local_image_path):
                     log_message(f"✅ [CACHE] Imagem {file_name} já existe. Pulando download.")
                     downloaded_images.append(local_image_path)
+                    progress.image_done(cached=True)
                 else:
-                    st.info(f"Baixando imagem {file_name} do SKU {sku}...")
-                    download_image(image_url, local_image_path)
-                    downloaded_images.append(local_image_path)
-                    log_message(f"📥 [DOWNLOAD] Imagem {file_name} do SKU {sku} baixada para {local_image_path}")
-
-        # 2. Encontrar o ID do produto na conta de destino pelo SKU
-        st.info(f"Buscando SKU {sku} na conta de destino...")
-        response_product_dest = requests.get(f"{BLING_API_BASE_URL}/produtos?filters=sku['{sku}']", headers={
-            "Authorization": f"Bearer {access_token_dest}"
-        })
-        response_product_dest.raise_for_status()
-        products_data_dest = response_product_dest.json().get('data')
-
-        if not products_data_dest:
-            log_message(f"SKU {sku} não encontrado na conta de destino. Imagens baixadas para {sku_storage_path}, mas não enviadas.")
-            st.error(f"SKU {sku} não encontrado na conta de destino. Imagens baixadas para {sku_storage_path}, mas não enviadas.")
-            return False
-
-        product_id_dest = products_data_dest[0]['id']
-
-        # 3. Fazer upload de TODAS as imagens de uma vez para a conta de destino
-        st.info(f"Fazendo upload de {len(downloaded_images)} imagens para SKU {sku} no Bling Destino (Produto ID: {product_id_dest})...")
-        upload_all_images_to_bling(access_token_dest, product_id_dest, downloaded_images)
-        log_message(f"Todas as {len(downloaded_images)} imagens do SKU {sku} enviadas com sucesso para o destino.")
-
-        st.success(f"Migração do SKU {sku} concluída com sucesso!")
-        log_message(f"Migração do SKU {sku} concluída com sucesso!")
-        return True
+                    downloaded_path = os.path.join(sku_storage_path, file_name)
+                    progress.begin(downloaded_path, f"{sku}/{file_name}")
+                    try:
+                        download_image(image_url, downloaded_path)
+                    except Exception:
+                        progress.image_done(downloaded_path, failed=True)
+                        raise
+                    progress.image_done(downloaded_path, size=os.path.getsize(downloaded_path))
+                    log_message(f"📥 [DOWNLOAD] Imagem {file_name} do SKU {sku} baixada para {downloaded_path}")
+                    if is_transform_enabled():
+                        transform_futures.append((len(downloaded_images), submit_transform(downloaded_path, local_image_path)))
+                    downloaded_images.append(downloaded_path)
+
+        # Aguardar as transformações (redimensionamento/recompressão) antes de codificar
+        for position, future in transform_futures:
+            file_name = os.path.basename(downloaded_images[position])
+            try:
+                result = future.result()
+                downloaded_images[position] = result["path"]
+                log_message(f"🗜️ [TRANSFORMAÇÃO] {file_name}: {result['bytes_before']:,} → {result['bytes_after']:,} bytes")
+            except Exception as e:
+                log_message(f"⚠️ [TRANSFORMAÇÃO] Falha ao transformar {file_name}, mantendo original: {e}")
+
+        # Quase duplicadas (mesma foto recomprimida/redimensionada) não são enviadas
+        if is_phash_enabled():
+            downloaded_images = unique_images(downloaded_images)
+
+        # 2. Iniciar a codificação em paralelo (o payload é montado uma vez para todos os destinos)
+        encoding_futures = submit_encoding(downloaded_images)
+
+        return {
+            "sku": sku,
+            "sku_storage_path": sku_storage_path,
+            "image_paths": downloaded_images,
+            "encoding_futures": encoding_futures,
+            "payload": None,
+            "signatures": None,
+            "payload_lock": threading.Lock()
+        }
 
     except requests.exceptions.HTTPError as e:
         error_message = f"Erro HTTP na migração do SKU {sku}: {e.response.status_code} - {e.response.text} (URL: {e.request.url})"
@@ -493,9 +518,104 @@ def migrate_sku_images(sku, access_token_origin, access_token_dest):
         error_message = f"Erro inesperado na migração do SKU {sku}: {e}"
         st.error(error_message)
         log_message(error_message)
-    finally:
-        pass
-    return False
+    return None
+
+
+def prepared_payload(prepared):
+    '''Payload do PATCH de um SKU preparado, montado pelo primeiro destino que precisar dele.'''
+    with prepared["payload_lock"]:
+        if prepared["payload"] is None:
+            prepared["payload"] = build_upload_payload(prepared["image_paths"], prepared["encoding_futures"])
+        return prepared["payload"]
+
+
+def prepared_signatures(prepared):
+    '''Tamanho e MD5 das imagens locais de um SKU preparado, calculados uma vez para todos os destinos.'''
+    with prepared["payload_lock"]:
+        if prepared["signatures"] is None:
+            prepared["signatures"] = [local_signature(path) for path in prepared["image_paths"]]
+        return prepared["signatures"]
+
+
+def resolve_destination_ids(destination_tokens, skus):
+    '''
+    Pré-etapa do job: resolve todos os SKUs em cada destino com buscas em lote
+    (vários códigos por requisição), antes de qualquer download.
+    Retorna conta → {SKU: ID do produto no destino}.
+    '''
+    store = get_state_store()
+    return {tokens.account_name: {sku: product['id'] for sku, product in resolve_products_by_code(tokens, skus, store).items()}
+            for tokens in destination_tokens}
+
+
+def upload_prepared_sku(prepared, tokens_dest, product_id_dest):
+    '''
+    Etapa de upload de um SKU preparado para UM destino (produto já resolvido
+    na pré-etapa). Não usa chamadas Streamlit, pois roda em thread separada
+    (um upload por destino, em paralelo) enquanto o próximo SKU é preparado.
+    
+    Se o produto de destino já tem todas as imagens (mesmo MD5), o
+    PATCH é pulado. Retorna o número de imagens enviadas (0 = já estava igual).
+    O PATCH (payload base64 em memória) ocupa uma vaga do controle de recursos
+    e espera enquanto a pressão de memória estiver crítica.
+    '''
+    sku = prepared["sku"]
+    image_paths = prepared["image_paths"]
+    account_label = tokens_dest.account_name.upper()
+
+    if UPLOAD_SKIP_IDENTICAL:
+        try:
+            missing = missing_images(prepared_signatures(prepared), destination_signatures(tokens_dest, product_id_dest))
+        except Exception as e:
+            # A comparação é só uma economia: qualquer falha volta ao upload completo
+            log_message(f"⚠️ [COMPARAÇÃO] Não foi possível comparar o SKU {sku} com {account_label} ({e}). Enviando tudo.")
+            missing = image_paths
+        if not missing:
+            log_message(f"⏭️ [COMPARAÇÃO] SKU {sku} já tem as mesmas {len(image_paths)} imagens em {account_label}. Upload ignorado.")
+            return 0
+        # O PATCH substitui as imagens do produto: mesmo faltando só algumas, o conjunto completo é enviado
+        log_message(f"🔍 [COMPARAÇÃO] SKU {sku}: {len(missing)}/{len(image_paths)} imagens faltando em {account_label}.")
+
+    with get_resource_governor().slot("upload"):
+        upload_all_images_to_bling(tokens_dest, product_id_dest, image_paths, payload=prepared_payload(prepared))
+    log_message(f"Todas as {len(image_paths)} imagens do SKU {sku} enviadas com sucesso para {account_label}.")
+    return len(image_paths)
+
+
+def collect_upload_result(sku, upload_futures):
+    '''
+    Aguarda os uploads de um SKU (um por destino) e exibe os erros na
+    interface (thread principal); sucessos e uploads ignorados entram só no log
+    e na situação do job. Retorna True se todos os destinos receberam as imagens.
+    '''
+    all_ok = True
+    for account_label, upload_future in upload_futures.items():
+        try:
+            upload_future.result()
+            continue
+        except requests.exceptions.HTTPError as e:
+            error_message = f"Erro HTTP na migração do SKU {sku} para {account_label}: {e.response.status_code} - {e.response.text} (URL: {e.request.url})"
+        except Exception as e:
+            error_message = f"Erro inesperado na migração do SKU {sku} para {account_label}: {e}"
+        st.error(error_message)
+        log_message(error_message)
+        all_ok = False
+    if all_ok:
+        log_message(f"Migração do SKU {sku} concluída com sucesso!")
+        # A pasta local do SKU já pode ser despejada pelo orçamento de disco
+        get_state_store().mark_sku_uploaded([sku])
+    return all_ok
+
+
+def submit_destination_uploads(upload_executor, prepared, destination_tokens, destination_ids):
+    '''
+    Dispara o upload de um SKU preparado para cada destino onde o SKU existe, em
+    paralelo. Retorna conta → future.
+    '''
+    sku = prepared["sku"]
+    return {tokens.account_name.upper(): upload_executor.submit(upload_prepared_sku, prepared, tokens,
+                                                               destination_ids[tokens.account_name][sku])
+            for tokens in destination_tokens if sku in destination_ids[tokens.account_name]}
 
 
 # --- Interface Streamlit ---
@@ -509,145 +629,218 @@ st.markdown("---")
 query_params = st.query_params
 auth_code = query_params.get("code")
 state_received = query_params.get("state")
-client_id_for_state = None  # To identify which client_id the state belongs to
 
 
 if auth_code:
-    if state_received == STATE_LOJAHI_FIXED:
-        client_id_for_state = BLING_LOJAHI_CLIENT_ID
-        redirect_uri = BLING_LOJAHI_REDIRECT_URI
-        account_name = "lojahi"
-        client_secret = BLING_LOJAHI_CLIENT_SECRET
-    elif state_received == STATE_SELECT_FIXED:
-        client_id_for_state = BLING_SELECT_CLIENT_ID
-        redirect_uri = BLING_SELECT_REDIRECT_URI
-        account_name = "select"
-        client_secret = BLING_SELECT_CLIENT_SECRET
-    
-    if client_id_for_state:
+    # O state fixo de cada conta identifica qual conta está sendo autorizada
+    account = account_for_state(state_received)
+    
+    if account:
         try:
-            tokens = get_access_token(client_id_for_state, client_secret, auth_code, redirect_uri, state_received)
-            save_tokens(account_name, tokens)
-            st.success(f"{account_name.upper()} autenticada com sucesso! Redirecionando...")
+            tokens = get_access_token(account, auth_code, BLING_REDIRECT_URI, state_received)
+            save_tokens(account.name, tokens)
+            st.success(f"{account.label} autenticada com sucesso! Redirecionando...")
             st.query_params.clear() 
             st.rerun()
         except ValueError as e:
-            st.error(f"Erro de autenticação {account_name.upper()}: {e}")
-            log_message(f"Erro de autenticação {account_name.upper()}: {e}")
+            st.error(f"Erro de autenticação {account.label}: {e}")
+            log_message(f"Erro de autenticação {account.label}: {e}")
             st.query_params.clear()
         except requests.exceptions.HTTPError as e: # Captura HTTPError especificamente para log detalhado
             error_details = e.response.text if e.response is not None else "N/A"
-            st.error(f"Erro ao autenticar {account_name.upper()}: {e.response.status_code} - {error_details}")
-            log_message(f"Erro ao autenticar {account_name.upper()}: {e.response.status_code} - {error_details}")
+            st.error(f"Erro ao autenticar {account.label}: {e.response.status_code} - {error_details}")
+            log_message(f"Erro ao autenticar {account.label}: {e.response.status_code} - {error_details}")
             st.query_params.clear()
         except Exception as e:
-            st.error(f"Erro ao autenticar {account_name.upper()}: {e}")
-            log_message(f"Erro ao autenticar {account_name.upper()}: {e}")
+            st.error(f"Erro ao autenticar {account.label}: {e}")
+            log_message(f"Erro ao autenticar {account.label}: {e}")
             st.query_params.clear()
     else:
         st.error("Erro: Estado OAuth recebido não corresponde a nenhuma conta Bling esperada. Possível CSRF ou token inválido.")
         log_message("Erro: Estado OAuth recebido não corresponde a nenhuma conta Bling esperada.")
         st.query_params.clear()
 
-# --- Fluxo de Autenticação Sequencial Principal ---
-current_lojahi_tokens = load_tokens("lojahi")
-current_select_tokens = load_tokens("select")
 
-is_lojahi_connected = current_lojahi_tokens is not None
-is_select_connected = current_select_tokens is not None
-
-tokens_to_use_lojahi = current_lojahi_tokens['access_token'] if is_lojahi_connected else None
-tokens_to_use_select = current_select_tokens['access_token'] if is_select_connected else None
-
-
-if not is_lojahi_connected:
-    # --- FASE 1: Conexão da Origem (LOJAHI) ---
-    st.header("Passo 1: Conectar Conta de Origem (LOJAHI)")
-    st.warning("⚠️ **ATENÇÃO:** Para iniciar a autenticação da conta de origem (LOJAHI) e evitar conflitos, **certifique-se de estar deslogado do Bling** ou logado na conta correta (LOJAHI) no seu navegador.")
-    st.markdown(f"**[🔴 CLIQUE AQUI PARA LIMPAR SESSÃO ANTERIOR](https://www.bling.com.br/login?logout=true)** (Sugestão: Abra em uma **nova aba** com Ctrl/Cmd + clique ou botão direito)")
-    st.info("Após deslogar, ou se já estiver na conta LOJAHI, marque a caixa abaixo para prosseguir com a autorização.")
-
-    logout_confirmed_lojahi = st.checkbox("Confirmo que estou deslogado ou na conta correta (LOJAHI).", key="logout_confirm_checkbox_lojahi")
-
-    if logout_confirmed_lojahi:
-        lojahi_auth_url = get_authorization_url(BLING_LOJAHI_CLIENT_ID, BLING_LOJAHI_REDIRECT_URI)
-        st.markdown(f"**1. Clique aqui para autorizar a LOJAHI:** [Autorizar LOJAHI]({lojahi_auth_url})")
+def render_account_connection(account):
+    '''Instruções e link de autorização de uma conta ainda não conectada.'''
+    role_text = "origem" if account.role == "origem" else "destino"
+    logout_confirmed = st.checkbox(f"Confirmo que estou deslogado ou logado na conta correta ({account.label}, {role_text}).",
+                                   key=f"logout_confirm_checkbox_{account.name}")
+    if logout_confirmed:
+        auth_url = get_authorization_url(account, BLING_REDIRECT_URI)
+        st.markdown(f"**Clique aqui para autorizar a {account.label}:** [Autorizar {account.label}]({auth_url})")
 
         # Para testes locais, o usuário ainda pode precisar colar o código (em caso de falha de redirecionamento)
         if APP_URL_BASE == "http://localhost:8080" and not auth_code:
-            temp_code_input = st.text_input("Cole o código de autorização da LOJAHI (somente para depuração local):", key="temp_lojahi_code_input")
+            temp_code_input = st.text_input(f"Cole o código de autorização da {account.label} (somente para depuração local):",
+                                            key=f"temp_{account.name}_code_input")
             if temp_code_input:
                 st.warning("Por favor, cole o código, ou use a URL de redirecionamento para o seu ambiente Railway. Recarregue após colar.")
-    else:
-        st.info("Marque a caixa acima para prosseguir com a conexão da conta de origem.")
 
-elif is_lojahi_connected and not is_select_connected:
-    # --- FASE 2: Conexão do Destino (SELECT) ---
-    st.header("Passo 2: Conectar Conta de Destino (SELECT)")
-    st.success("✅ Origem (LOJAHI) Conectada com Sucesso!")
-    
-    st.warning("⚠️ **ATENÇÃO:** Para conectar a conta de destino (SELECT) e evitar o erro 'client_id mismatch', **É OBRIGATÓRIO** fazer o logout da conta Bling ativa, **OU** logar na conta SELECT no seu navegador. Recomenda-se usar uma **JANELA ANÔNIMA**.")
-    st.markdown(f"**[🔴 CLIQUE AQUI PARA LIMPAR SESSÃO ANTERIOR](https://www.bling.com.br/login?logout=true)** (Sugestão: Abra em uma **nova aba** com Ctrl/Cmd + clique ou botão direito)")
-    st.info("Após deslogar, ou se já estiver na conta SELECT, retorne a esta página e marque a caixa abaixo para prosseguir com a autorização.")
 
-    logout_confirmed_select = st.checkbox("Confirmo que já fiz logout e estou pronto para logar na conta de Destino (SELECT).", key="logout_confirm_checkbox_select")
-    
-    if logout_confirmed_select:
-        select_auth_url = get_authorization_url(BLING_SELECT_CLIENT_ID, BLING_SELECT_REDIRECT_URI)
-        st.markdown(f"**2. Clique aqui para autorizar a SELECT:** [Autorizar SELECT]({select_auth_url})")
+# --- Fluxo de Autenticação das Contas ---
+connected_tokens = {name: load_tokens(name) for name in ACCOUNTS}
+connected_origins = [account for account in origin_accounts() if connected_tokens[account.name]]
+connected_destinations = [account for account in destination_accounts() if connected_tokens[account.name]]
+pending_accounts = [account for account in ACCOUNTS.values() if not connected_tokens[account.name]]
 
-        # Para testes locais, o usuário ainda pode precisar colar o código (em caso de falha de redirecionamento)
-        if APP_URL_BASE == "http://localhost:8080" and not auth_code:
-            temp_code_input = st.text_input("Cole o código de autorização da SELECT (somente para depuração local):", key="temp_select_code_input")
-            if temp_code_input:
-                st.warning("Por favor, cole o código, ou use a URL de redirecionamento para o seu ambiente Railway. Recarregue após colar.")
-    else:
-        st.info("Marque a caixa acima para prosseguir com a conexão da conta de destino.")
 
+if not connected_origins or not connected_destinations:
+    # --- FASE 1: Conexão das contas (uma por vez) ---
+    st.header("Passo 1: Conectar Contas Bling")
+    for account in ACCOUNTS.values():
+        if connected_tokens[account.name]:
+            st.success(f"✅ {account.label} ({account.role}) Conectada com Sucesso!")
+    st.warning("⚠️ **ATENÇÃO:** Para conectar cada conta e evitar o erro 'client_id mismatch', **É OBRIGATÓRIO** fazer o logout da conta Bling ativa, **OU** logar na conta correta no seu navegador. Recomenda-se usar uma **JANELA ANÔNIMA** a cada conta.")
+    st.markdown(f"**[🔴 CLIQUE AQUI PARA LIMPAR SESSÃO ANTERIOR](https://www.bling.com.br/login?logout=true)** (Sugestão: Abra em uma **nova aba** com Ctrl/Cmd + clique ou botão direito)")
+    st.info("É necessário pelo menos uma conta de origem e uma de destino. Conecte uma conta por vez, marcando a caixa correspondente.")
+    for account in pending_accounts:
+        st.subheader(f"{account.label} ({account.role})")
+        render_account_connection(account)
 
-elif is_lojahi_connected and is_select_connected:
-    # --- FASE 3: Migração ---
-    st.header("Passo 3: Iniciar Migração de Imagens")
-    st.success("✅ Origem (LOJAHI) Conectada com Sucesso!")
-    st.success("✅ Destino (SELECT) Conectado com Sucesso!")
-    st.markdown("Ambas as contas Bling estão autenticadas. Agora você pode migrar as imagens.")
+else:
+    # --- FASE 2: Migração (uma origem → um ou mais destinos) ---
+    st.header("Passo 2: Iniciar Migração de Imagens")
+    for account in connected_origins + connected_destinations:
+        st.success(f"✅ {account.label} ({account.role}) Conectada com Sucesso!")
+    if pending_accounts:
+        with st.expander(f"🔗 Conectar outras contas ({len(pending_accounts)} pendentes)"):
+            st.markdown(f"**[🔴 CLIQUE AQUI PARA LIMPAR SESSÃO ANTERIOR](https://www.bling.com.br/login?logout=true)**")
+            for account in pending_accounts:
+                st.subheader(f"{account.label} ({account.role})")
+                render_account_connection(account)
+
+    origin = st.selectbox("Conta de origem", connected_origins, format_func=lambda account: account.label)
+    destinations = st.multiselect(
+        "Contas de destino",
+        connected_destinations,
+        default=connected_destinations,
+        format_func=lambda account: account.label,
+        help="As imagens de cada SKU são baixadas uma única vez e enviadas a todos os destinos em paralelo, "
+             "cada um com seu próprio token e limite de requisições."
+    )
     
     # --- DEBUG: Botão para exibir tokens (TEMPORÁRIO) ---
     with st.expander("🔧 Debug: Ver Tokens e IDs"):
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Mostrar Token LOJAHI"):
-                st.code(tokens_to_use_lojahi, language="json")
-        with col2:
-            if st.button("Mostrar Token SELECT"):
-                st.code(tokens_to_use_select, language="json")
+        debug_accounts = [origin] + destinations
+        for column, account in zip(st.columns(len(debug_accounts)), debug_accounts):
+            with column:
+                if st.button(f"Mostrar Token {account.label}"):
+                    st.code(connected_tokens[account.name]['access_token'], language="json")
     
     skus_input = st.text_area("Insira os SKUs dos produtos (um por linha, sem espaços extras):", height=200)
     if st.button("Iniciar Migração"):
-        if skus_input:
+        if not destinations:
+            st.warning("Selecione pelo menos uma conta de destino.")
+        elif skus_input:
             skus_to_migrate = [sku.strip() for sku in skus_input.split('\n') if sku.strip()]
             progress_bar = st.progress(0)
             status_text = st.empty()
+            # Situação do job em espaços fixos (sem um elemento novo por imagem ou SKU)
+            summary_text = st.empty()
+            rate_text = st.empty()
             total_skus = len(skus_to_migrate)
+            progress = ProgressTracker(total_skus)
             migrated_count = 0
 
-            with st.spinner("Iniciando migração..."):
-                for i, sku in enumerate(skus_to_migrate):
-                    status_text.text(f"Processando SKU: {sku}... ({i+1}/{total_skus})")
-                    if migrate_sku_images(sku, tokens_to_use_lojahi, tokens_to_use_select):
+            def render_progress():
+                snapshot = progress.snapshot()
+                summary, rate, _ = format_progress(snapshot)
+                progress_bar.progress(progress_fraction(snapshot))
+                summary_text.markdown(summary)
+                rate_text.caption(" · ".join(filter(None, [rate, describe_pressure(get_resource_governor().status())])))
+
+            # Cada destino tem seu próprio token e sua vez no escalonador (limite de requisições por conta)
+            store = get_state_store()
+            job_id = store.create_job("migracao", skus_to_migrate,
+                                      account=f"{origin.name}→{','.join(account.name for account in destinations)}")
+            scheduler = get_scheduler()
+            priority = priority_for_batch(total_skus)
+            destination_tokens = [
+                ScheduledTokens(account_token_manager(account.name), scheduler,
+                                scheduler.register(job_id, account.name, priority))
+                for account in destinations
+            ]
+            # Origem: mesmo gerenciador (renovação em 401 no meio do lote), também pelo escalonador
+            origin_tokens = ScheduledTokens(account_token_manager(origin.name), scheduler,
+                                            scheduler.register(job_id, origin.name, priority))
+
+            def finish_upload(sku, upload_futures):
+                ok = collect_upload_result(sku, upload_futures)
+                store.update_sku_status(job_id, sku, "ok" if ok else "erro")
+                progress.sku_done(sku, "ok" if ok else "erro")
+                render_progress()
+                return ok
+
+            try:
+                # Pré-etapa: SKU → ID em cada destino (buscas em lote), antes de baixar qualquer imagem
+                status_text.text(f"Resolvendo {total_skus} SKU(s) em {len(destinations)} destino(s)...")
+                try:
+                    destination_ids = resolve_destination_ids(destination_tokens, skus_to_migrate)
+                except (requests.exceptions.RequestException, TokenRefreshError) as e:
+                    st.error(f"Migração interrompida: falha ao buscar os SKUs nos destinos: {e}")
+                    log_message(f"Migração interrompida na busca em lote dos destinos: {e}")
+                    skus_to_migrate = []
+                    destination_ids = {}
+                for tokens in destination_tokens:
+                    missing = [sku for sku in skus_to_migrate if sku not in destination_ids[tokens.account_name]]
+                    if missing:
+                        st.warning(f"{len(missing)} SKU(s) não encontrados na conta de destino {tokens.account_name.upper()}: "
+                                   f"{', '.join(missing[:50])}{' ...' if len(missing) > 50 else ''}")
+                        log_message(f"SKUs não encontrados em {tokens.account_name.upper()}: {', '.join(missing)}")
+                skus_without_destination = [sku for sku in skus_to_migrate
+                                            if not any(sku in ids for ids in destination_ids.values())]
+                for sku in skus_without_destination:
+                    store.update_sku_status(job_id, sku, "erro", error="SKU não encontrado em nenhuma conta de destino")
+                    progress.sku_done(sku, "erro", error="SKU não encontrado em nenhuma conta de destino")
+                skus_to_migrate = [sku for sku in skus_to_migrate if sku not in skus_without_destination]
+                
+                with st.spinner("Iniciando migração..."), ThreadPoolExecutor(max_workers=len(destination_tokens)) as upload_executor:
+                    # Pipeline: o SKU N+1 é baixado/codificado enquanto o SKU N faz upload para todos os destinos
+                    pending_upload = None
+                    for i, sku in enumerate(skus_to_migrate):
+                        status_text.text(f"Processando SKU: {sku}... ({i+1}/{len(skus_to_migrate)})")
+                        try:
+                            # Tokens renovados automaticamente antes de expirar (lotes longos)
+                            origin_tokens.get_access_token()
+                            for tokens in destination_tokens:
+                                tokens.get_access_token()
+                        except TokenRefreshError as e:
+                            st.error(f"Migração interrompida: {e}")
+                            log_message(f"Migração interrompida no SKU {sku}: {e}")
+                            break
+                        # Sob pressão crítica, o próximo SKU só é preparado quando os uploads em andamento terminam
+                        with get_resource_governor().slot("preparo"):
+                            prepared = prepare_sku_migration(sku, origin_tokens, progress)
+                        if pending_upload and finish_upload(*pending_upload):
+                            migrated_count += 1
+                        pending_upload = None
+                        if prepared:
+                            pending_upload = (sku, submit_destination_uploads(upload_executor, prepared, destination_tokens,
+                                                                              destination_ids))
+                        else:
+                            store.update_sku_status(job_id, sku, "erro", error="Falha na origem ou nenhuma imagem encontrada")
+                            progress.sku_done(sku, "erro", error="Falha na origem ou nenhuma imagem encontrada")
+                        render_progress()
+                    if pending_upload and finish_upload(*pending_upload):
                         migrated_count += 1
-                    progress_bar.progress((i + 1) / total_skus)
+            finally:
+                for tokens in [origin_tokens] + destination_tokens:
+                    scheduler.unregister(tokens.ticket)
+                    store.record_api_calls(tokens.account_name, tokens.request_count)
+                store.finish_job(job_id)
                 
-                if migrated_count == total_skus:
-                    st.success(f"🎉 Migração concluída! Todos os {migrated_count} SKUs foram migrados com sucesso.")
-                else:
-                    st.warning(f"Migração concluída com {migrated_count} de {total_skus} SKUs migrados. Verifique o log para detalhes de SKUs pendentes ou com erros.")
-                log_message(f"Migração finalizada. {migrated_count}/{total_skus} SKUs migrados com sucesso.")
+            if migrated_count == total_skus:
+                st.success(f"🎉 Migração concluída! Todos os {migrated_count} SKUs foram migrados com sucesso para {len(destinations)} destino(s).")
+            else:
+                st.warning(f"Migração concluída com {migrated_count} de {total_skus} SKUs migrados. Verifique o log para detalhes de SKUs pendentes ou com erros.")
+            log_message(f"Migração finalizada. {migrated_count}/{total_skus} SKUs migrados com sucesso "
+                        f"({origin.label} → {', '.join(account.label for account in destinations)}).")
         else:
             st.warning("Por favor, insira pelo menos um SKU para iniciar a migração.")
 
     st.markdown("---")
-    if st.button("Resetar Conexões (Apagar Tokens)", help="Isso removerá os tokens de acesso e forçará uma nova autenticação para ambas as contas Bling."):
+    if st.button("Resetar Conexões (Apagar Tokens)", help="Isso removerá os tokens de acesso e forçará uma nova autenticação para todas as contas Bling."):
         clear_all_tokens()
         st.success("Conexões resetadas! Reiniciando...")
         st.rerun()
@@ -0,0 +1,138 @@
+"""
+Consultas em lote à API do Bling v3.
+
+Em vez de uma requisição por SKU (`/produtos?codigo=...`), a listagem aceita
+vários códigos por requisição (`codigos[]`), paginada em até
+`BLING_LOOKUP_BATCH_SIZE` registros. Os registros encontrados vão para o cache
+da API no banco de estado com a mesma chave usada pela busca individual.
+
+As variações seguem a mesma ideia: a listagem também filtra por vários IDs
+(`idsProdutos[]`), e as fichas individuais (`/produtos/{id}`) ficam só para as
+variações cuja entrada na listagem não traz mídia.
+"""
+import os
+import threading
+
+from config import BLING_API_BASE_URL, log_message
+
+# Códigos por requisição (e tamanho da página) nas buscas em lote; o Bling aceita até 100
+BLING_LOOKUP_BATCH_SIZE = int(os.getenv("BLING_LOOKUP_BATCH_SIZE", "100"))
+# Busca das variações em lote pela listagem (desative para voltar a uma ficha por variação)
+BLING_BULK_VARIATIONS = os.getenv("BLING_BULK_VARIATIONS", "true").lower() == "true"
+
+# Se a listagem traz o campo `midia`: None até a primeira resposta, depois True/False
+_listing_has_media = None
+_listing_lock = threading.Lock()
+
+
+def fetch_products_by_codes(tokens, codes, batch_size=BLING_LOOKUP_BATCH_SIZE):
+    '''Busca vários produtos pelo código (SKU) por requisição. Retorna código → registro da listagem.'''
+    found = {}
+    for start in range(0, len(codes), batch_size):
+        batch = codes[start:start + batch_size]
+        wanted = set(batch)
+        page = 1
+        while True:
+            log_message(f"📡 [API] GET {BLING_API_BASE_URL}/produtos?codigos[]=... "
+                        f"({len(batch)} SKUs, página {page}, conta {tokens.account_name})")
+            params = [("pagina", page), ("limite", batch_size)] + [("codigos[]", code) for code in batch]
+            response = tokens.request("GET", f"{BLING_API_BASE_URL}/produtos", params=params)
+            response.raise_for_status()
+            products = response.json().get('data', [])
+            for product in products:
+                code = product.get('codigo')
+                if code in wanted and code not in found:
+                    found[code] = product
+            if len(products) < batch_size:
+                break
+            page += 1
+    return found
+
+
+def resolve_products_by_code(tokens, skus, store):
+    '''
+    Resolve os SKUs na conta de `tokens` usando o cache da API e, para os demais,
+    buscas em lote. Retorna SKU → registro da listagem (SKUs não encontrados ficam de fora).
+    '''
+    skus = list(dict.fromkeys(skus))
+    resolved = {}
+    pending = []
+    for sku in skus:
+        cached = store.cache_get(f"{tokens.account_name}:codigo:{sku}")
+        if cached is not None:
+            resolved[sku] = cached
+        else:
+            pending.append(sku)
+
+    if pending:
+        found = fetch_products_by_codes(tokens, pending)
+        for sku, product in found.items():
+            store.cache_set(f"{tokens.account_name}:codigo:{sku}", product)
+        resolved.update(found)
+    log_message(f"🗂️ [BUSCA EM LOTE] {len(resolved)}/{len(skus)} SKUs encontrados na conta "
+                f"{tokens.account_name} ({len(skus) - len(pending)} pelo cache)")
+    return resolved
+
+
+def fetch_products_by_ids(request, product_ids, batch_size=BLING_LOOKUP_BATCH_SIZE):
+    '''
+    Busca vários produtos pelo ID por requisição (`idsProdutos[]`). `request` tem
+    a assinatura de `TokenManager.request`. Retorna ID → registro da listagem.
+    '''
+    found = {}
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        # ID como informado pelo chamador (a listagem pode devolver int ou str)
+        wanted = {str(pid): pid for pid in batch}
+        page = 1
+        while True:
+            log_message(f"📡 [API] GET {BLING_API_BASE_URL}/produtos?idsProdutos[]=... "
+                        f"({len(batch)} IDs, página {page})")
+            params = [("pagina", page), ("limite", batch_size)] + [("idsProdutos[]", pid) for pid in batch]
+            response = request("GET", f"{BLING_API_BASE_URL}/produtos", params=params)
+            response.raise_for_status()
+            products = response.json().get('data', [])
+            for product in products:
+                pid = wanted.get(str(product.get('id')))
+                if pid is not None:
+                    found.setdefault(pid, product)
+            if len(products) < batch_size:
+                break
+            page += 1
+    return found
+
+
+def has_media(product):
+    '''Se o registro traz o campo `midia` com imagens (mesmo que vazias).'''
+    midia = product.get('midia')
+    return isinstance(midia, dict) and isinstance(midia.get('imagens'), dict)
+
+
+def bulk_variations_available():
+    '''Se as variações estão sendo buscadas em lote (configuração e resposta da listagem).'''
+    return BLING_BULK_VARIATIONS and _listing_has_media is not False
+
+
+def fetch_variations_with_media(request, variation_ids):
+    '''
+    Busca as variações em lote pela listagem e retorna ID → registro só para as
+    que já trazem mídia; as demais ficam para a ficha individual.
+
+    Se a listagem responder sem mídia, a busca em lote é desligada para o resto
+    do processo, para não gastar uma requisição extra por produto.
+    '''
+    global _listing_has_media
+    variation_ids = list(dict.fromkeys(pid for pid in variation_ids if pid))
+    if not bulk_variations_available() or len(variation_ids) < 2:
+        return {}
+
+    found = fetch_products_by_ids(request, variation_ids)
+    with_media = {pid: product for pid, product in found.items() if has_media(product)}
+    if found and _listing_has_media is None:
+        with _listing_lock:
+            _listing_has_media = bool(with_media)
+        if not with_media:
+            log_message("ℹ️ [VARIAÇÕES] A listagem não traz a mídia das variações; "
+                        "usando as fichas individuais")
+    log_message(f"🗂️ [VARIAÇÕES EM LOTE] {len(with_media)}/{len(variation_ids)} variações obtidas pela listagem")
+    return with_media
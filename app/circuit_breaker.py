@@ -0,0 +1,160 @@
+"""
+Circuit breaker por host (API do Bling, CDN/S3 das imagens).
+
+Enquanto o host responde bem, as chamadas passam direto ("fechado") e o
+resultado entra numa janela deslizante. Se a taxa de erro da janela passar do
+limite, o circuito abre: as chamadas seguintes ficam estacionadas aguardando,
+e uma única chamada de teste é liberada a cada intervalo (que dobra a cada
+falha). Quando o teste funciona o circuito fecha e o trabalho estacionado
+continua.
+
+Se a indisponibilidade durar mais que `CIRCUIT_MAX_OUTAGE`, as chamadas
+deixam de esperar e falham na hora com `CircuitOpenError` — o lote termina em
+minutos com os SKUs marcados como erro (para reprocessar), em vez de cada SKU
+esgotar timeout e tentativas.
+
+Contam como falha: erro de conexão, timeout e respostas 5xx.
+"""
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+
+from config import log_message
+
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+# Intervalo inicial (segundos) até a primeira chamada de teste; dobra a cada teste com falha
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "120"))
+# Tempo máximo (segundos) que o trabalho fica estacionado antes de falhar rápido
+CIRCUIT_MAX_OUTAGE = float(os.getenv("CIRCUIT_MAX_OUTAGE", "300"))
+
+CLOSED = "fechado"
+OPEN = "aberto"
+HALF_OPEN = "meio-aberto"
+
+NETWORK_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    '''
+    O host está indisponível (circuito aberto além do tempo máximo de espera).
+    É um erro de conexão do `requests`, então os tratamentos existentes se aplicam.
+    '''
+
+
+class CircuitBreaker:
+    '''Circuit breaker de um host, compartilhado por todas as threads.'''
+
+    def __init__(self, host, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS, error_rate=CIRCUIT_ERROR_RATE,
+                 open_seconds=CIRCUIT_OPEN_SECONDS, max_open_seconds=CIRCUIT_MAX_OPEN_SECONDS,
+                 max_outage=CIRCUIT_MAX_OUTAGE):
+        self.host = host
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.max_outage = max_outage
+        self.state = CLOSED
+        self._cond = threading.Condition()
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._retry_at = 0.0
+        self._cooldown = open_seconds
+        self._probing = False
+
+    def _admit(self):
+        '''Libera a chamada; com o circuito aberto, aguarda ou vira a chamada de teste. Retorna True se for teste.'''
+        with self._cond:
+            while self.state != CLOSED:
+                now = time.monotonic()
+                if not self._probing and now >= self._retry_at:
+                    self._probing = True
+                    self.state = HALF_OPEN
+                    return True
+                deadline = self._opened_at + self.max_outage
+                if now >= deadline:
+                    raise CircuitOpenError(
+                        f"Host {self.host} indisponível há {now - self._opened_at:.0f}s (circuito aberto)")
+                wait_until = deadline if self._probing else min(self._retry_at, deadline)
+                self._cond.wait(wait_until - now)
+            return False
+
+    def _record(self, failed, probe):
+        with self._cond:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+                if failed is None:
+                    self.state = OPEN
+                elif failed:
+                    self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+                    self._retry_at = now + self._cooldown
+                    self.state = OPEN
+                    log_message(f"🔌 [CIRCUITO] {self.host}: teste falhou, nova tentativa em {self._cooldown:.0f}s")
+                else:
+                    log_message(f"🔌 [CIRCUITO] {self.host}: recuperado após {now - self._opened_at:.0f}s, circuito fechado")
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._cooldown = self.open_seconds
+                self._cond.notify_all()
+            elif self.state == CLOSED and failed is not None:
+                # Resultados de chamadas iniciadas antes da abertura são ignorados
+                self._outcomes.append(failed)
+                failures = sum(self._outcomes)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                    self.state = OPEN
+                    self._opened_at = now
+                    self._retry_at = now + self._cooldown
+                    log_message(f"🔌 [CIRCUITO] {self.host}: {failures}/{len(self._outcomes)} falhas recentes, "
+                                f"circuito aberto (teste em {self._cooldown:.0f}s)")
+
+    def call(self, fn):
+        '''Executa `fn()` (que retorna uma resposta `requests`) sob o circuit breaker.'''
+        probe = self._admit()
+        try:
+            response = fn()
+        except NETWORK_ERRORS:
+            self._record(True, probe)
+            raise
+        except BaseException:
+            self._record(None, probe)
+            raise
+        self._record(response.status_code >= 500, probe)
+        return response
+
+    def snapshot(self):
+        '''Situação do circuito, para exibição.'''
+        with self._cond:
+            return {"host": self.host, "estado": self.state,
+                    "falhas_recentes": sum(self._outcomes), "chamadas_recentes": len(self._outcomes)}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    '''Circuit breaker do host da URL (um por host no processo).'''
+    host = urlsplit(url).netloc.lower()
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def guarded_request(method, url, **kwargs):
+    '''`requests.request` protegido pelo circuit breaker do host.'''
+    return get_breaker(url).call(lambda: requests.request(method, url, **kwargs))
+
+
+def breakers_snapshot():
+    '''Situação de todos os circuitos conhecidos.'''
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
@@ -0,0 +1,167 @@
+"""
+Linha de comando do Bling Picture Migrator.
+
+Uso:
+    python app/cli.py export --job 12 --format zip > job12.zip
+    python app/cli.py export --sku CP-ZFD-17 --sku HUB-USB-C-5-1 --format tar -o imagens.tar
+    python app/cli.py plan --sku CP-ZFD-17 --sku HUB-USB-C-5-1 --upload
+    python app/cli.py import catalogo.xlsx --column codigo
+    cat skus.txt | python app/cli.py import - --format txt --dry-run
+"""
+import argparse
+import contextlib
+import sys
+
+from config import STORAGE_PATH, log_message
+from export import iter_export_stream, list_export_entries
+from leases import DISTRIBUTED_WORKERS
+from planner import format_duration, plan_batch
+from scheduler import priority_for_batch
+from sku_import import SKU_IMPORT_FORMATS, SkuImportError, format_import_report, import_skus
+from state_store import get_state_store
+
+
+def selected_skus(store, args):
+    '''SKUs informados por --sku e/ou --job, sem repetição e na ordem.'''
+    skus = list(args.sku or [])
+    if args.job:
+        skus.extend(store.job_skus(args.job))
+    return list(dict.fromkeys(skus))
+
+
+def command_export(args):
+    '''Exporta SKUs (ou todos os SKUs de um job) em streaming para um arquivo ou stdout.'''
+    store = get_state_store()
+    skus = selected_skus(store, args)
+    if not skus:
+        print("Nenhum SKU informado (use --sku ou --job).", file=sys.stderr)
+        return 1
+
+    entries = list_export_entries(store, skus, args.path)
+    output = args.stdout if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in iter_export_stream(entries, args.format):
+            output.write(chunk)
+        output.flush()
+    finally:
+        if output is not args.stdout:
+            output.close()
+
+    store.mark_sku_exported(skus)
+    log_message(f"📦 [EXPORTAÇÃO] {len(entries)} imagens de {len(skus)} SKU(s) exportadas em {args.format.upper()}")
+    print(f"{len(entries)} imagens de {len(skus)} SKU(s) exportadas.", file=sys.stderr)
+    return 0
+
+
+def command_plan(args):
+    '''Mostra a estimativa (dry-run) de um lote. Sai com código 2 se exceder a cota diária.'''
+    store = get_state_store()
+    skus = selected_skus(store, args)
+    if not skus:
+        print("Nenhum SKU informado (use --sku ou --job).", file=sys.stderr)
+        return 1
+
+    plan = plan_batch(store, args.account, skus, include_upload=args.upload)
+    calls = plan["calls"]
+    print(f"SKUs: {plan['skus']} ({plan['resolved_from_cache']} resolvidos pelo cache)")
+    print(f"Chamadas à API: {plan['total_calls']} (busca {calls['busca']}, ficha {calls['ficha']}, "
+          f"variações {calls['variacoes']}, busca no destino {calls['busca_destino']}, "
+          f"fichas no destino {calls['ficha_destino']}, PATCH {calls['patch']})")
+    print(f"Imagens: {plan['images_total']} ({plan['images_to_download']} a baixar, "
+          f"~{plan['bytes_to_download'] / 1024 / 1024:.1f} MB)")
+    print(f"Duração estimada: {format_duration(plan['estimated_seconds'])}")
+    print(f"Cota diária: {plan['api_calls_today']} chamadas usadas hoje, {plan['remaining_quota']} restantes")
+    if plan["exceeds_quota"]:
+        print("⚠️ O lote excede a cota diária restante da API. Divida o lote ou aguarde o próximo dia.")
+        return 2
+    return 0
+
+
+def command_import(args):
+    '''
+    Importa SKUs de um arquivo CSV/XLSX/TXT (ou stdin) em streaming para um job de
+    download e o coloca na fila dos workers. Sai com código 1 se nenhum SKU for válido.
+    '''
+    store = get_state_store()
+    stream = args.stdin
+    if args.file == "-":
+        file_name = f"stdin.{args.format or 'txt'}"
+    else:
+        file_name = f"{args.file}.{args.format}" if args.format else args.file
+    try:
+        if args.file != "-":
+            stream = open(args.file, "rb")
+        report = import_skus(store, stream, file_name, args.account, column=args.column,
+                             known_only=args.known_only, dry_run=args.dry_run)
+    except (SkuImportError, OSError) as e:
+        print(f"Erro na importação: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if stream is not args.stdin:
+            stream.close()
+
+    print(format_import_report(report))
+    for sample in report["invalid_samples"]:
+        print(f"  linha {sample['linha']}: {sample['valor']!r} ({sample['motivo']})")
+    if not report["imported"]:
+        if report["job_id"]:
+            store.finish_job(report["job_id"])
+        print("Nenhum SKU válido no arquivo.", file=sys.stderr)
+        return 1
+    if args.dry_run:
+        return 0
+
+    job_id = report["job_id"]
+    store.enqueue_job(job_id, args.path, args.priority or priority_for_batch(report["imported"]))
+    print(f"Job {job_id} na fila com {report['imported']} SKUs (use --job {job_id} em plan/export).")
+    if not DISTRIBUTED_WORKERS:
+        print("⚠️ DISTRIBUTED_WORKERS=false: o job só é processado por réplicas com os workers ligados.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Bling Picture Migrator - linha de comando")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exporta pastas de SKU como ZIP ou TAR (streaming)")
+    export_parser.add_argument("--sku", action="append", help="SKU a exportar (pode repetir)")
+    export_parser.add_argument("--job", type=int, help="Exporta todos os SKUs de um job")
+    export_parser.add_argument("--format", choices=["zip", "tar"], default="zip")
+    export_parser.add_argument("--path", default=STORAGE_PATH, help="Diretório base das pastas de SKU")
+    export_parser.add_argument("-o", "--output", default="-", help="Arquivo de saída (padrão: stdout)")
+    export_parser.set_defaults(handler=command_export)
+
+    plan_parser = subparsers.add_parser("plan", help="Estima chamadas à API, bytes e duração de um lote (dry-run)")
+    plan_parser.add_argument("--sku", action="append", help="SKU do lote (pode repetir)")
+    plan_parser.add_argument("--job", type=int, help="Usa os SKUs de um job anterior")
+    plan_parser.add_argument("--account", default="lojahi", help="Conta de origem (padrão: lojahi)")
+    plan_parser.add_argument("--upload", action="store_true", help="Inclui busca no destino e PATCH (migração completa)")
+    plan_parser.set_defaults(handler=command_plan)
+
+    import_parser = subparsers.add_parser("import", help="Importa SKUs de CSV/XLSX/TXT para um job de download (streaming)")
+    import_parser.add_argument("file", help="Arquivo de SKUs (- para stdin)")
+    import_parser.add_argument("--format", choices=SKU_IMPORT_FORMATS,
+                               help="Formato do arquivo (padrão: pela extensão; txt para stdin)")
+    import_parser.add_argument("--column", help="Coluna de SKU no CSV/XLSX (nome do cabeçalho ou número a partir de 1)")
+    import_parser.add_argument("--account", default="lojahi", help="Conta de origem (padrão: lojahi)")
+    import_parser.add_argument("--path", default=STORAGE_PATH, help="Diretório base das pastas de SKU")
+    import_parser.add_argument("--priority", choices=["alta", "normal", "baixa"],
+                               help="Prioridade do job (padrão: pelo tamanho do lote)")
+    import_parser.add_argument("--known-only", action="store_true",
+                               help="Só importa SKUs já conhecidos localmente (pasta no volume ou encontrados na conta)")
+    import_parser.add_argument("--dry-run", action="store_true", help="Só valida o arquivo, sem criar o job")
+    import_parser.set_defaults(handler=command_import)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # stdout fica reservado para os dados; mensagens de log (print) vão para stderr
+    args.stdout = sys.stdout.buffer
+    args.stdin = sys.stdin.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
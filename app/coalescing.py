@@ -0,0 +1,62 @@
+"""
+Coalescência de requisições: chamadas concorrentes para o mesmo recurso
+(ex.: GET /produtos/{id}) compartilham uma única chamada de rede.
+
+Os resultados ficam guardados até `forget`, para que SKUs do mesmo lote que
+apontam para o mesmo registro também reaproveitem a resposta. Erros não são
+guardados: a próxima chamada tenta de novo.
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    '''Compartilha chamadas em andamento e seus resultados por chave.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+
+    def do(self, key, fn):
+        '''Executa `fn()` uma única vez por chave; chamadas concorrentes aguardam o mesmo resultado.'''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._calls.pop(key, None)
+            finally:
+                call.event.set()
+        else:
+            call.event.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self, keys):
+        '''Descarta os resultados guardados das chaves informadas.'''
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is not None and call.event.is_set():
+                    del self._calls[key]
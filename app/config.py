@@ -0,0 +1,35 @@
+"""
+Configurações globais da aplicação e log de operações.
+
+Compartilhado pelo script Streamlit e pelos módulos auxiliares (pipeline,
+tokens, etc.), que não podem importar o script diretamente.
+"""
+import os
+from datetime import datetime
+
+# --- Configurações ---
+BLING_API_BASE_URL = "https://www.bling.com.br/Api/v3"
+APP_URL_BASE = os.getenv("APP_URL", "http://localhost:8501")
+
+# Configurações OAuth para conta ORIGEM (LOJAHI)
+BLING_LOJAHI_CLIENT_ID = os.getenv("BLING_LOJAHI_CLIENT_ID")
+BLING_LOJAHI_CLIENT_SECRET = os.getenv("BLING_LOJAHI_CLIENT_SECRET")
+BLING_LOJAHI_REDIRECT_URI = f"{APP_URL_BASE}/lojahi"
+STATE_LOJAHI_FIXED = "lojahi_state_fixed_12345"
+
+# Diretório de armazenamento
+DEFAULT_STORAGE_PATH = "./app/data/storage"
+STORAGE_PATH = os.getenv("STORAGE_PATH", DEFAULT_STORAGE_PATH)
+os.makedirs(STORAGE_PATH, exist_ok=True)
+
+# Arquivo de log
+LOG_FILE = os.path.join(STORAGE_PATH, "migration.log")
+
+
+def log_message(message):
+    """Registra mensagens no arquivo de log com timestamp."""
+    timestamp = datetime.now().isoformat()
+    log_entry = f"[{timestamp}] {message}\n"
+    with open(LOG_FILE, "a", encoding="utf-8") as f:
+        f.write(log_entry)
+    print(log_entry.strip())
@@ -0,0 +1,143 @@
+"""
+Exportação em streaming das pastas de SKU como ZIP ou TAR.
+
+O arquivo compactado é gerado em pedaços, lendo as imagens direto do disco:
+nada é montado inteiro em memória nem gravado como arquivo temporário.
+Imagens já comprimidas (JPEG, PNG, WebP, GIF) usam o método "stored" (sem
+recompressão) no ZIP.
+"""
+import io
+import os
+import tarfile
+import zipfile
+
+from storage_layout import FileIndex, sku_directory
+
+EXPORT_CHUNK_SIZE = 1024 * 1024
+# Acima deste tamanho a interface indica o comando da CLI (o Streamlit guarda o download em memória)
+EXPORT_UI_MAX_MB = int(os.getenv("EXPORT_UI_MAX_MB", "200"))
+
+COMPRESSED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".avif", ".heic"}
+COMPRESSED_MAGIC_BYTES = (b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"RIFF")
+
+
+class _ChunkWriter(io.RawIOBase):
+    '''Destino não pesquisável (seek) que acumula os bytes escritos até serem drenados.'''
+
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+
+def is_compressed_image(path):
+    '''Indica se o arquivo já é uma imagem comprimida (pela extensão ou pelos primeiros bytes).'''
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    with open(path, "rb") as f:
+        header = f.read(4)
+    return header.startswith(COMPRESSED_MAGIC_BYTES)
+
+
+def list_export_entries(store, skus, base_path):
+    '''
+    Arquivos a exportar: (nome no arquivo compactado, caminho local), por SKU.
+    Usa o manifesto do banco de estado; para SKUs sem manifesto, lista a pasta.
+    A existência dos arquivos é conferida com uma listagem por pasta.
+    '''
+    entries = []
+    index = FileIndex()
+    for sku in skus:
+        manifest = store.sku_manifest(sku)
+        if manifest:
+            # Quase duplicadas apontam para a cópia mantida: cada arquivo entra uma vez
+            paths = sorted({image["local_path"] for image in manifest.values()})
+        else:
+            sku_path = sku_directory(base_path, sku, index)
+            try:
+                with os.scandir(sku_path) as dir_entries:
+                    paths = sorted(entry.path for entry in dir_entries if entry.is_file())
+            except FileNotFoundError:
+                paths = []
+        entries.extend((f"{sku}/{os.path.basename(path)}", path) for path in paths if index.exists(path))
+    return entries
+
+
+def export_size(entries):
+    '''Soma do tamanho (bytes) dos arquivos a exportar.'''
+    return sum(os.path.getsize(path) for _, path in entries)
+
+
+def iter_zip_stream(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    '''Gera um ZIP em pedaços de bytes a partir de (nome no arquivo, caminho local).'''
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, "w") as archive:
+        for arcname, path in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED if is_compressed_image(path) else zipfile.ZIP_DEFLATED
+            with open(path, "rb") as source, archive.open(info, "w", force_zip64=info.file_size > 2**31) as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    if writer.pending >= chunk_size:
+                        yield writer.drain()
+            if writer.pending:
+                yield writer.drain()
+    yield writer.drain()
+
+
+def iter_tar_stream(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    '''Gera um TAR (sem compressão) em pedaços de bytes a partir de (nome no arquivo, caminho local).'''
+    writer = _ChunkWriter()
+    with tarfile.open(fileobj=writer, mode="w|") as archive:
+        for arcname, path in entries:
+            info = archive.gettarinfo(path, arcname)
+            with open(path, "rb") as source:
+                archive.addfile(info, source)
+            if writer.pending >= chunk_size:
+                yield writer.drain()
+    yield writer.drain()
+
+
+def iter_export_stream(entries, archive_format="zip"):
+    '''Gera o arquivo compactado no formato pedido ("zip" ou "tar").'''
+    if archive_format == "tar":
+        return iter_tar_stream(entries)
+    return iter_zip_stream(entries)
+
+
+class StreamReader(io.RawIOBase):
+    '''Expõe um gerador de pedaços de bytes como arquivo somente leitura.'''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
@@ -0,0 +1,143 @@
+"""
+Detecção de imagens quase duplicadas na galeria de um SKU (hash perceptual).
+
+O produto pai e as variações costumam repetir a mesma foto recomprimida ou
+redimensionada sob links diferentes, o que a deduplicação por link não pega.
+Para cada imagem são calculados, sobre os pixels reduzidos em tons de cinza:
+
+- aHash: 8x8 pixels, bit = pixel acima da média;
+- dHash: 9x8 pixels, bit = pixel mais claro que o vizinho da direita.
+
+Duas imagens são quase duplicadas quando a distância de Hamming dos dois
+hashes fica dentro de `PHASH_MAX_DISTANCE`. Os grupos são formados por
+transitividade e, em cada grupo, fica só a cópia de maior resolução.
+
+Opcional: exige NumPy e Pillow e só roda com `PHASH_DEDUP=true`. O cálculo
+dos hashes usa o pool de processos de image_workers.
+"""
+import os
+
+from config import log_message
+from image_workers import get_process_pool
+
+PHASH_DEDUP = os.getenv("PHASH_DEDUP", "false").lower() == "true"
+# Bits diferentes (de 64) tolerados em cada hash para considerar duas imagens iguais
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+
+# Aviso de dependência ausente registrado uma única vez por processo
+_missing_dependency_logged = False
+
+
+def is_phash_enabled():
+    '''Indica se a deduplicação perceptual está ligada e NumPy/Pillow estão disponíveis.'''
+    global _missing_dependency_logged
+    if not PHASH_DEDUP:
+        return False
+    try:
+        import numpy  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError as e:
+        if not _missing_dependency_logged:
+            _missing_dependency_logged = True
+            log_message(f"⚠️ [DUPLICATAS] PHASH_DEDUP=true, mas o pacote {e.name} não está instalado: "
+                        f"deduplicação de quase duplicadas desativada")
+        return False
+    return True
+
+
+def image_fingerprint(image_path):
+    '''Hashes perceptuais (aHash e dHash de 64 bits), resolução e tamanho de uma imagem.'''
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        width, height = image.size
+        gray = image.convert("L")
+        small = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        tiny = np.asarray(gray.resize((8, 8), Image.BILINEAR), dtype=np.int16)
+    ahash = np.packbits(tiny > tiny.mean()).tobytes()
+    dhash = np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+    return {
+        "path": image_path,
+        "ahash": int.from_bytes(ahash, "big"),
+        "dhash": int.from_bytes(dhash, "big"),
+        "pixels": width * height,
+        "size": os.path.getsize(image_path),
+    }
+
+
+def submit_fingerprints(image_paths):
+    '''Envia o cálculo dos hashes ao pool e retorna a lista de futures (na mesma ordem).'''
+    pool = get_process_pool()
+    return [pool.submit(image_fingerprint, image_path) for image_path in image_paths]
+
+
+def fingerprint_images(image_paths):
+    '''Impressões das imagens; as que não abrem no Pillow ficam de fora da comparação.'''
+    fingerprints = []
+    for image_path, future in zip(image_paths, submit_fingerprints(image_paths)):
+        try:
+            fingerprints.append(future.result())
+        except Exception as e:
+            log_message(f"⚠️ [DUPLICATAS] Não foi possível calcular o hash de {os.path.basename(image_path)}: {e}")
+    return fingerprints
+
+
+def _hamming_matrix(hashes):
+    # Distância de Hamming entre todos os pares de hashes de 64 bits
+    import numpy as np
+
+    values = np.array(hashes, dtype=np.uint64)
+    xor = values[:, None] ^ values[None, :]
+    return np.unpackbits(xor.view(np.uint8), axis=-1).reshape(len(hashes), len(hashes), -1).sum(axis=-1)
+
+
+def group_near_duplicates(fingerprints, max_distance=PHASH_MAX_DISTANCE):
+    '''Grupos (listas de índices, com 2+ imagens) de impressões quase iguais.'''
+    import numpy as np
+
+    if len(fingerprints) < 2:
+        return []
+    near = ((_hamming_matrix([fp["ahash"] for fp in fingerprints]) <= max_distance)
+            & (_hamming_matrix([fp["dhash"] for fp in fingerprints]) <= max_distance))
+    groups = []
+    seen = np.zeros(len(fingerprints), dtype=bool)
+    for start in range(len(fingerprints)):
+        if seen[start]:
+            continue
+        # Componente conexo a partir de `start`
+        members = []
+        pending = [start]
+        seen[start] = True
+        while pending:
+            index = pending.pop()
+            members.append(index)
+            for neighbor in np.flatnonzero(near[index] & ~seen):
+                seen[neighbor] = True
+                pending.append(int(neighbor))
+        if len(members) > 1:
+            groups.append(sorted(members))
+    return groups
+
+
+def find_duplicates(fingerprints, max_distance=PHASH_MAX_DISTANCE):
+    '''
+    Caminho de cada cópia descartável → caminho da cópia mantida no grupo
+    (maior resolução; empate: maior arquivo).
+    '''
+    duplicates = {}
+    for group in group_near_duplicates(fingerprints, max_distance):
+        members = [fingerprints[index] for index in group]
+        best = max(members, key=lambda fp: (fp["pixels"], fp["size"]))
+        for fp in members:
+            if fp is not best:
+                duplicates[fp["path"]] = best["path"]
+    return duplicates
+
+
+def unique_images(image_paths, max_distance=PHASH_MAX_DISTANCE):
+    '''`image_paths` sem as cópias quase duplicadas (mantém a ordem e a melhor cópia de cada grupo).'''
+    duplicates = find_duplicates(fingerprint_images(image_paths), max_distance)
+    for duplicate, kept in duplicates.items():
+        log_message(f"🧬 [DUPLICATAS] {os.path.basename(duplicate)} é cópia de {os.path.basename(kept)}")
+    return [path for path in image_paths if path not in duplicates]
@@ -0,0 +1,114 @@
+"""
+Validação barata das imagens baixadas, sem decodificar os pixels.
+
+Um corpo 200 nem sempre é uma imagem: páginas de erro XML do S3 e respostas
+truncadas também chegam com sucesso. Antes de gravar, o conteúdo é conferido:
+
+- Content-Length (quando a resposta não veio comprimida) e Content-Type;
+- assinatura do formato (magic bytes);
+- estrutura do contêiner: marcador EOI do JPEG, blocos do PNG até o IEND,
+  trailer do GIF e tamanho declarado no cabeçalho RIFF do WebP.
+
+Com `IMAGE_FULL_DECODE`, a imagem também é decodificada pelo Pillow (se
+instalado). Formatos desconhecidos passam, desde que não pareçam texto.
+"""
+import io
+import os
+import struct
+
+IMAGE_VALIDATION = os.getenv("IMAGE_VALIDATION", "true").lower() == "true"
+IMAGE_FULL_DECODE = os.getenv("IMAGE_FULL_DECODE", "false").lower() == "true"
+# Novas tentativas imediatas quando o conteúdo baixado está corrompido
+IMAGE_VALIDATION_RETRIES = int(os.getenv("IMAGE_VALIDATION_RETRIES", "2"))
+
+# Tipos que nunca são imagem (páginas de erro, respostas de API)
+TEXT_CONTENT_TYPES = ("text/", "application/xml", "application/json", "application/xhtml")
+# Bytes que podem aparecer depois do marcador final sem indicar corrupção
+TRAILING_PADDING = b"\x00\r\n \t"
+
+
+class CorruptImageError(ValueError):
+    '''O conteúdo baixado não é uma imagem íntegra.'''
+
+
+def detect_format(content):
+    '''Formato pela assinatura do arquivo: "jpeg", "png", "gif", "webp" ou None.'''
+    if content.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if content.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if content[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _check_png(content):
+    # Percorre os blocos (tamanho + tipo + dados + CRC) até o IEND
+    offset = 8
+    while offset + 8 <= len(content):
+        length, chunk_type = struct.unpack(">I4s", content[offset:offset + 8])
+        offset += 12 + length
+        if chunk_type == b"IEND":
+            return offset <= len(content)
+    return False
+
+
+def _check_structure(image_format, content):
+    if image_format == "jpeg":
+        return content.rstrip(TRAILING_PADDING).endswith(b"\xff\xd9")
+    if image_format == "png":
+        return _check_png(content)
+    if image_format == "gif":
+        return content.rstrip(TRAILING_PADDING).endswith(b"\x3b")
+    if image_format == "webp":
+        return struct.unpack("<I", content[4:8])[0] + 8 <= len(content)
+    return True
+
+
+def _full_decode(content):
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.load()
+    except Exception as e:
+        raise CorruptImageError(f"falha ao decodificar: {e}") from e
+
+
+def validate_image(content, headers=None, full_decode=IMAGE_FULL_DECODE):
+    '''
+    Confere se `content` é uma imagem íntegra; `headers` são os da resposta HTTP.
+    Lança `CorruptImageError` com o motivo. Retorna o formato detectado (ou None).
+    '''
+    headers = headers or {}
+    if not content:
+        raise CorruptImageError("corpo vazio")
+
+    expected_length = headers.get("Content-Length", "")
+    if expected_length.isdigit() and not headers.get("Content-Encoding") and int(expected_length) != len(content):
+        raise CorruptImageError(f"truncada ({len(content):,} de {int(expected_length):,} bytes)")
+
+    content_type = headers.get("Content-Type", "").lower()
+    if content_type.startswith(TEXT_CONTENT_TYPES):
+        raise CorruptImageError(f"Content-Type {content_type} não é de imagem")
+
+    image_format = detect_format(content)
+    if image_format is None:
+        if content.lstrip()[:1] in (b"<", b"{"):
+            raise CorruptImageError("conteúdo em texto (XML/HTML/JSON) em vez de imagem")
+    elif not _check_structure(image_format, content):
+        raise CorruptImageError(f"{image_format.upper()} incompleto (marcador final ausente)")
+
+    if full_decode:
+        _full_decode(content)
+    return image_format
+
+
+def validate_image_file(path, full_decode=IMAGE_FULL_DECODE):
+    '''Valida uma imagem já gravada em disco (ver `validate_image`).'''
+    with open(path, "rb") as f:
+        return validate_image(f.read(), full_decode=full_decode)
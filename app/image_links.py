@@ -0,0 +1,72 @@
+"""
+Utilitários para links de imagens do Bling (URLs assinadas do S3 e links externos).
+"""
+import os
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Links que expiram em menos que esta margem (segundos) são renovados antes do download
+SIGNED_URL_REFRESH_MARGIN = int(os.getenv("SIGNED_URL_REFRESH_MARGIN", "120"))
+
+# Parâmetros de assinatura que mudam a cada consulta sem mudar a imagem
+SIGNED_QUERY_PARAMS = {
+    "x-amz-algorithm", "x-amz-credential", "x-amz-date", "x-amz-expires",
+    "x-amz-signedheaders", "x-amz-signature", "x-amz-security-token",
+    "awsaccesskeyid", "signature", "expires", "validade",
+}
+
+
+def normalize_image_link(link):
+    '''Normaliza um link de imagem removendo os parâmetros de assinatura e o fragmento.'''
+    parts = urlsplit(link.strip())
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in SIGNED_QUERY_PARAMS]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ""))
+
+
+def signed_url_expiry(link):
+    '''
+    Momento (timestamp Unix) em que um link assinado expira, ou None se o link não
+    tem assinatura com validade conhecida.
+    Suporta S3 SigV4 (X-Amz-Date + X-Amz-Expires) e SigV2/Bling (Expires/validade em epoch).
+    '''
+    params = {key.lower(): value for key, value in parse_qsl(urlsplit(link).query)}
+    try:
+        if "x-amz-date" in params and "x-amz-expires" in params:
+            signed_at = datetime.strptime(params["x-amz-date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed_at.timestamp() + int(params["x-amz-expires"])
+        for key in ("expires", "validade"):
+            if params.get(key, "").isdigit():
+                return float(params[key])
+    except ValueError:
+        return None
+    return None
+
+
+def is_link_expiring(expires_at, margin=SIGNED_URL_REFRESH_MARGIN):
+    '''Indica se um link com validade `expires_at` (ou None) já expirou ou expira dentro da margem.'''
+    return expires_at is not None and expires_at - time.time() < margin
+
+
+def image_identity_keys(img):
+    '''Chaves de identidade de uma imagem: ID do Bling (se houver) e link normalizado.'''
+    keys = []
+    if img.get('id'):
+        keys.append(("id", str(img['id'])))
+    if img.get('link'):
+        keys.append(("link", normalize_image_link(img['link'])))
+    return keys
+
+
+def add_unique_image(img, images, seen_keys):
+    '''
+    Adiciona `img` a `images` se nenhuma das suas identidades já foi vista (O(1) por imagem).
+    Retorna True se a imagem foi adicionada.
+    '''
+    keys = image_identity_keys(img)
+    if not keys or any(key in seen_keys for key in keys):
+        return False
+    seen_keys.update(keys)
+    images.append(img)
+    return True
@@ -0,0 +1,160 @@
+"""
+Processamento de imagens em pool de processos.
+
+As funções de trabalho ficam neste módulo (e não no script Streamlit) para que
+possam ser serializadas e executadas pelos processos do pool.
+"""
+import base64
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Número de processos para codificação/preparação de imagens (limitado à cota de CPU do contêiner)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Transformação opcional (desativada se IMAGE_MAX_DIMENSION=0 e IMAGE_FORMAT vazio)
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "0"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "").strip().lower()  # "", "webp" ou "jpeg"
+IMAGE_STRIP_METADATA = os.getenv("IMAGE_STRIP_METADATA", "true").lower() in ("1", "true", "yes")
+
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+
+_process_pool = None
+
+
+def process_pool_size():
+    '''Processos do pool: IMAGE_WORKERS, sem passar das CPUs da cota do contêiner.'''
+    # Importado aqui: os processos do pool importam este módulo e não precisam do controle de recursos
+    from resource_governor import container_cpu_quota
+
+    quota = container_cpu_quota()
+    workers = IMAGE_WORKERS if quota is None else min(IMAGE_WORKERS, math.ceil(quota))
+    return max(1, workers)
+
+
+def get_process_pool():
+    '''Retorna o pool de processos compartilhado, criando-o na primeira chamada.'''
+    global _process_pool
+    if _process_pool is None:
+        # "spawn" evita herdar as threads do servidor Streamlit via fork
+        _process_pool = ProcessPoolExecutor(
+            max_workers=process_pool_size(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def encode_image_file(image_path):
+    '''Lê uma imagem do disco e a codifica em base64 para o payload de upload.'''
+    with open(image_path, 'rb') as f:
+        image_data = f.read()
+    return {
+        "arquivo": base64.b64encode(image_data).decode('utf-8'),
+        "nome": os.path.basename(image_path),
+        "tamanho": len(image_data)
+    }
+
+
+def submit_encoding(image_paths):
+    '''Envia a codificação das imagens ao pool e retorna a lista de futures (na mesma ordem).'''
+    pool = get_process_pool()
+    return [pool.submit(encode_image_file, image_path) for image_path in image_paths]
+
+
+def is_transform_enabled():
+    '''Indica se a etapa de transformação está configurada e o Pillow está disponível.'''
+    if not (IMAGE_MAX_DIMENSION or IMAGE_FORMAT):
+        return False
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def transformed_file_name(file_name):
+    '''Nome final do arquivo após a transformação (troca a extensão se houver conversão de formato).'''
+    if not is_transform_enabled() or IMAGE_FORMAT not in FORMAT_EXTENSIONS:
+        return file_name
+    base_name, _ = os.path.splitext(file_name)
+    return base_name + FORMAT_EXTENSIONS[IMAGE_FORMAT]
+
+
+def flatten_transparency(image):
+    '''
+    Converte para RGB compondo a transparência sobre fundo branco (formatos sem
+    canal alfa). Um simples convert("RGB") mantém a cor "escondida" sob os
+    pixels transparentes — um PNG vermelho totalmente transparente sairia vermelho.
+    '''
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def transform_image(source_path, target_path, max_dimension=IMAGE_MAX_DIMENSION, quality=IMAGE_QUALITY,
+                    output_format=IMAGE_FORMAT, strip_metadata=IMAGE_STRIP_METADATA):
+    '''
+    Redimensiona, recomprime e/ou converte uma imagem (executado no pool de processos).
+    
+    Grava em `target_path` de forma atômica e remove `source_path` se os caminhos
+    forem diferentes. Se o resultado não for menor que o original e não houver
+    redimensionamento nem conversão, o arquivo original é mantido.
+    '''
+    from PIL import Image, ImageOps
+
+    bytes_before = os.path.getsize(source_path)
+    with Image.open(source_path) as original:
+        source_format = (original.format or "JPEG").lower()
+        image = ImageOps.exif_transpose(original) if strip_metadata else original.copy()
+        icc_profile = original.info.get("icc_profile")
+        exif = None if strip_metadata else original.info.get("exif")
+
+    resized = False
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        resized = True
+
+    target_format = output_format or source_format
+    if target_format == "jpg":
+        target_format = "jpeg"
+    if target_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = flatten_transparency(image)
+
+    save_kwargs = {}
+    if target_format in ("jpeg", "webp"):
+        save_kwargs["quality"] = quality
+    if target_format == "jpeg":
+        save_kwargs["optimize"] = True
+    if icc_profile:
+        save_kwargs["icc_profile"] = icc_profile
+    if exif:
+        save_kwargs["exif"] = exif
+
+    temp_path = f"{target_path}.tmp"
+    image.save(temp_path, format=target_format.upper(), **save_kwargs)
+    bytes_after = os.path.getsize(temp_path)
+
+    converted = target_format != source_format
+    if not resized and not converted and bytes_after >= bytes_before:
+        os.remove(temp_path)
+        if target_path != source_path:
+            os.replace(source_path, target_path)
+        bytes_after = bytes_before
+    else:
+        os.replace(temp_path, target_path)
+        if target_path != source_path and os.path.exists(source_path):
+            os.remove(source_path)
+
+    return {"path": target_path, "bytes_before": bytes_before, "bytes_after": bytes_after}
+
+
+def submit_transform(source_path, target_path):
+    '''Envia a transformação de uma imagem ao pool de processos e retorna o future.'''
+    return get_process_pool().submit(transform_image, source_path, target_path)
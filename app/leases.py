@@ -0,0 +1,137 @@
+"""
+Distribuição de jobs entre réplicas com reservas (leases) de SKUs.
+
+Com `DISTRIBUTED_WORKERS=true`, um job de download entra na fila do banco de
+estado (volume compartilhado) e cada réplica roda um worker em segundo plano
+que reserva lotes de `LEASE_CHUNK_SIZE` SKUs. O worker é único por processo e
+sobe quando o app da réplica é carregado (não quando uma sessão abre um job),
+então toda réplica no ar processa a fila. A reserva vale `LEASE_SECONDS`
+e é renovada pelo sinal de vida do worker; se a réplica cair, a reserva vence
+e outro worker assume os SKUs. O resultado de um SKU só é gravado se a reserva
+ainda for de quem o processou, então nenhum SKU é contado duas vezes.
+
+O limite de requisições do Bling é dividido entre os workers vivos: cada
+réplica usa `BLING_RATE_LIMIT / workers`, e o total fica dentro do orçamento.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from config import log_message
+from scheduler import get_scheduler
+
+DISTRIBUTED_WORKERS = os.getenv("DISTRIBUTED_WORKERS", "false").lower() == "true"
+# Validade (segundos) de uma reserva sem renovação
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "120"))
+# SKUs reservados de cada vez por worker
+LEASE_CHUNK_SIZE = int(os.getenv("LEASE_CHUNK_SIZE", "10"))
+# Pausa (segundos) do worker quando não há trabalho na fila
+WORKER_IDLE_SECONDS = float(os.getenv("WORKER_IDLE_SECONDS", "5"))
+
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+# Intervalo (segundos) com que a sessão que abriu o job confere o progresso
+PROGRESS_POLL_SECONDS = 1.0
+
+# Identificador deste processo: único mesmo quando a réplica reinicia com o mesmo nome,
+# para que as reservas do processo anterior vençam em vez de serem renovadas
+WORKER_ID = f"{os.getenv('RAILWAY_REPLICA_ID') or socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeaseHeartbeat:
+    '''
+    Sinal de vida do worker: renova as reservas e registra o worker a cada
+    `HEARTBEAT_SECONDS`, ajustando a fatia do limite de requisições desta réplica.
+    '''
+
+    def __init__(self, store, worker_id=WORKER_ID):
+        self.store = store
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = None
+
+    def beat(self):
+        self.store.touch_worker(self.worker_id)
+        self.store.renew_leases(self.worker_id, LEASE_SECONDS)
+        live = len(self.store.live_workers(LEASE_SECONDS)) or 1
+        get_scheduler().set_rate_share(live)
+
+    def _run(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                self.beat()
+            except Exception as e:
+                log_message(f"⚠️ [WORKER] Falha no sinal de vida de {self.worker_id}: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self.beat()
+            self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class LeaseWorker:
+    '''
+    Worker em segundo plano: reserva lotes de SKUs de qualquer job da fila e
+    os processa com `process_chunk(claim, owner)`, até a fila esvaziar; então
+    aguarda `WORKER_IDLE_SECONDS` e tenta de novo. `process_chunk` grava o
+    resultado de cada SKU (inclusive erro) com `complete_leased_sku`.
+    '''
+
+    def __init__(self, store, process_chunk, worker_id=WORKER_ID):
+        self.store = store
+        self.process_chunk = process_chunk
+        self.worker_id = worker_id
+        self.heartbeat = LeaseHeartbeat(store, worker_id)
+        self._thread = None
+
+    def run_once(self, job_id=None):
+        '''Reserva e processa um lote. Retorna o lote processado (ou None se não havia trabalho).'''
+        claim = self.store.claim_skus(self.worker_id, LEASE_CHUNK_SIZE, LEASE_SECONDS, job_id=job_id)
+        if claim is None:
+            return None
+        log_message(f"📋 [WORKER] {self.worker_id} reservou {len(claim['skus'])} SKUs do job {claim['job_id']}")
+        try:
+            self.process_chunk(claim, self.worker_id)
+        except Exception as e:
+            log_message(f"❌ [WORKER] Falha no lote do job {claim['job_id']}: {e}")
+        finally:
+            # Reservas que sobraram (SKU sem resultado) voltam para a fila na hora
+            self.store.release_leases(self.worker_id, claim["job_id"], claim["skus"])
+        self.store.finish_job_if_done(claim["job_id"])
+        return claim
+
+    def _run(self):
+        while True:
+            try:
+                if self.run_once() is None:
+                    time.sleep(WORKER_IDLE_SECONDS)
+            except Exception as e:
+                log_message(f"⚠️ [WORKER] Erro no worker {self.worker_id}: {e}")
+                time.sleep(WORKER_IDLE_SECONDS)
+
+    def start(self):
+        if self._thread is None:
+            self.heartbeat.start()
+            self._thread = threading.Thread(target=self._run, name="lease-worker", daemon=True)
+            self._thread.start()
+            log_message(f"🚀 [WORKER] Worker {self.worker_id} iniciado")
+        return self
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_lease_worker(store, process_chunk):
+    '''Retorna o worker do processo (um por réplica), iniciando-o na primeira chamada.'''
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = LeaseWorker(store, process_chunk).start()
+        return _worker
@@ -0,0 +1,126 @@
+"""
+Motor de pipeline assíncrono com etapas ligadas por filas limitadas.
+
+Cada etapa tem um handler síncrono (chamadas `requests`, escrita em disco) que
+roda em um pool de threads, com concorrência própria. As filas entre as etapas
+têm tamanho máximo, então uma etapa rápida (ex.: download) espera quando a
+seguinte (ex.: escrita/upload) não acompanha — isso é o backpressure.
+
+O handler recebe um item e retorna um iterável de itens para a próxima etapa
+(pode ser vazio ou ter vários itens, ex.: uma ficha de produto gera N imagens).
+Os callbacks `on_output` e `on_error` rodam no loop de eventos, ou seja, na
+mesma thread que chamou `run_sync` (seguro para chamadas Streamlit).
+
+Uma etapa com `priority` recebe seus itens por ordem de prioridade (menor
+primeiro) em vez da ordem de chegada, entre os itens que estão na sua fila.
+
+Uma etapa com `governor` (ResourceGovernor) ocupa uma vaga dele durante cada
+handler: sob pressão de memória ou disco, a etapa roda com menos workers ou pausa.
+"""
+import asyncio
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuração padrão de concorrência por etapa
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+PIPELINE_RESOLVE_WORKERS = int(os.getenv("PIPELINE_RESOLVE_WORKERS", "2"))
+PIPELINE_DETAIL_WORKERS = int(os.getenv("PIPELINE_DETAIL_WORKERS", "2"))
+PIPELINE_DOWNLOAD_WORKERS = int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "4"))
+PIPELINE_WRITE_WORKERS = int(os.getenv("PIPELINE_WRITE_WORKERS", "2"))
+PIPELINE_DEDUP_WORKERS = int(os.getenv("PIPELINE_DEDUP_WORKERS", "2"))
+
+
+class Stage:
+    '''
+    Etapa do pipeline: nome, handler síncrono, número de workers, prioridade
+    opcional dos itens e controle de recursos opcional.
+    '''
+
+    def __init__(self, name, handler, concurrency=1, priority=None, governor=None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.priority = priority
+        self.governor = governor
+
+    def run(self, item):
+        '''Executa o handler (na thread do pool), dentro de uma vaga do governor se houver.'''
+        if self.governor is None:
+            return self.handler(item)
+        with self.governor.slot(self.name, self.concurrency):
+            return self.handler(item)
+
+
+class PipelineEngine:
+    '''Executa uma sequência de etapas conectadas por filas limitadas.'''
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE, on_output=None, on_error=None):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.on_output = on_output
+        self.on_error = on_error
+        self._sequence = itertools.count()
+
+    def _new_queue(self, stage):
+        if stage.priority is None:
+            return asyncio.Queue(maxsize=self.queue_size)
+        return asyncio.PriorityQueue(maxsize=self.queue_size)
+
+    async def _put(self, queue, stage, item):
+        if stage.priority is None:
+            await queue.put(item)
+        else:
+            # O contador desempata prioridades iguais pela ordem de chegada
+            await queue.put((stage.priority(item), next(self._sequence), item))
+
+    async def _get(self, queue, stage):
+        entry = await queue.get()
+        return entry if stage.priority is None else entry[-1]
+
+    async def _worker(self, stage, in_queue, next_stage, out_queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._get(in_queue, stage)
+            try:
+                outputs = await loop.run_in_executor(executor, stage.run, item)
+                for output in outputs or ():
+                    if out_queue is not None:
+                        await self._put(out_queue, next_stage, output)
+                    elif self.on_output:
+                        self.on_output(output)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(stage.name, item, e)
+            finally:
+                in_queue.task_done()
+
+    async def run(self, items):
+        '''Alimenta a primeira etapa com `items` e aguarda o esvaziamento de todas as filas.'''
+        queues = [self._new_queue(stage) for stage in self.stages]
+        total_workers = sum(stage.concurrency for stage in self.stages)
+
+        with ThreadPoolExecutor(max_workers=total_workers) as executor:
+            workers_by_stage = []
+            for index, stage in enumerate(self.stages):
+                has_next = index + 1 < len(queues)
+                next_stage = self.stages[index + 1] if has_next else None
+                out_queue = queues[index + 1] if has_next else None
+                workers_by_stage.append([
+                    asyncio.create_task(self._worker(stage, queues[index], next_stage, out_queue, executor))
+                    for _ in range(stage.concurrency)
+                ])
+
+            for item in items:
+                await self._put(queues[0], self.stages[0], item)
+
+            # Encerrar as etapas em ordem: uma etapa só termina depois que a anterior esvaziou
+            for queue, workers in zip(queues, workers_by_stage):
+                await queue.join()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    def run_sync(self, items):
+        '''Executa o pipeline a partir de código síncrono (ex.: handler de botão Streamlit).'''
+        asyncio.run(self.run(items))
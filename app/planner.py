@@ -0,0 +1,164 @@
+"""
+Planejamento (dry-run) de um lote: estima chamadas à API, bytes de imagens e
+duração antes de executar, sem nenhuma requisição de rede.
+
+Tudo vem do banco de estado: SKUs e fichas já em cache (api_cache), imagens já
+salvas (manifesto e índice de URLs) e médias do histórico para o que ainda não
+é conhecido. A duração é projetada a partir do limite de requisições do Bling
+e da banda de download configurada.
+"""
+import math
+import os
+
+from bling_api import BLING_LOOKUP_BATCH_SIZE, bulk_variations_available
+from image_links import add_unique_image, normalize_image_link
+from image_workers import transformed_file_name
+from pipeline import PIPELINE_DETAIL_WORKERS
+from scheduler import BLING_RATE_LIMIT
+from upload_diff import UPLOAD_SKIP_IDENTICAL
+
+# Cota diária de requisições da API do Bling, por conta
+BLING_DAILY_QUOTA = int(os.getenv("BLING_DAILY_QUOTA", "120000"))
+# Banda estimada para download das imagens (MB/s)
+PLAN_DOWNLOAD_MBPS = float(os.getenv("PLAN_DOWNLOAD_MBPS", "5"))
+
+# Valores usados enquanto não há histórico no banco de estado
+DEFAULT_IMAGES_PER_SKU = 5
+DEFAULT_IMAGE_BYTES = 300 * 1024
+DEFAULT_VARIATIONS_PER_PRODUCT = 0
+# Pausa aplicada antes de cada ficha de variação na extração
+VARIATION_THROTTLE = 0.5
+
+
+def _media_images(product_data, images, seen_keys):
+    midia = product_data.get('midia', {})
+    if isinstance(midia, dict):
+        imagens = midia.get('imagens', {})
+        for img in imagens.get('internas', []) + imagens.get('externas', []):
+            if img.get('link'):
+                add_unique_image(img, images, seen_keys)
+
+
+def _variation_calls(count):
+    # Variações de um produto: em lote pela listagem ou uma ficha por variação
+    if count >= 2 and bulk_variations_available():
+        return math.ceil(count / BLING_LOOKUP_BATCH_SIZE)
+    return math.ceil(count)
+
+
+def plan_batch(store, account, skus, include_upload=False):
+    '''
+    Estima o custo de um lote de SKUs para a conta `account`.
+
+    Com `include_upload`, conta também a busca no destino, a consulta das imagens
+    atuais e o PATCH de cada SKU (migração completa). Retorna um dict com as chamadas previstas por tipo,
+    bytes a baixar, duração estimada e se o lote cabe na cota diária.
+    '''
+    skus = list(dict.fromkeys(skus))
+    avg_image = store.average_image_size() or DEFAULT_IMAGE_BYTES
+    avg_images = store.average_images_per_sku() or DEFAULT_IMAGES_PER_SKU
+
+    calls = {"busca": 0, "ficha": 0, "variacoes": 0, "busca_destino": 0, "ficha_destino": 0, "patch": 0}
+    fetched_products = set()
+    variation_counts = []
+    unknown_products = 0
+    images_total = 0
+    images_to_download = 0
+    bytes_to_download = 0
+    resolved_from_cache = 0
+
+    for sku in skus:
+        product = store.cache_get(f"{account}:codigo:{sku}")
+        if product is None:
+            # Busca e ficha desconhecidas: estimadas pela média do histórico
+            calls["busca"] += 1
+            calls["ficha"] += 1
+            unknown_products += 1
+            continue
+        resolved_from_cache += 1
+
+        product_data = store.cache_get(f"{account}:produto:{product['id']}")
+        if product_data is None:
+            if product["id"] not in fetched_products:
+                calls["ficha"] += 1
+            fetched_products.add(product["id"])
+            unknown_products += 1
+            continue
+
+        images = []
+        seen_keys = set()
+        _media_images(product_data, images, seen_keys)
+        variacoes = product_data.get('variacoes', [])
+        variation_counts.append(len(variacoes))
+        pending_variations = 0
+        for variacao in variacoes:
+            variation_data = store.cache_get(f"{account}:produto:{variacao.get('id')}")
+            if variation_data is None:
+                if variacao.get('id') not in fetched_products:
+                    pending_variations += 1
+                fetched_products.add(variacao.get('id'))
+                continue
+            _media_images(variation_data, images, seen_keys)
+        calls["variacoes"] += _variation_calls(pending_variations)
+
+        manifest = store.sku_manifest(sku)
+        for img in images:
+            file_name = os.path.basename(img['link']).split('?')[0]
+            images_total += 1
+            if file_name in manifest or transformed_file_name(file_name) in manifest:
+                continue
+            if store.lookup_blob(normalize_image_link(img['link'])):
+                continue
+            images_to_download += 1
+            bytes_to_download += avg_image
+
+    # Produtos sem ficha em cache: variações e imagens pela média do histórico
+    avg_variations = (sum(variation_counts) / len(variation_counts)) if variation_counts else DEFAULT_VARIATIONS_PER_PRODUCT
+    calls["variacoes"] += unknown_products * _variation_calls(avg_variations)
+    estimated_images = math.ceil(unknown_products * avg_images)
+    images_total += estimated_images
+    images_to_download += estimated_images
+    bytes_to_download += estimated_images * avg_image
+
+    if include_upload:
+        # Destino resolvido em lote (vários códigos por requisição) antes do job
+        calls["busca_destino"] = math.ceil(len(skus) / BLING_LOOKUP_BATCH_SIZE)
+        if UPLOAD_SKIP_IDENTICAL:
+            # Imagens atuais do destino, comparadas antes do PATCH (no pior caso nenhum é pulado)
+            calls["ficha_destino"] = len(skus)
+        calls["patch"] = len(skus)
+
+    total_calls = sum(calls.values())
+    api_seconds = total_calls / BLING_RATE_LIMIT
+    # A pausa só se aplica às fichas individuais
+    throttle_seconds = 0 if bulk_variations_available() else calls["variacoes"] * VARIATION_THROTTLE / PIPELINE_DETAIL_WORKERS
+    download_seconds = bytes_to_download / (PLAN_DOWNLOAD_MBPS * 1024 * 1024)
+    used_today = store.api_calls_today(account)
+    remaining_quota = max(0, BLING_DAILY_QUOTA - used_today)
+
+    return {
+        "skus": len(skus),
+        "resolved_from_cache": resolved_from_cache,
+        "calls": calls,
+        "total_calls": total_calls,
+        "images_total": int(images_total),
+        "images_to_download": int(images_to_download),
+        "bytes_to_download": int(bytes_to_download),
+        # As etapas rodam em pipeline: o lote leva aproximadamente o tempo da etapa mais lenta
+        "estimated_seconds": max(api_seconds + throttle_seconds, download_seconds),
+        "api_calls_today": used_today,
+        "remaining_quota": remaining_quota,
+        "exceeds_quota": total_calls > remaining_quota,
+    }
+
+
+def format_duration(seconds):
+    '''Duração legível (ex.: "1h 05min", "3min 20s").'''
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}min"
+    if minutes:
+        return f"{minutes}min {seconds:02d}s"
+    return f"{seconds}s"
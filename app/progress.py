@@ -0,0 +1,195 @@
+"""
+Situação ao vivo de um job: contadores, taxa, tempo restante e itens em andamento.
+
+As etapas do pipeline (em várias threads) registram cada imagem e cada SKU no
+`ProgressTracker`; a interface não recebe um elemento por evento — ela lê um
+`snapshot()` a cada `PROGRESS_REFRESH_SECONDS` e redesenha os mesmos espaços
+fixos da página, então o custo de exibição não cresce com o tamanho do job.
+
+A taxa é a média dos últimos `PROGRESS_RATE_WINDOW_SECONDS` (janela móvel),
+para que o tempo restante acompanhe mudanças de ritmo (cache, limite da API).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from planner import format_duration
+
+# Intervalo (segundos) entre atualizações da situação na interface
+PROGRESS_REFRESH_SECONDS = float(os.getenv("PROGRESS_REFRESH_SECONDS", "1.0"))
+# Janela (segundos) da taxa móvel de imagens/SKUs por segundo
+PROGRESS_RATE_WINDOW_SECONDS = float(os.getenv("PROGRESS_RATE_WINDOW_SECONDS", "30"))
+# Itens em andamento listados na interface (o restante aparece só na contagem)
+PROGRESS_IN_FLIGHT_SHOWN = 8
+
+
+class ProgressTracker:
+    '''
+    Contadores do job, seguros entre threads. Eventos:
+    `expect_images` (galeria de um SKU conhecida), `begin`/`end` (item em
+    andamento), `image_done` (imagem gravada, reaproveitada ou com falha) e
+    `sku_done` (SKU finalizado).
+    '''
+
+    def __init__(self, total_skus=0, window_seconds=PROGRESS_RATE_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._counts = {
+            "skus_total": total_skus, "skus_done": 0, "skus_ok": 0, "skus_empty": 0, "skus_failed": 0,
+            "skus_known": 0, "images_expected": 0, "images_done": 0, "images_downloaded": 0,
+            "images_cached": 0, "images_failed": 0, "bytes": 0,
+        }
+        # SKUs com o total de imagens já conhecido
+        self._known_skus = set()
+        # (instante, imagens, bytes, SKUs) concluídos, para a taxa móvel
+        self._events = deque()
+        self._in_flight = OrderedDict()
+        self._errors = []
+
+    def _record(self, images=0, size=0, skus=0):
+        now = time.monotonic()
+        self._events.append((now, images, size, skus))
+        while self._events and now - self._events[0][0] > self.window_seconds:
+            self._events.popleft()
+
+    def add_skus(self, count):
+        '''Soma SKUs ao total do job.'''
+        with self._lock:
+            self._counts["skus_total"] += count
+
+    def _expect(self, sku, count):
+        if sku not in self._known_skus:
+            self._known_skus.add(sku)
+            self._counts["skus_known"] += 1
+            self._counts["images_expected"] += count
+
+    def expect_images(self, sku, count):
+        '''Registra o total de imagens do SKU (0 se não tem imagens); repetições são ignoradas.'''
+        with self._lock:
+            self._expect(sku, count)
+
+    def begin(self, key, label):
+        '''Marca um item como em andamento.'''
+        with self._lock:
+            self._in_flight[key] = label
+
+    def end(self, key):
+        '''Retira um item dos em andamento.'''
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def set_in_flight(self, labels):
+        '''Substitui os itens em andamento (situação lida de fora, ex.: reservas de outras réplicas).'''
+        with self._lock:
+            self._in_flight = OrderedDict((label, label) for label in labels)
+
+    def image_done(self, key=None, size=0, cached=False, failed=False):
+        '''Imagem concluída: gravada (`size` bytes), já existente (`cached`) ou com falha (`failed`).'''
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._counts["images_done"] += 1
+            if failed:
+                self._counts["images_failed"] += 1
+            elif cached:
+                self._counts["images_cached"] += 1
+            else:
+                self._counts["images_downloaded"] += 1
+                self._counts["bytes"] += size
+            self._record(images=1, size=0 if failed or cached else size)
+
+    def sku_done(self, sku, status, error=None, image_count=None):
+        '''
+        SKU finalizado com status "ok", "vazio" ou "erro". `image_count` só é
+        informado quando as imagens do SKU não geraram eventos próprios
+        (SKU processado em outra réplica).
+        '''
+        with self._lock:
+            self._counts["skus_done"] += 1
+            self._counts[{"ok": "skus_ok", "vazio": "skus_empty"}.get(status, "skus_failed")] += 1
+            images = 0
+            if image_count is not None:
+                images = image_count
+                self._expect(sku, image_count)
+                self._counts["images_done"] += image_count
+            else:
+                # SKU que terminou antes de conhecer a galeria (não encontrado, falha na ficha)
+                self._expect(sku, 0)
+            if status == "erro":
+                self._errors.append({"sku": sku, "erro": error or "Verifique o log para detalhes."})
+            self._record(images=images, skus=1)
+
+    def _rates(self, now):
+        # Média da janela; no início do job, do tempo decorrido (sem subestimar a taxa)
+        while self._events and now - self._events[0][0] > self.window_seconds:
+            self._events.popleft()
+        span = max(min(self.window_seconds, now - self.started_at), 1e-6)
+        images = sum(event[1] for event in self._events)
+        size = sum(event[2] for event in self._events)
+        skus = sum(event[3] for event in self._events)
+        return images / span, size / span, skus / span
+
+    def _eta(self, image_rate, sku_rate):
+        counts = self._counts
+        remaining_skus = counts["skus_total"] - counts["skus_done"]
+        if remaining_skus <= 0:
+            return 0.0
+        if image_rate > 0 and counts["skus_known"]:
+            # SKUs com galeria ainda desconhecida contam pela média de imagens dos já conhecidos
+            per_sku = counts["images_expected"] / counts["skus_known"]
+            remaining = (counts["images_expected"] - counts["images_done"]
+                         + max(counts["skus_total"] - counts["skus_known"], 0) * per_sku)
+            return max(remaining, 0) / image_rate
+        if sku_rate > 0:
+            return remaining_skus / sku_rate
+        return None
+
+    def snapshot(self):
+        '''Cópia da situação atual (contadores, taxas, tempo restante, em andamento e erros).'''
+        now = time.monotonic()
+        with self._lock:
+            image_rate, byte_rate, sku_rate = self._rates(now)
+            snapshot = dict(self._counts)
+            snapshot.update(
+                elapsed_seconds=now - self.started_at,
+                images_per_second=image_rate,
+                bytes_per_second=byte_rate,
+                skus_per_second=sku_rate,
+                eta_seconds=self._eta(image_rate, sku_rate),
+                in_flight=list(self._in_flight.values()),
+                errors=list(self._errors),
+            )
+        return snapshot
+
+
+def progress_fraction(snapshot):
+    '''Fração concluída (0 a 1): por imagem quando as galerias são conhecidas, senão por SKU.'''
+    if not snapshot["skus_total"]:
+        return 1.0
+    sku_fraction = snapshot["skus_done"] / snapshot["skus_total"]
+    if snapshot["skus_known"] and snapshot["images_expected"]:
+        # Estimativa do total de imagens, com os SKUs ainda desconhecidos pela média
+        estimated = snapshot["images_expected"] * snapshot["skus_total"] / snapshot["skus_known"]
+        return min(max(sku_fraction, snapshot["images_done"] / estimated), 1.0)
+    return min(sku_fraction, 1.0)
+
+
+def format_progress(snapshot):
+    '''Textos da situação para a interface: (resumo, taxa e tempo restante, em andamento).'''
+    summary = (f"SKUs: {snapshot['skus_done']}/{snapshot['skus_total']} "
+               f"({snapshot['skus_ok']} ok, {snapshot['skus_empty']} sem imagens, {snapshot['skus_failed']} com erro) · "
+               f"Imagens: {snapshot['images_done']}/{snapshot['images_expected']} "
+               f"({snapshot['images_downloaded']} baixadas, {snapshot['images_cached']} em cache, "
+               f"{snapshot['images_failed']} com erro)")
+    eta = snapshot["eta_seconds"]
+    rate = (f"{snapshot['images_per_second']:.1f} img/s · {snapshot['bytes_per_second'] / (1024 * 1024):.1f} MB/s · "
+            f"decorrido {format_duration(snapshot['elapsed_seconds'])} · "
+            f"restante {format_duration(eta) if eta is not None else 'calculando...'}")
+    in_flight = snapshot["in_flight"]
+    activity = ""
+    if in_flight:
+        activity = "Em andamento: " + ", ".join(in_flight[:PROGRESS_IN_FLIGHT_SHOWN])
+        if len(in_flight) > PROGRESS_IN_FLIGHT_SHOWN:
+            activity += f" e mais {len(in_flight) - PROGRESS_IN_FLIGHT_SHOWN}"
+    return summary, rate, activity
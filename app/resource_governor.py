@@ -0,0 +1,260 @@
+"""
+Controle da concorrência pela pressão de memória e de disco.
+
+O contêiner tem pouca memória: vários downloads em paralelo e os payloads
+base64 do upload em lote podem somar o bastante para o processo ser morto
+(OOM). Em vez de dimensionar a concorrência pelo pior caso, as etapas pesadas
+pedem uma vaga ao `ResourceGovernor`, que a cada `RESOURCE_SAMPLE_SECONDS`
+amostra o RSS do processo (e dos processos filhos do pool de imagens) e o
+espaço livre do volume:
+
+- normal: a etapa usa toda a concorrência configurada;
+- alta (RSS acima de `MEMORY_HIGH_WATERMARK` do limite): metade das vagas;
+- crítica (RSS acima de `MEMORY_CRITICAL_WATERMARK`, ou volume com menos de
+  `DISK_PAUSE_FREE_MB` livres): nenhuma vaga nova enquanto houver trabalho em
+  andamento — as etapas pausam e retomam quando a pressão baixa. Sem nada em
+  andamento, uma vaga é liberada, então o job nunca fica parado de vez.
+
+Na faixa crítica de disco, o governor pede ao orçamento de disco do diretório
+(`StorageBudget.make_room`) que despeje pastas já exportadas/enviadas até
+`DISK_PAUSE_FREE_MB` livres: o orçamento sozinho só despeja ao atingir a cota
+ou `STORAGE_MIN_FREE_MB`, e o job ficaria preso na faixa crítica.
+
+O limite de memória é `MEMORY_LIMIT_MB` ou, se não informado, o do cgroup do
+contêiner. Sem limite conhecido, só o espaço em disco é considerado.
+"""
+import glob
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from config import STORAGE_PATH, log_message
+from storage_budget import STORAGE_MIN_FREE_MB
+
+# Limite de memória do contêiner (0 = ler do cgroup)
+MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", "0"))
+# Frações do limite a partir das quais a concorrência cai pela metade / as etapas pausam
+MEMORY_HIGH_WATERMARK = float(os.getenv("MEMORY_HIGH_WATERMARK", "0.75"))
+MEMORY_CRITICAL_WATERMARK = float(os.getenv("MEMORY_CRITICAL_WATERMARK", "0.9"))
+# Espaço livre no volume abaixo do qual as etapas pausam (antes do mínimo do orçamento de disco)
+DISK_PAUSE_FREE_MB = int(os.getenv("DISK_PAUSE_FREE_MB", str(STORAGE_MIN_FREE_MB * 3)))
+# Intervalo (segundos) entre amostras de memória e disco
+RESOURCE_SAMPLE_SECONDS = float(os.getenv("RESOURCE_SAMPLE_SECONDS", "0.5"))
+
+LEVEL_NORMAL, LEVEL_HIGH, LEVEL_CRITICAL = "normal", "alta", "crítica"
+
+CGROUP_MEMORY_LIMIT_FILES = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+# cgroup v2: "cota período" (ou "max período"); v1: cota (-1 = sem limite) e período em arquivos separados
+CGROUP_CPU_MAX_FILE = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CPU_FILES = ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+
+def container_memory_limit():
+    '''Limite de memória do cgroup do contêiner (bytes), ou None se não houver.'''
+    for path in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 sem limite informa um valor enorme; v2 informa "max"
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def _read_cgroup_file(path):
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return None
+
+
+def container_cpu_quota():
+    '''
+    CPUs da cota do cgroup do contêiner (ex.: 0.5, 2.0), ou None se não houver.
+    Dentro do contêiner, os.cpu_count() informa as CPUs do host, não a cota.
+    '''
+    values = _read_cgroup_file(CGROUP_CPU_MAX_FILE)
+    if values is None:
+        quota, period = (_read_cgroup_file(path) for path in CGROUP_V1_CPU_FILES)
+        values = quota + period if quota and period else None
+    if not values or len(values) < 2 or not values[0].isdigit() or not values[1].isdigit() or not int(values[1]):
+        return None
+    return int(values[0]) / int(values[1])
+
+
+def _statm_rss(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * mmap.PAGESIZE
+
+
+def process_rss():
+    '''RSS (bytes) deste processo e dos processos filhos (pool de imagens), ou None se não der para medir.'''
+    try:
+        total = _statm_rss("self")
+    except OSError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        process = psutil.Process()
+        return process.memory_info().rss + sum(child.memory_info().rss for child in process.children())
+    for children_file in glob.glob("/proc/self/task/*/children"):
+        try:
+            with open(children_file) as f:
+                pids = f.read().split()
+        except OSError:
+            continue
+        for pid in pids:
+            try:
+                total += _statm_rss(pid)
+            except OSError:
+                pass
+    return total
+
+
+class ResourceGovernor:
+    '''
+    Vagas por etapa limitadas pela pressão de memória e de disco. Uso:
+    `with governor.slot("download", concorrência):` em volta do trabalho pesado.
+    Seguro entre threads; quem espera fica bloqueado até haver vaga.
+    '''
+
+    def __init__(self, memory_limit_bytes=None, storage_paths=(STORAGE_PATH,),
+                 min_free_bytes=DISK_PAUSE_FREE_MB * 1024 * 1024, sample_seconds=RESOURCE_SAMPLE_SECONDS):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.min_free_bytes = min_free_bytes
+        self.sample_seconds = sample_seconds
+        self._storage_paths = set(storage_paths)
+        # Diretório → StorageBudget que despeja pastas quando o disco fica crítico
+        self._budgets = {}
+        self._cond = threading.Condition()
+        self._active = Counter()
+        self._sampled_at = 0.0
+        self._level = LEVEL_NORMAL
+        self._rss_bytes = None
+        self._free_bytes = None
+
+    def watch_path(self, storage_path, budget=None):
+        '''
+        Passa a considerar o espaço livre de mais um diretório de armazenamento;
+        com `budget` (StorageBudget), pastas antigas dele são despejadas quando o
+        espaço livre cai abaixo do limite.
+        '''
+        with self._cond:
+            self._storage_paths.add(storage_path)
+            if budget is not None:
+                self._budgets[storage_path] = budget
+
+    def _free_space(self):
+        free = []
+        for storage_path in self._storage_paths:
+            try:
+                free.append(shutil.disk_usage(storage_path).free)
+            except OSError:
+                continue
+        return min(free) if free else None
+
+    def _sample(self):
+        # Chamado com o lock; amostra no máximo uma vez por intervalo
+        now = time.monotonic()
+        if now - self._sampled_at < self.sample_seconds:
+            return
+        self._sampled_at = now
+        self._rss_bytes = process_rss()
+        self._free_bytes = self._free_space()
+        if self._budgets and self._free_bytes is not None and self._free_bytes < self.min_free_bytes:
+            for budget in self._budgets.values():
+                budget.make_room(self.min_free_bytes)
+            self._free_bytes = self._free_space()
+
+        level, reason = LEVEL_NORMAL, ""
+        if self.memory_limit_bytes and self._rss_bytes is not None:
+            usage = self._rss_bytes / self.memory_limit_bytes
+            reason = (f"RSS {self._rss_bytes / 1024 / 1024:.0f} MB de "
+                      f"{self.memory_limit_bytes / 1024 / 1024:.0f} MB ({usage:.0%})")
+            if usage >= MEMORY_CRITICAL_WATERMARK:
+                level = LEVEL_CRITICAL
+            elif usage >= MEMORY_HIGH_WATERMARK:
+                level = LEVEL_HIGH
+        if self._free_bytes is not None and self._free_bytes < self.min_free_bytes:
+            level = LEVEL_CRITICAL
+            reason = f"{self._free_bytes / 1024 / 1024:.0f} MB livres no volume"
+
+        if level != self._level:
+            if level == LEVEL_NORMAL:
+                log_message(f"🧠 [RECURSOS] Pressão normalizada ({reason or 'sem limite de memória'}). Concorrência restaurada.")
+            elif level == LEVEL_HIGH:
+                log_message(f"🧠 [RECURSOS] Pressão alta: {reason}. Concorrência reduzida à metade.")
+            else:
+                log_message(f"⏸️ [RECURSOS] Pressão crítica: {reason}. Etapas pausadas até a pressão baixar.")
+            self._level = level
+
+    def _allowed(self, concurrency):
+        # Vagas da etapa no nível atual (None = sem limite próprio)
+        if self._level == LEVEL_CRITICAL:
+            return 0 if sum(self._active.values()) else 1
+        if self._level == LEVEL_HIGH and concurrency is not None:
+            return max(1, concurrency // 2)
+        return concurrency
+
+    @contextmanager
+    def slot(self, stage, concurrency=None):
+        '''
+        Ocupa uma vaga da etapa `stage` (com `concurrency` vagas configuradas;
+        None = só pausa na pressão crítica), esperando enquanto não houver.
+        '''
+        with self._cond:
+            while True:
+                self._sample()
+                allowed = self._allowed(concurrency)
+                if allowed is None or self._active[stage] < allowed:
+                    break
+                self._cond.wait(self.sample_seconds)
+            self._active[stage] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[stage] -= 1
+                self._cond.notify_all()
+
+    def status(self):
+        '''Situação atual: nível, RSS, limite de memória e espaço livre (bytes; None se desconhecido).'''
+        with self._cond:
+            self._sample()
+            return {"nivel": self._level, "rss_bytes": self._rss_bytes,
+                    "limite_bytes": self.memory_limit_bytes, "livre_bytes": self._free_bytes}
+
+
+def describe_pressure(status):
+    '''Aviso curto para a interface quando a pressão não está normal ("" se normal).'''
+    if status["nivel"] == LEVEL_NORMAL:
+        return ""
+    action = "concorrência reduzida" if status["nivel"] == LEVEL_HIGH else "etapas pausadas"
+    details = []
+    if status["rss_bytes"] is not None and status["limite_bytes"]:
+        details.append(f"memória {status['rss_bytes'] / 1024 / 1024:.0f}/{status['limite_bytes'] / 1024 / 1024:.0f} MB")
+    if status["livre_bytes"] is not None:
+        details.append(f"{status['livre_bytes'] / 1024 / 1024:.0f} MB livres no volume")
+    return f"🧠 Pressão {status['nivel']} ({', '.join(details)}): {action}"
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_resource_governor():
+    '''Retorna o ResourceGovernor do processo (compartilhado por todos os jobs).'''
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            limit = MEMORY_LIMIT_MB * 1024 * 1024 if MEMORY_LIMIT_MB else container_memory_limit()
+            _governor = ResourceGovernor(memory_limit_bytes=limit)
+        return _governor
@@ -0,0 +1,182 @@
+"""
+Escalonador de jobs concorrentes sobre o limite de requisições do Bling.
+
+Cada sessão Streamlit roda seu lote em paralelo com as demais, mas todas
+dividem o mesmo limite de requisições por conta. O escalonador:
+
+- espaça as requisições de cada conta conforme `BLING_RATE_LIMIT`;
+- reparte esse orçamento entre os jobs ativos da conta por peso
+  (stride scheduling): um job de prioridade "alta" recebe mais vez que um
+  "normal", mas nenhum job fica parado;
+- limita quantas requisições cada job pode ter em andamento ao mesmo tempo.
+
+Lotes pequenos recebem prioridade alta automaticamente, para que um pedido
+urgente de poucos SKUs não espere atrás de um lote de milhares.
+"""
+import os
+import threading
+import time
+
+from circuit_breaker import guarded_request
+from config import log_message
+
+BLING_RATE_LIMIT = float(os.getenv("BLING_RATE_LIMIT", "3"))
+# Lotes com até este número de SKUs são tratados como interativos (prioridade alta)
+SCHEDULER_INTERACTIVE_MAX_SKUS = int(os.getenv("SCHEDULER_INTERACTIVE_MAX_SKUS", "20"))
+# Pausa aplicada à conta inteira quando a API responde 429
+SCHEDULER_BACKOFF_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_SECONDS", "2"))
+
+# Prioridade → (peso na divisão do orçamento, requisições simultâneas por job)
+PRIORITIES = {
+    "alta": (8, 4),
+    "normal": (2, 3),
+    "baixa": (1, 2),
+}
+
+
+def priority_for_batch(sku_count):
+    '''Prioridade automática: lotes pequenos são interativos.'''
+    return "alta" if sku_count <= SCHEDULER_INTERACTIVE_MAX_SKUS else "normal"
+
+
+class JobTicket:
+    '''Participação de um job no escalonador.'''
+
+    def __init__(self, job_id, account, priority, vtime):
+        self.job_id = job_id
+        self.account = account
+        self.priority = priority
+        self.weight, self.max_concurrency = PRIORITIES[priority]
+        self.vtime = vtime
+        self.in_flight = 0
+        self.waiting = 0
+        self.granted = 0
+
+
+class JobScheduler:
+    '''Distribui o orçamento de requisições de cada conta entre os jobs ativos.'''
+
+    def __init__(self, rate_limit=BLING_RATE_LIMIT):
+        self.rate_limit = rate_limit
+        self.interval = 1.0 / rate_limit if rate_limit > 0 else 0.0
+        self._cond = threading.Condition()
+        self._tickets = []
+        self._next_slot = {}
+
+    def register(self, job_id, account, priority="normal"):
+        '''Inscreve um job; ele começa no tempo virtual dos jobs já ativos da conta (sem crédito acumulado).'''
+        with self._cond:
+            active = [t.vtime for t in self._tickets if t.account == account]
+            ticket = JobTicket(job_id, account, priority, min(active) if active else 0.0)
+            self._tickets.append(ticket)
+        log_message(f"🚦 [ESCALONADOR] Job {job_id} ({account}) inscrito com prioridade {priority}")
+        return ticket
+
+    def unregister(self, ticket):
+        '''Remove o job do escalonador (ao terminar).'''
+        with self._cond:
+            if ticket in self._tickets:
+                self._tickets.remove(ticket)
+            self._cond.notify_all()
+
+    def _is_next(self, ticket):
+        # Entre os jobs da conta que têm requisições esperando e estão abaixo do limite,
+        # a vez é do menor tempo virtual
+        candidates = [t for t in self._tickets
+                      if t.account == ticket.account and t.waiting and t.in_flight < t.max_concurrency]
+        return min(candidates, key=lambda t: (t.vtime, t.job_id)) is ticket
+
+    def acquire(self, ticket):
+        '''Aguarda a vez do job e o espaçamento da conta; reserva uma requisição.'''
+        with self._cond:
+            ticket.waiting += 1
+            try:
+                while True:
+                    if ticket.in_flight < ticket.max_concurrency and self._is_next(ticket):
+                        wait = self._next_slot.get(ticket.account, 0.0) - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                ticket.waiting -= 1
+            now = time.monotonic()
+            self._next_slot[ticket.account] = max(now, self._next_slot.get(ticket.account, 0.0)) + self.interval
+            ticket.in_flight += 1
+            ticket.granted += 1
+            ticket.vtime += 1.0 / ticket.weight
+            self._cond.notify_all()
+
+    def release(self, ticket):
+        '''Libera a requisição reservada por `acquire`.'''
+        with self._cond:
+            ticket.in_flight -= 1
+            self._cond.notify_all()
+
+    def backoff(self, account, seconds=SCHEDULER_BACKOFF_SECONDS):
+        '''Adia as próximas requisições da conta (ex.: após um 429).'''
+        with self._cond:
+            self._next_slot[account] = max(self._next_slot.get(account, 0.0), time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def set_rate_share(self, replicas):
+        '''Usa 1/`replicas` do limite de requisições (o restante fica para as outras réplicas).'''
+        with self._cond:
+            self.interval = replicas / self.rate_limit if self.rate_limit > 0 else 0.0
+            self._cond.notify_all()
+
+    def snapshot(self):
+        '''Jobs ativos e sua participação, para exibição.'''
+        with self._cond:
+            return [{"job": t.job_id, "conta": t.account, "prioridade": t.priority,
+                     "em_andamento": t.in_flight, "aguardando": t.waiting, "requisicoes": t.granted}
+                    for t in self._tickets]
+
+
+class ScheduledTokens:
+    '''
+    Envolve um TokenManager: cada tentativa HTTP passa pelo escalonador com o
+    ticket do job — a repetição após um 401 ocupa uma vaga própria. Os demais
+    atributos são os do TokenManager.
+    '''
+
+    def __init__(self, tokens, scheduler, ticket):
+        self._tokens = tokens
+        self.scheduler = scheduler
+        self.ticket = ticket
+
+    @property
+    def request_count(self):
+        '''Requisições feitas por este job (o TokenManager é compartilhado entre jobs).'''
+        return self.ticket.granted
+
+    def __getattr__(self, name):
+        return getattr(self._tokens, name)
+
+    def request(self, method, url, **kwargs):
+        return self._tokens.request(method, url, send=self._send, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        self.scheduler.acquire(self.ticket)
+        try:
+            response = guarded_request(method, url, **kwargs)
+        finally:
+            self.scheduler.release(self.ticket)
+        if response.status_code == 429:
+            log_message(f"⚠️ [ESCALONADOR] 429 na conta {self.ticket.account}. Pausando novas requisições...")
+            self.scheduler.backoff(self.ticket.account)
+        return response
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    '''Retorna o escalonador compartilhado pelo processo (todas as sessões).'''
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+        return _scheduler
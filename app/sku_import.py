@@ -0,0 +1,231 @@
+"""
+Importação de listas de SKUs (CSV, XLSX ou TXT) direto para um job.
+
+O arquivo é lido em streaming, linha a linha, e os SKUs entram no job em
+lotes de `SKU_IMPORT_CHUNK_SIZE` — catálogos de dezenas de milhares de SKUs
+não passam inteiros pela memória nem pela sessão do Streamlit. Cada valor é:
+
+- normalizado: espaços nas pontas, aspas, BOM e caracteres invisíveis
+  removidos; números do Excel (ex.: 12345.0), seja célula numérica do XLSX ou
+  texto salvo no CSV/TXT, viram "12345";
+- validado: sem espaços ou caracteres de controle e com até `SKU_MAX_LENGTH`
+  caracteres (limite do código no Bling);
+- deduplicado (a primeira ocorrência fica);
+- conferido no índice local (SKUs com pasta no volume ou já encontrados na
+  conta de origem), opcionalmente descartando os desconhecidos.
+
+CSV: a coluna de SKU é achada pelo cabeçalho ("sku", "codigo", "código"...)
+ou é a primeira; o separador (vírgula, ponto e vírgula, tab ou barra) é
+detectado na primeira linha. XLSX exige o pacote openpyxl (primeira planilha).
+"""
+import csv
+import io
+import itertools
+import os
+import re
+import unicodedata
+
+from config import log_message
+
+# SKUs gravados no job por transação
+SKU_IMPORT_CHUNK_SIZE = int(os.getenv("SKU_IMPORT_CHUNK_SIZE", "1000"))
+# Codificação dos arquivos CSV/TXT (utf-8-sig aceita o BOM do Excel; use cp1252 para CSVs antigos)
+SKU_IMPORT_ENCODING = os.getenv("SKU_IMPORT_ENCODING", "utf-8-sig")
+# Tamanho máximo do código do produto no Bling
+SKU_MAX_LENGTH = int(os.getenv("SKU_MAX_LENGTH", "60"))
+
+SKU_COLUMN_NAMES = ("sku", "codigo", "código", "cod", "code", "referencia", "referência")
+SKU_IMPORT_FORMATS = ("csv", "xlsx", "txt")
+# Valores inválidos guardados no relatório (o restante só entra na contagem)
+INVALID_SAMPLES = 20
+
+INVISIBLE_CHARS = re.compile(r"[\u200b\u200c\u200d\u2060\ufeff]")
+INVALID_SKU_CHARS = re.compile(r"[\s\x00-\x1f\x7f\ufffd]")
+# Inteiro exportado como número decimal pela planilha (ex.: "12345.0")
+SPREADSHEET_INTEGER = re.compile(r"(\d+)\.0+")
+
+
+class SkuImportError(ValueError):
+    '''Arquivo de SKUs ilegível (formato não suportado, dependência ausente).'''
+
+
+def import_format(file_name):
+    '''Formato do arquivo pela extensão ("csv", "xlsx" ou "txt").'''
+    extension = os.path.splitext(file_name or "")[1].lower().lstrip(".")
+    if extension not in SKU_IMPORT_FORMATS:
+        raise SkuImportError(f"Formato .{extension} não suportado (use {', '.join(SKU_IMPORT_FORMATS)})")
+    return extension
+
+
+def normalize_sku(value):
+    '''SKU normalizado ("" para células vazias).'''
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = unicodedata.normalize("NFC", INVISIBLE_CHARS.sub("", str(value))).strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        text = text[1:-1].strip()
+    integer = SPREADSHEET_INTEGER.fullmatch(text)
+    return integer.group(1) if integer else text
+
+
+def sku_problem(sku):
+    '''Motivo pelo qual o SKU normalizado é inválido, ou None.'''
+    if len(sku) > SKU_MAX_LENGTH:
+        return f"mais de {SKU_MAX_LENGTH} caracteres"
+    if INVALID_SKU_CHARS.search(sku):
+        return "contém espaços ou caracteres de controle"
+    return None
+
+
+def _sku_column(header, column):
+    # Índice da coluna de SKU: a informada (nome ou número a partir de 1) ou pelo cabeçalho
+    names = [normalize_sku(cell).lower() for cell in header]
+    if column:
+        if str(column).isdigit():
+            return int(column) - 1, False
+        if column.lower() not in names:
+            raise SkuImportError(f"Coluna {column} não encontrada no cabeçalho")
+        return names.index(column.lower()), True
+    for index, name in enumerate(names):
+        if name in SKU_COLUMN_NAMES:
+            return index, True
+    return 0, False
+
+
+def _iter_rows_column(rows, column):
+    # (linha, valor) da coluna de SKU; o cabeçalho, se reconhecido, não entra
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    index, has_header = _sku_column(first, column)
+    if not has_header:
+        rows = itertools.chain([first], rows)
+    for line, row in enumerate(rows, start=2 if has_header else 1):
+        yield line, row[index] if index < len(row) else None
+
+
+def _iter_csv(stream, column):
+    text = io.TextIOWrapper(stream, encoding=SKU_IMPORT_ENCODING, errors="replace", newline="")
+    first_line = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from _iter_rows_column(csv.reader(itertools.chain([first_line], text), dialect), column)
+    except csv.Error as e:
+        raise SkuImportError(f"Arquivo CSV inválido: {e}") from e
+
+
+def _iter_txt(stream):
+    text = io.TextIOWrapper(stream, encoding=SKU_IMPORT_ENCODING, errors="replace")
+    for line, value in enumerate(text, start=1):
+        yield line, value
+
+
+def _iter_xlsx(stream, column):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise SkuImportError("Leitura de XLSX requer o pacote openpyxl (pip install openpyxl)") from e
+    # read_only: as linhas são lidas do arquivo sob demanda, sem carregar a planilha inteira
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise SkuImportError(f"Arquivo XLSX inválido: {e}") from e
+    try:
+        yield from _iter_rows_column(workbook.active.iter_rows(values_only=True), column)
+    finally:
+        workbook.close()
+
+
+def iter_sku_values(stream, file_name, column=None):
+    '''
+    Valores brutos da coluna de SKU, em streaming: pares (linha, valor).
+    `stream` é um arquivo binário; `column` escolhe a coluna do CSV/XLSX.
+    '''
+    file_format = import_format(file_name)
+    if file_format == "csv":
+        return _iter_csv(stream, column)
+    if file_format == "xlsx":
+        return _iter_xlsx(stream, column)
+    return _iter_txt(stream)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_skus(store, stream, file_name, account, kind="download", column=None, known_only=False,
+                dry_run=False, chunk_size=SKU_IMPORT_CHUNK_SIZE):
+    '''
+    Lê, normaliza, valida e deduplica os SKUs do arquivo e os grava num job novo
+    (`kind`, conta `account`), em lotes. Com `known_only`, só entram SKUs do
+    índice local; com `dry_run`, nada é gravado.
+
+    Retorna o relatório: {"job_id", "read", "blank", "invalid", "duplicates",
+    "known", "unknown_skipped", "imported", "invalid_samples"}.
+    '''
+    report = {"job_id": None, "read": 0, "blank": 0, "invalid": 0, "duplicates": 0, "known": 0,
+              "unknown_skipped": 0, "imported": 0, "invalid_samples": []}
+    seen = set()
+
+    def valid_skus():
+        for line, value in iter_sku_values(stream, file_name, column):
+            report["read"] += 1
+            sku = normalize_sku(value)
+            if not sku:
+                report["blank"] += 1
+                continue
+            problem = sku_problem(sku)
+            if problem:
+                report["invalid"] += 1
+                if len(report["invalid_samples"]) < INVALID_SAMPLES:
+                    report["invalid_samples"].append({"linha": line, "valor": sku[:80], "motivo": problem})
+                continue
+            if sku in seen:
+                report["duplicates"] += 1
+                continue
+            seen.add(sku)
+            yield sku
+
+    if not dry_run:
+        report["job_id"] = store.create_job(kind, [], account=account)
+    try:
+        for chunk in _chunks(valid_skus(), chunk_size):
+            known = store.known_skus(chunk, account)
+            report["known"] += len(known)
+            if known_only:
+                report["unknown_skipped"] += len(chunk) - len(known)
+                chunk = [sku for sku in chunk if sku in known]
+            if not dry_run:
+                store.add_job_skus(report["job_id"], chunk)
+            report["imported"] += len(chunk)
+    except Exception:
+        # Arquivo ilegível no meio da leitura: o job parcial não deve ser processado
+        if report["job_id"]:
+            store.finish_job(report["job_id"], status="erro")
+        raise
+
+    log_message(f"📄 [IMPORTAÇÃO] {file_name}: {report['read']} linhas, {report['imported']} SKUs "
+                f"{'válidos' if dry_run else 'no job ' + str(report['job_id'])} ({report['duplicates']} repetidos, "
+                f"{report['invalid']} inválidos, {report['known']} já conhecidos)")
+    return report
+
+
+def format_import_report(report):
+    '''Resumo do relatório de importação em uma linha.'''
+    summary = (f"{report['imported']} SKUs importados de {report['read']} linhas "
+               f"({report['duplicates']} repetidos, {report['invalid']} inválidos, {report['blank']} vazios; "
+               f"{report['known']} já conhecidos localmente")
+    if report["unknown_skipped"]:
+        summary += f", {report['unknown_skipped']} desconhecidos descartados"
+    return summary + ")"
@@ -0,0 +1,536 @@
+"""
+Banco SQLite (modo WAL) com o estado persistente da aplicação:
+
+- jobs / sku_status: lotes executados e situação de cada SKU;
+- image_manifest: imagens já salvas por SKU (consultas de "já baixada?" sem stat em disco);
+- url_index: link normalizado → arquivo já salvo (reaproveita imagens entre SKUs);
+- api_cache: respostas da API do Bling com data de obtenção (para TTL);
+- sku_usage: último uso de cada pasta de SKU e se já foi exportada/enviada (para despejo LRU);
+- api_usage: chamadas à API do Bling por conta e por dia (cota diária);
+- job_queue / sku_leases / workers: jobs distribuídos entre réplicas, SKUs
+  reservados por cada worker (com validade) e último sinal de vida de cada worker.
+
+Cada thread usa sua própria conexão. Gravações em lote usam uma única transação.
+Com réplicas em máquinas diferentes sobre um volume de rede, use
+`STATE_DB_JOURNAL_MODE=DELETE` (o WAL exige memória compartilhada entre os processos).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from config import STORAGE_PATH
+
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join(STORAGE_PATH, "state.db"))
+
+# Modo de journal do SQLite: WAL (uma máquina) ou DELETE (volume compartilhado entre máquinas)
+STATE_DB_JOURNAL_MODE = os.getenv("STATE_DB_JOURNAL_MODE", "WAL").upper()
+
+# Validade (segundos) das respostas da API guardadas em cache
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    account TEXT,
+    status TEXT NOT NULL,
+    total_skus INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+
+CREATE TABLE IF NOT EXISTS sku_status (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    sku TEXT NOT NULL,
+    status TEXT NOT NULL,
+    product_id INTEGER,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (job_id, sku)
+);
+CREATE INDEX IF NOT EXISTS idx_sku_status_sku ON sku_status(sku);
+CREATE INDEX IF NOT EXISTS idx_sku_status_job_status ON sku_status(job_id, status);
+
+CREATE TABLE IF NOT EXISTS image_manifest (
+    sku TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    url_key TEXT,
+    local_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    downloaded_at TEXT NOT NULL,
+    PRIMARY KEY (sku, file_name)
+);
+CREATE INDEX IF NOT EXISTS idx_manifest_url_key ON image_manifest(url_key);
+
+CREATE TABLE IF NOT EXISTS url_index (
+    url_key TEXT PRIMARY KEY,
+    blob_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS api_cache (
+    cache_key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sku_usage (
+    sku TEXT PRIMARY KEY,
+    last_used_at REAL NOT NULL,
+    exported_at TEXT,
+    uploaded_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sku_usage_last_used ON sku_usage(last_used_at);
+
+CREATE TABLE IF NOT EXISTS api_usage (
+    day TEXT NOT NULL,
+    account TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, account)
+);
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    job_id INTEGER PRIMARY KEY REFERENCES jobs(id),
+    storage_path TEXT NOT NULL,
+    priority TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sku_leases (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    sku TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (job_id, sku)
+);
+CREATE INDEX IF NOT EXISTS idx_sku_leases_owner ON sku_leases(owner);
+
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    '''Acesso ao banco de estado (uma conexão por thread).'''
+
+    def __init__(self, db_path=STATE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={STATE_DB_JOURNAL_MODE}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # --- Jobs e situação dos SKUs ---
+    def create_job(self, kind, skus, account=None):
+        '''Cria um job com todos os SKUs como "pendente" (uma transação). Retorna o ID.'''
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, account, status, total_skus, created_at) VALUES (?, ?, 'executando', ?, ?)",
+                (kind, account, len(skus), now))
+            job_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO sku_status (job_id, sku, status, updated_at) VALUES (?, ?, 'pendente', ?)",
+                [(job_id, sku, now) for sku in skus])
+        return job_id
+
+    def add_job_skus(self, job_id, skus):
+        '''Acrescenta SKUs "pendente" a um job (uma transação por lote). Retorna quantos eram novos no job.'''
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO sku_status (job_id, sku, status, updated_at) VALUES (?, ?, 'pendente', ?)",
+                [(job_id, sku, now) for sku in skus])
+            added = conn.total_changes - before
+            conn.execute("UPDATE jobs SET total_skus = total_skus + ? WHERE id = ?", (added, job_id))
+        return added
+
+    def update_sku_status(self, job_id, sku, status, image_count=0, error=None, product_id=None):
+        '''Atualiza a situação de um SKU dentro de um job.'''
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE sku_status SET status = ?, image_count = ?, error = ?, product_id = COALESCE(?, product_id), "
+                "updated_at = ? WHERE job_id = ? AND sku = ?",
+                (status, image_count, error, product_id, datetime.now().isoformat(), job_id, sku))
+
+    def finish_job(self, job_id, status="concluido"):
+        '''Marca o job como finalizado.'''
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                         (status, datetime.now().isoformat(), job_id))
+
+    def recent_jobs(self, limit=10):
+        '''Últimos jobs com a contagem de SKUs por situação.'''
+        rows = self._connection().execute(
+            """
+            SELECT j.id, j.kind, j.account, j.status, j.total_skus, j.created_at, j.finished_at,
+                   SUM(s.status = 'ok') AS ok, SUM(s.status = 'erro') AS erro,
+                   SUM(s.status = 'vazio') AS vazio, SUM(s.status = 'pendente') AS pendente
+            FROM jobs j LEFT JOIN sku_status s ON s.job_id = j.id
+            GROUP BY j.id ORDER BY j.id DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def job_skus(self, job_id, status=None):
+        '''SKUs de um job (opcionalmente filtrados pela situação).'''
+        if status is None:
+            rows = self._connection().execute(
+                "SELECT sku FROM sku_status WHERE job_id = ? ORDER BY rowid", (job_id,)).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT sku FROM sku_status WHERE job_id = ? AND status = ? ORDER BY rowid", (job_id, status)).fetchall()
+        return [row["sku"] for row in rows]
+
+    def job_sku_count(self, job_id):
+        '''Total de SKUs do job.'''
+        row = self._connection().execute("SELECT total_skus FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["total_skus"] if row else 0
+
+    def iter_job_skus(self, job_id, chunk_size=500):
+        '''SKUs de um job em lotes de `chunk_size`, na ordem de inclusão (sem carregar o job inteiro).'''
+        last_rowid = 0
+        while True:
+            rows = self._connection().execute(
+                "SELECT rowid, sku FROM sku_status WHERE job_id = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (job_id, last_rowid, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1]["rowid"]
+            yield [row["sku"] for row in rows]
+
+    def known_skus(self, skus, account):
+        '''SKUs de `skus` já conhecidos localmente: com pasta no volume ou encontrados na conta `account`.'''
+        skus = list(skus)
+        known = set()
+        conn = self._connection()
+        for start in range(0, len(skus), 500):
+            batch = skus[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            known.update(row["sku"] for row in conn.execute(
+                f"SELECT sku FROM sku_usage WHERE sku IN ({marks})", batch))
+            cache_keys = {f"{account}:codigo:{sku}": sku for sku in batch}
+            known.update(cache_keys[row["cache_key"]] for row in conn.execute(
+                f"SELECT cache_key FROM api_cache WHERE cache_key IN ({marks})", list(cache_keys)))
+        return known
+
+    # --- Manifesto de imagens e índice URL → arquivo ---
+    def sku_manifest(self, sku):
+        '''Imagens já salvas de um SKU: nome do arquivo → registro.'''
+        rows = self._connection().execute(
+            "SELECT file_name, url_key, local_path, size FROM image_manifest WHERE sku = ?", (sku,)).fetchall()
+        return {row["file_name"]: dict(row) for row in rows}
+
+    def record_images(self, sku, images):
+        '''
+        Registra imagens salvas de um SKU (uma transação para o lote).
+        `images`: lista de dicts com file_name, url_key, local_path e size.
+        '''
+        if not images:
+            return
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO image_manifest (sku, file_name, url_key, local_path, size, downloaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(sku, img["file_name"], img.get("url_key"), img["local_path"], img["size"], now) for img in images])
+            conn.executemany(
+                "INSERT OR REPLACE INTO url_index (url_key, blob_path, size, updated_at) VALUES (?, ?, ?, ?)",
+                [(img["url_key"], img["local_path"], img["size"], now) for img in images if img.get("url_key")])
+
+    def import_sku_directory(self, sku, sku_path):
+        '''
+        Registra no manifesto os arquivos de uma pasta de SKU criada antes do banco
+        existir (uma única listagem do diretório). Retorna o manifesto resultante.
+        '''
+        images = []
+        try:
+            with os.scandir(sku_path) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        images.append({"file_name": entry.name, "url_key": None,
+                                       "local_path": entry.path, "size": entry.stat().st_size})
+        except FileNotFoundError:
+            return {}
+        self.record_images(sku, images)
+        return {img["file_name"]: img for img in images}
+
+    def redirect_duplicates(self, sku, duplicates):
+        '''
+        Aponta as imagens descartadas como quase duplicadas (caminho → caminho da
+        cópia mantida) para a cópia mantida. Continuam no manifesto, para não serem
+        baixadas de novo, mas sem bytes próprios em disco.
+        '''
+        with self._connection() as conn:
+            for duplicate, kept in duplicates.items():
+                conn.execute(
+                    "UPDATE url_index SET blob_path = ?, size = (SELECT size FROM image_manifest "
+                    "WHERE sku = ? AND local_path = ? AND size > 0 LIMIT 1) WHERE blob_path = ?",
+                    (kept, sku, kept, duplicate))
+                conn.execute("UPDATE image_manifest SET local_path = ?, size = 0 WHERE sku = ? AND local_path = ?",
+                             (kept, sku, duplicate))
+
+    def lookup_blob(self, url_key):
+        '''Arquivo já salvo para um link normalizado (ou None).'''
+        row = self._connection().execute(
+            "SELECT blob_path, size FROM url_index WHERE url_key = ?", (url_key,)).fetchone()
+        return dict(row) if row else None
+
+    def total_image_bytes(self):
+        '''Total de bytes das imagens registradas no manifesto.'''
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM image_manifest").fetchone()[0]
+
+    def image_files(self):
+        '''Caminho e tamanho de cada imagem do manifesto (hard links aparecem uma vez por caminho).'''
+        return [(row["local_path"], row["size"])
+                for row in self._connection().execute("SELECT local_path, size FROM image_manifest")]
+
+    def average_image_size(self):
+        '''Tamanho médio (bytes) das imagens do manifesto, ou None se ainda não há imagens.'''
+        return self._connection().execute("SELECT AVG(size) FROM image_manifest WHERE size > 0").fetchone()[0]
+
+    def average_images_per_sku(self):
+        '''Média de imagens por SKU baixado com sucesso, ou None sem histórico.'''
+        return self._connection().execute(
+            "SELECT AVG(image_count) FROM sku_status WHERE status = 'ok'").fetchone()[0]
+
+    # --- Uso das pastas de SKU (despejo LRU) ---
+    def touch_skus(self, skus):
+        '''Atualiza o último uso das pastas dos SKUs.'''
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO sku_usage (sku, last_used_at) VALUES (?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET last_used_at = excluded.last_used_at",
+                [(sku, now) for sku in skus])
+
+    def mark_sku_exported(self, skus):
+        '''Marca as pastas dos SKUs como exportadas (podem ser despejadas).'''
+        self._mark_skus(skus, "exported_at")
+
+    def mark_sku_uploaded(self, skus):
+        '''Marca os SKUs como enviados ao destino (podem ser despejados).'''
+        self._mark_skus(skus, "uploaded_at")
+
+    def _mark_skus(self, skus, column):
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.executemany(
+                f"INSERT INTO sku_usage (sku, last_used_at, {column}) VALUES (?, ?, ?) "
+                f"ON CONFLICT(sku) DO UPDATE SET {column} = excluded.{column}",
+                [(sku, time.time(), now) for sku in skus])
+
+    def eviction_candidates(self):
+        '''SKUs já exportados ou enviados, do menos para o mais recentemente usado, com seus bytes.'''
+        rows = self._connection().execute(
+            """
+            SELECT u.sku, u.last_used_at, COALESCE(SUM(m.size), 0) AS bytes
+            FROM sku_usage u LEFT JOIN image_manifest m ON m.sku = u.sku
+            WHERE u.exported_at IS NOT NULL OR u.uploaded_at IS NOT NULL
+            GROUP BY u.sku ORDER BY u.last_used_at ASC
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove_sku(self, sku):
+        '''Remove o manifesto de um SKU e as entradas do índice de URLs que apontam para seus arquivos.'''
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM url_index WHERE blob_path IN (SELECT local_path FROM image_manifest WHERE sku = ?)", (sku,))
+            conn.execute("DELETE FROM image_manifest WHERE sku = ?", (sku,))
+            conn.execute("DELETE FROM sku_usage WHERE sku = ?", (sku,))
+
+    # --- Uso diário da API ---
+    def record_api_calls(self, account, calls):
+        '''Soma `calls` chamadas à API no contador do dia da conta.'''
+        if not calls:
+            return
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO api_usage (day, account, calls) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, account) DO UPDATE SET calls = calls + excluded.calls",
+                (datetime.now().date().isoformat(), account, calls))
+
+    def api_calls_today(self, account):
+        '''Chamadas à API registradas hoje para a conta.'''
+        row = self._connection().execute(
+            "SELECT calls FROM api_usage WHERE day = ? AND account = ?",
+            (datetime.now().date().isoformat(), account)).fetchone()
+        return row["calls"] if row else 0
+
+    # --- Jobs distribuídos entre réplicas (reservas com validade) ---
+    def enqueue_job(self, job_id, storage_path, priority):
+        '''Abre o job para os workers de todas as réplicas.'''
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO job_queue (job_id, storage_path, priority) VALUES (?, ?, ?)",
+                         (job_id, storage_path, priority))
+
+    def claim_skus(self, owner, limit, lease_seconds, job_id=None):
+        '''
+        Reserva até `limit` SKUs pendentes de um job da fila (o mais antigo, ou
+        `job_id`) para o worker `owner`. SKUs com reserva vencida (worker parado)
+        podem ser reservados de novo. A seleção e a reserva acontecem numa única
+        transação com trava de escrita, então dois workers nunca recebem o mesmo SKU.
+
+        Retorna {"job_id", "account", "storage_path", "priority", "skus"} ou None.
+        '''
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            jobs = conn.execute(
+                """
+                SELECT q.job_id, q.storage_path, q.priority, j.account FROM job_queue q
+                JOIN jobs j ON j.id = q.job_id
+                WHERE j.status = 'executando' AND (? IS NULL OR q.job_id = ?) ORDER BY q.job_id
+                """, (job_id, job_id)).fetchall()
+            for job in jobs:
+                rows = conn.execute(
+                    """
+                    SELECT s.sku FROM sku_status s
+                    LEFT JOIN sku_leases l ON l.job_id = s.job_id AND l.sku = s.sku
+                    WHERE s.job_id = ? AND s.status = 'pendente' AND (l.sku IS NULL OR l.expires_at < ?)
+                    ORDER BY s.rowid LIMIT ?
+                    """, (job["job_id"], now, limit)).fetchall()
+                if not rows:
+                    continue
+                skus = [row["sku"] for row in rows]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sku_leases (job_id, sku, owner, expires_at) VALUES (?, ?, ?, ?)",
+                    [(job["job_id"], sku, owner, now + lease_seconds) for sku in skus])
+                conn.execute("COMMIT")
+                return {"job_id": job["job_id"], "account": job["account"], "storage_path": job["storage_path"],
+                        "priority": job["priority"], "skus": skus}
+            conn.execute("COMMIT")
+            return None
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renew_leases(self, owner, lease_seconds):
+        '''Estende todas as reservas do worker (sinal de vida). Retorna quantas havia.'''
+        with self._connection() as conn:
+            return conn.execute("UPDATE sku_leases SET expires_at = ? WHERE owner = ?",
+                                (time.time() + lease_seconds, owner)).rowcount
+
+    def complete_leased_sku(self, owner, job_id, sku, status, image_count=0, error=None):
+        '''
+        Grava o resultado de um SKU reservado e libera a reserva, só se ela ainda
+        pertence a `owner` (se venceu e outro worker a assumiu, o resultado é
+        descartado). Retorna True se gravou.
+        '''
+        with self._connection() as conn:
+            deleted = conn.execute("DELETE FROM sku_leases WHERE job_id = ? AND sku = ? AND owner = ?",
+                                   (job_id, sku, owner)).rowcount
+            if deleted:
+                conn.execute(
+                    "UPDATE sku_status SET status = ?, image_count = ?, error = ?, updated_at = ? "
+                    "WHERE job_id = ? AND sku = ?",
+                    (status, image_count, error, datetime.now().isoformat(), job_id, sku))
+            return bool(deleted)
+
+    def release_leases(self, owner, job_id, skus):
+        '''Libera reservas do worker sobre SKUs do job, para outros workers assumirem na hora.'''
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM sku_leases WHERE owner = ? AND job_id = ? AND sku = ?",
+                             [(owner, job_id, sku) for sku in skus])
+
+    def finish_job_if_done(self, job_id):
+        '''Finaliza o job (e o tira da fila) quando não resta SKU pendente. Retorna True se finalizou.'''
+        with self._connection() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM sku_status WHERE job_id = ? AND status = 'pendente'",
+                                   (job_id,)).fetchone()[0]
+            if pending:
+                return False
+            conn.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+            conn.execute("UPDATE jobs SET status = 'concluido', finished_at = ? WHERE id = ? AND status = 'executando'",
+                         (datetime.now().isoformat(), job_id))
+            return True
+
+    def job_results(self, job_id):
+        '''Situação e total de imagens de cada SKU do job: SKU → (status, imagens).'''
+        rows = self._connection().execute(
+            "SELECT sku, status, image_count FROM sku_status WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["sku"]: (row["status"], row["image_count"]) for row in rows}
+
+    def touch_worker(self, worker_id):
+        '''Registra o sinal de vida do worker.'''
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (worker_id, last_seen) VALUES (?, ?)",
+                         (worker_id, time.time()))
+
+    def live_workers(self, window):
+        '''Workers com sinal de vida nos últimos `window` segundos.'''
+        rows = self._connection().execute(
+            "SELECT worker_id FROM workers WHERE last_seen >= ?", (time.time() - window,)).fetchall()
+        return [row["worker_id"] for row in rows]
+
+    def leased_skus(self, job_id):
+        '''SKUs do job reservados agora: lista de (SKU, worker).'''
+        rows = self._connection().execute(
+            "SELECT sku, owner FROM sku_leases WHERE job_id = ? AND expires_at > ? ORDER BY sku",
+            (job_id, time.time())).fetchall()
+        return [(row["sku"], row["owner"]) for row in rows]
+
+    def lease_snapshot(self):
+        '''SKUs reservados por worker e job, para exibição.'''
+        rows = self._connection().execute(
+            """
+            SELECT owner, job_id, COUNT(*) AS skus, MIN(expires_at) AS expires_at
+            FROM sku_leases GROUP BY owner, job_id ORDER BY job_id
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Cache de respostas da API ---
+    def cache_get(self, cache_key, ttl=API_CACHE_TTL):
+        '''Resposta em cache, se obtida há menos de `ttl` segundos (ou None).'''
+        row = self._connection().execute(
+            "SELECT payload, fetched_at FROM api_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None or time.time() - row["fetched_at"] > ttl:
+            return None
+        return json.loads(row["payload"])
+
+    def cache_set(self, cache_key, payload):
+        '''Guarda uma resposta da API no cache.'''
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO api_cache (cache_key, payload, fetched_at) VALUES (?, ?, ?)",
+                         (cache_key, json.dumps(payload), time.time()))
+
+    def cached_call(self, cache_key, fn, ttl=API_CACHE_TTL):
+        '''Retorna a resposta em cache ou executa `fn()` e guarda o resultado (None não é guardado).'''
+        payload = self.cache_get(cache_key, ttl)
+        if payload is not None:
+            return payload
+        payload = fn()
+        if payload is not None:
+            self.cache_set(cache_key, payload)
+        return payload
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    '''Retorna o StateStore compartilhado pelo processo.'''
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+        return _store
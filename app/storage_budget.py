@@ -0,0 +1,199 @@
+"""
+Orçamento de disco do volume de armazenamento.
+
+Controla os bytes usados pelas imagens (pelo manifesto do banco de estado),
+aplica uma cota configurável e, quando falta espaço, despeja as pastas de SKU
+menos usadas recentemente que já foram exportadas ou enviadas ao destino.
+Se nem o despejo libera espaço, a gravação é recusada com StorageFullError
+antes de o volume encher.
+
+Imagens reaproveitadas entre SKUs são hard links do mesmo arquivo: o uso conta
+cada arquivo físico (st_dev, st_ino) uma vez, e o despejo de um SKU só libera
+os bytes dos arquivos que não têm outro link.
+
+O uso é medido no manifesto uma única vez, ao criar o orçamento (um por
+diretório e processo); depois acompanha as reservas, devoluções e despejos,
+sem percorrer o volume de novo a cada job ou lote.
+"""
+import os
+import shutil
+import threading
+from collections import Counter, defaultdict
+
+from config import STORAGE_PATH, log_message
+
+# Cota para as imagens e espaço livre mínimo a manter no volume
+STORAGE_QUOTA_MB = int(os.getenv("STORAGE_QUOTA_MB", "900"))
+STORAGE_MIN_FREE_MB = int(os.getenv("STORAGE_MIN_FREE_MB", "50"))
+
+
+class StorageFullError(Exception):
+    '''Não há espaço no orçamento de disco, mesmo após o despejo de pastas antigas.'''
+
+
+def file_identities(paths):
+    '''
+    Identidade física (st_dev, st_ino) de cada caminho existente, com uma
+    listagem por pasta (o inode vem da listagem, sem um stat por arquivo).
+    '''
+    by_directory = defaultdict(set)
+    for path in paths:
+        by_directory[os.path.dirname(path)].add(os.path.basename(path))
+    identities = {}
+    for directory, names in by_directory.items():
+        try:
+            device = os.stat(directory or ".").st_dev
+            with os.scandir(directory or ".") as entries:
+                for entry in entries:
+                    if entry.name in names:
+                        identities[os.path.join(directory, entry.name)] = (device, entry.inode())
+        except OSError:
+            continue
+    return identities
+
+
+def unique_file_bytes(files):
+    '''Bytes em disco de uma lista (caminho, tamanho): cada arquivo físico conta uma vez; ausentes não contam.'''
+    files = list(files)
+    identities = file_identities(path for path, _ in files)
+    sizes = {}
+    for path, size in files:
+        identity = identities.get(os.path.join(os.path.dirname(path), os.path.basename(path)))
+        if identity is not None:
+            sizes[identity] = max(sizes.get(identity, 0), size)
+    return sum(sizes.values())
+
+
+class StorageBudget:
+    '''Reserva espaço para novas imagens, despejando pastas LRU quando necessário.'''
+
+    def __init__(self, store, storage_path=STORAGE_PATH, quota_bytes=STORAGE_QUOTA_MB * 1024 * 1024,
+                 min_free_bytes=STORAGE_MIN_FREE_MB * 1024 * 1024):
+        self.store = store
+        self.storage_path = storage_path
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self._lock = threading.Lock()
+        self._used_bytes = unique_file_bytes(store.image_files())
+        # SKU → número de jobs em andamento que o usam
+        self._protected_skus = Counter()
+
+    def used_bytes(self):
+        '''Bytes ocupados pelas imagens registradas.'''
+        return self._used_bytes
+
+    def free_bytes(self):
+        '''Espaço livre real no volume.'''
+        return shutil.disk_usage(self.storage_path).free
+
+    def protect(self, skus):
+        '''
+        Impede o despejo das pastas dos SKUs em uso pelo job atual. Cada
+        `protect` conta uma referência: com dois jobs no mesmo SKU, a pasta só
+        volta a ser despejável depois do `unprotect` de ambos.
+        '''
+        with self._lock:
+            self._protected_skus.update(set(skus))
+
+    def unprotect(self, skus):
+        '''Libera as referências tomadas por `protect` com os mesmos SKUs.'''
+        with self._lock:
+            for sku in set(skus):
+                self._protected_skus[sku] -= 1
+                if self._protected_skus[sku] <= 0:
+                    del self._protected_skus[sku]
+
+    def _fits(self, num_bytes):
+        return (self._used_bytes + num_bytes <= self.quota_bytes
+                and self.free_bytes() - num_bytes >= self.min_free_bytes)
+
+    def reserve(self, num_bytes):
+        '''
+        Reserva espaço para gravar `num_bytes`. Despeja pastas antigas se
+        necessário; levanta StorageFullError se ainda assim não couber.
+        '''
+        with self._lock:
+            if not self._fits(num_bytes):
+                self._evict(num_bytes)
+            if not self._fits(num_bytes):
+                raise StorageFullError(
+                    f"Sem espaço para {num_bytes:,} bytes: {self._used_bytes:,} de {self.quota_bytes:,} bytes "
+                    f"usados, {self.free_bytes():,} livres no volume.")
+            self._used_bytes += num_bytes
+
+    def release(self, num_bytes):
+        '''Devolve uma reserva não utilizada (ex.: gravação falhou ou arquivo encolheu).'''
+        with self._lock:
+            self._used_bytes = max(0, self._used_bytes - num_bytes)
+
+    def make_room(self, free_bytes):
+        '''
+        Despeja pastas LRU (exportadas/enviadas e fora de uso) até o volume ter
+        `free_bytes` livres, mesmo sem a cota ter sido atingida — usado pelo
+        controle de recursos quando o disco entra na faixa crítica.
+        Retorna True se o espaço livre chegou ao alvo.
+        '''
+        with self._lock:
+            self._evict_until(lambda: self.free_bytes() >= free_bytes)
+            return self.free_bytes() >= free_bytes
+
+    def has_room(self, num_bytes=0):
+        '''Indica se cabe `num_bytes` (após despejo, se necessário) — usado antes de iniciar um job.'''
+        with self._lock:
+            if not self._fits(num_bytes):
+                self._evict(num_bytes)
+            return self._fits(num_bytes)
+
+    def _remove_sku_files(self, sku):
+        # Retorna os bytes de fato liberados: um arquivo com links em outros SKUs continua no disco
+        paths = {image["local_path"] for image in self.store.sku_manifest(sku).values()}
+        stats = {}
+        for path in paths:
+            try:
+                stats[path] = os.stat(path)
+            except FileNotFoundError:
+                pass
+        links_here = Counter((stat.st_dev, stat.st_ino) for stat in stats.values())
+        freed = {(stat.st_dev, stat.st_ino): stat.st_size for stat in stats.values()
+                 if stat.st_nlink <= links_here[(stat.st_dev, stat.st_ino)]}
+        sku_dirs = set()
+        for path in paths:
+            sku_dirs.add(os.path.dirname(path))
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        for sku_dir in sku_dirs:
+            try:
+                os.rmdir(sku_dir)
+            except OSError:
+                pass
+        return sum(freed.values())
+
+    def _evict(self, num_bytes):
+        self._evict_until(lambda: self._fits(num_bytes))
+
+    def _evict_until(self, done):
+        for candidate in self.store.eviction_candidates():
+            if done():
+                return
+            sku = candidate["sku"]
+            if sku in self._protected_skus:
+                continue
+            freed = self._remove_sku_files(sku)
+            self.store.remove_sku(sku)
+            self._used_bytes = max(0, self._used_bytes - freed)
+            log_message(f"🧹 [DISCO] Pasta do SKU {sku} despejada ({freed:,} bytes liberados)")
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def get_storage_budget(store, storage_path=STORAGE_PATH):
+    '''Retorna o StorageBudget do diretório, compartilhado pelo processo.'''
+    key = os.path.abspath(storage_path)
+    with _budgets_lock:
+        if key not in _budgets:
+            _budgets[key] = StorageBudget(store, storage_path)
+        return _budgets[key]
@@ -0,0 +1,117 @@
+"""
+Layout das pastas de SKU no volume de armazenamento.
+
+Com dezenas de milhares de SKUs numa única pasta, listagens e stats no volume
+de rede ficam lentos. No layout "sharded" (padrão), cada SKU fica em
+`<raiz>/<aa>/<bb>/<SKU>`, onde `aabb` são os 4 primeiros dígitos hex do MD5
+do SKU — cada pasta intermediária guarda poucos SKUs.
+
+Compatibilidade: pastas já criadas no layout plano (`<raiz>/<SKU>`) continuam
+sendo usadas onde estão; só SKUs novos vão para o layout sharded.
+
+`FileIndex` responde "o arquivo existe?" a partir da listagem de cada pasta,
+feita uma única vez (um scandir por pasta), em vez de um stat por imagem; "a
+pasta existe?" vem da listagem da pasta mãe (ex.: a raiz, para as pastas planas).
+"""
+import hashlib
+import os
+import threading
+
+# "sharded" (pastas com prefixo do hash do SKU) ou "flat" (uma pasta por SKU na raiz)
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "sharded").lower()
+
+
+def shard_prefix(sku):
+    '''Subpastas do SKU no layout sharded (ex.: "3f/a2").'''
+    digest = hashlib.md5(sku.encode("utf-8")).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+
+def sku_directory(base_path, sku, index=None):
+    '''
+    Pasta do SKU: a pasta plana `<raiz>/<SKU>` se já existir (layout antigo),
+    senão a do layout configurado. `index` evita o stat da pasta plana.
+    '''
+    flat_path = os.path.join(base_path, sku)
+    if STORAGE_LAYOUT == "flat":
+        return flat_path
+    has_flat = index.is_dir(flat_path) if index is not None else os.path.isdir(flat_path)
+    return flat_path if has_flat else os.path.join(base_path, shard_prefix(sku), sku)
+
+
+class FileIndex:
+    '''
+    Índice em memória de existência de arquivos e pastas, montado com uma
+    listagem por pasta (sob demanda ou via `preload`). As gravações feitas
+    durante o job devem ser registradas com `add`/`add_dir`/`discard`.
+    '''
+
+    def __init__(self):
+        # Pasta → {nome: é pasta} (None se a pasta não existe)
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def _listing(self, directory):
+        directory = os.path.normpath(directory)
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+        try:
+            with os.scandir(directory) as entries:
+                listing = {entry.name: entry.is_dir() for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            listing = None
+        with self._lock:
+            return self._listings.setdefault(directory, listing)
+
+    def preload(self, directories):
+        '''Lista as pastas informadas (uma vez cada).'''
+        for directory in directories:
+            self._listing(directory)
+
+    def is_dir(self, path):
+        '''
+        Se a pasta existe: pela listagem da própria pasta, se já foi feita, ou
+        pela da pasta mãe — o conteúdo só é listado quando for consultado.
+        '''
+        path = os.path.normpath(path)
+        with self._lock:
+            if path in self._listings:
+                return self._listings[path] is not None
+        parent = self._listing(os.path.dirname(path))
+        return parent is not None and parent.get(os.path.basename(path)) is True
+
+    def exists(self, path):
+        '''Se o arquivo (ou pasta) existe.'''
+        listing = self._listing(os.path.dirname(path))
+        return listing is not None and os.path.basename(path) in listing
+
+    def add(self, path, is_dir=False):
+        '''Registra um arquivo criado (a pasta dele passa a existir).'''
+        directory = os.path.normpath(os.path.dirname(path))
+        with self._lock:
+            # Pasta ainda não listada: a listagem, quando feita, já verá o arquivo
+            if directory in self._listings:
+                if self._listings[directory] is None:
+                    self._listings[directory] = {}
+                self._listings[directory][os.path.basename(path)] = is_dir
+            if is_dir and self._listings.get(os.path.normpath(path)) is None:
+                self._listings[os.path.normpath(path)] = {}
+
+    def add_dir(self, path):
+        '''Registra uma pasta criada.'''
+        self.add(path, is_dir=True)
+
+    def discard(self, path):
+        '''Registra um arquivo removido.'''
+        with self._lock:
+            listing = self._listings.get(os.path.normpath(os.path.dirname(path)))
+            if listing is not None:
+                listing.pop(os.path.basename(path), None)
+
+
+def ensure_sku_directory(sku_path, index):
+    '''Cria a pasta do SKU (e as intermediárias) se o índice não a conhece.'''
+    if not index.is_dir(sku_path):
+        os.makedirs(sku_path, exist_ok=True)
+        index.add_dir(sku_path)
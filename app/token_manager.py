@@ -0,0 +1,272 @@
+"""
+Gerenciamento de tokens OAuth do Bling.
+
+- Persistência dos tokens em `token_<conta>.json` com `expires_at`.
+- Renovação proativa: o token é renovado TOKEN_REFRESH_MARGIN segundos antes de expirar.
+- Renovação sob demanda: uma resposta 401 renova o token uma vez e repete a requisição.
+- As renovações são serializadas por conta: workers concorrentes que pedem a
+  renovação do mesmo token recebem o token já renovado, sem nova chamada ao Bling.
+  Entre processos (réplicas no mesmo volume) a serialização usa uma trava de
+  arquivo (`token_<conta>.json.lock`), para que o refresh token rotacionado por
+  uma réplica não seja reutilizado por outra.
+- Os tokens ficam em cache no processo. O arquivo só é relido quando muda
+  (mtime/tamanho), e essa verificação é feita no máximo a cada
+  TOKEN_CACHE_CHECK_INTERVAL segundos. Escritas pelo próprio processo
+  atualizam o cache diretamente.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import requests
+
+from circuit_breaker import guarded_request
+from config import BLING_API_BASE_URL, log_message
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas a trava entre threads
+    fcntl = None
+
+BLING_TOKEN_URL = f"{BLING_API_BASE_URL}/oauth/token"
+
+# Antecedência (segundos) com que o token é renovado antes de expirar
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+
+# Intervalo mínimo (segundos) entre verificações do arquivo de tokens no volume
+TOKEN_CACHE_CHECK_INTERVAL = float(os.getenv("TOKEN_CACHE_CHECK_INTERVAL", "5"))
+
+# Cache por arquivo: caminho → {"signature": (mtime_ns, tamanho), "checked_at": ..., "tokens": ...}
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+
+
+class TokenRefreshError(Exception):
+    '''Não foi possível renovar o token (sem refresh token, ou refresh token expirado/revogado).'''
+
+
+def token_file_path(storage_path, account_name):
+    '''Caminho do arquivo de tokens de uma conta.'''
+    return os.path.join(storage_path, f"token_{account_name}.json")
+
+
+def stamp_expiry(tokens):
+    '''Adiciona `expires_at` (ISO) a tokens recém-emitidos, a partir de `expires_in`.'''
+    if "expires_in" in tokens:
+        tokens["expires_at"] = (datetime.now() + timedelta(seconds=int(tokens["expires_in"]))).isoformat()
+    return tokens
+
+
+def save_tokens(storage_path, account_name, tokens):
+    '''Salva os tokens OAuth de uma conta em arquivo JSON.'''
+    token_file = token_file_path(storage_path, account_name)
+    # Escrita atômica: leitores concorrentes nunca veem o arquivo pela metade
+    temp_file = f"{token_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(tokens, f, indent=2)
+        os.replace(temp_file, token_file)
+    except BaseException:
+        # Falha na escrita (disco cheio): o arquivo anterior continua valendo
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    stat = os.stat(token_file)
+    with _token_cache_lock:
+        _token_cache[token_file] = {
+            "signature": (stat.st_mtime_ns, stat.st_size),
+            "checked_at": time.monotonic(),
+            "tokens": dict(tokens)
+        }
+    return token_file
+
+
+def delete_tokens(storage_path, account_name):
+    '''Remove o arquivo de tokens de uma conta e invalida o cache. Retorna True se existia.'''
+    token_file = token_file_path(storage_path, account_name)
+    with _token_cache_lock:
+        _token_cache.pop(token_file, None)
+    try:
+        os.remove(token_file)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _read_token_file(token_file, account_name, stat):
+    try:
+        with open(token_file, "r", encoding="utf-8") as f:
+            tokens = json.load(f)
+    except json.JSONDecodeError:
+        log_message(f"Erro ao decodificar tokens de {account_name} de {token_file}. Arquivo corrompido ou inválido.")
+        return None
+
+    if "expires_at" not in tokens and "expires_in" in tokens:
+        saved_at = datetime.fromtimestamp(stat.st_mtime)
+        tokens["expires_at"] = (saved_at + timedelta(seconds=int(tokens["expires_in"]))).isoformat()
+    return tokens
+
+
+def load_tokens(storage_path, account_name, force_check=False):
+    '''
+    Carrega os tokens OAuth de uma conta (do cache em memória, quando válido).
+    Tokens antigos, salvos sem `expires_at`, têm a expiração estimada pela data
+    do arquivo + `expires_in`. Retorna uma cópia, que pode ser alterada livremente.
+    
+    `force_check` ignora o intervalo de verificação e confere o arquivo agora.
+    '''
+    token_file = token_file_path(storage_path, account_name)
+    now = time.monotonic()
+    with _token_cache_lock:
+        entry = _token_cache.get(token_file)
+        if entry and not force_check and now - entry["checked_at"] < TOKEN_CACHE_CHECK_INTERVAL:
+            return dict(entry["tokens"]) if entry["tokens"] is not None else None
+
+    try:
+        stat = os.stat(token_file)
+    except FileNotFoundError:
+        with _token_cache_lock:
+            _token_cache.pop(token_file, None)
+        return None
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _token_cache_lock:
+        entry = _token_cache.get(token_file)
+        if entry and entry["signature"] == signature:
+            entry["checked_at"] = now
+            return dict(entry["tokens"]) if entry["tokens"] is not None else None
+
+    tokens = _read_token_file(token_file, account_name, stat)
+    with _token_cache_lock:
+        _token_cache[token_file] = {"signature": signature, "checked_at": now, "tokens": tokens}
+    return dict(tokens) if tokens is not None else None
+
+
+@contextmanager
+def refresh_file_lock(storage_path, account_name):
+    '''Trava entre processos durante a renovação do token de uma conta.'''
+    if fcntl is None:
+        yield
+        return
+    with open(f"{token_file_path(storage_path, account_name)}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def refresh_access_token(client_id, client_secret, refresh_token):
+    '''Usa o refresh token para obter um novo token de acesso Bling.'''
+    encoded_credentials = base64.b64encode(f"{client_id}:{client_secret}".encode("utf-8")).decode("utf-8")
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Authorization": f"Basic {encoded_credentials}"
+    }
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token
+    }
+    response = requests.post(BLING_TOKEN_URL, headers=headers, data=data)
+    response.raise_for_status()
+    return response.json()
+
+
+class TokenManager:
+    '''Fornece tokens válidos de uma conta Bling e faz requisições autenticadas.'''
+
+    def __init__(self, account_name, client_id, client_secret, storage_path, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.account_name = account_name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.storage_path = storage_path
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+
+    def tokens(self, force_check=False):
+        '''Tokens atuais da conta (ou None se não autenticada).'''
+        return load_tokens(self.storage_path, self.account_name, force_check=force_check)
+
+    def needs_refresh(self, tokens):
+        '''Indica se o token expira dentro da margem de renovação.'''
+        expires_at = tokens.get("expires_at")
+        if not expires_at:
+            return False
+        remaining = datetime.fromisoformat(expires_at) - datetime.now()
+        return remaining.total_seconds() < self.refresh_margin
+
+    def get_access_token(self):
+        '''Retorna um access token válido, renovando-o antes da expiração se necessário.'''
+        tokens = self.tokens()
+        if not tokens:
+            raise TokenRefreshError(f"Conta {self.account_name} não autenticada.")
+        if self.needs_refresh(tokens):
+            tokens = self.refresh(stale_access_token=tokens["access_token"])
+        return tokens["access_token"]
+
+    def refresh(self, stale_access_token=None):
+        '''
+        Renova o token da conta. Se `stale_access_token` já foi substituído por
+        outro worker enquanto este aguardava o lock, retorna o token atual sem
+        chamar o Bling novamente.
+        '''
+        with self._lock, refresh_file_lock(self.storage_path, self.account_name):
+            # Confere o arquivo: outro processo pode ter renovado (e rotacionado o refresh token)
+            tokens = self.tokens(force_check=True)
+            if not tokens:
+                raise TokenRefreshError(f"Conta {self.account_name} não autenticada.")
+            if stale_access_token and tokens.get("access_token") != stale_access_token \
+                    and not self.needs_refresh(tokens):
+                return tokens
+
+            refresh_token = tokens.get("refresh_token")
+            if not refresh_token:
+                raise TokenRefreshError(f"Conta {self.account_name} sem refresh token. Reautentique.")
+
+            log_message(f"🔑 [TOKEN] Renovando token de {self.account_name}...")
+            try:
+                new_tokens = refresh_access_token(self.client_id, self.client_secret, refresh_token)
+            except requests.exceptions.HTTPError as e:
+                log_message(f"❌ [TOKEN] Falha ao renovar token de {self.account_name}: {e.response.status_code} - {e.response.text}")
+                raise TokenRefreshError(f"Não foi possível renovar o token de {self.account_name}. Reautentique.") from e
+
+            new_tokens.setdefault("refresh_token", refresh_token)
+            stamp_expiry(new_tokens)
+            save_tokens(self.storage_path, self.account_name, new_tokens)
+            log_message(f"✅ [TOKEN] Token de {self.account_name} renovado (expira em {new_tokens.get('expires_at')})")
+            return new_tokens
+
+    def request(self, method, url, send=guarded_request, **kwargs):
+        '''
+        Faz uma requisição autenticada; em 401, renova o token uma vez e repete.
+        `send(method, url, **kwargs)` envia cada tentativa HTTP (o escalonador
+        de jobs usa para reservar uma vaga por tentativa).
+        '''
+        access_token = self.get_access_token()
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Authorization"] = f"Bearer {access_token}"
+        response = send(method, url, headers=headers, **kwargs)
+
+        if response.status_code == 401:
+            log_message(f"⚠️ [TOKEN] 401 em {url}. Renovando token de {self.account_name} e repetindo...")
+            headers["Authorization"] = f"Bearer {self.refresh(stale_access_token=access_token)['access_token']}"
+            response = send(method, url, headers=headers, **kwargs)
+        return response
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(account_name, client_id, client_secret, storage_path):
+    '''Retorna o TokenManager da conta, compartilhado por todo o processo.'''
+    key = (account_name, os.path.abspath(storage_path))
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = TokenManager(account_name, client_id, client_secret, storage_path)
+        return _managers[key]
@@ -0,0 +1,81 @@
+"""
+Comparação das imagens locais de um SKU com as que o produto de destino já tem.
+
+Antes do PATCH, a ficha do destino é consultada e cada imagem existente é
+identificada pelo ETag (MD5 do conteúdo no S3, quando o arquivo não foi enviado
+em partes) e pelo tamanho, lidos com um GET de um único byte
+(`Range: bytes=0-0`) — os links são assinados para GET, então HEAD não serve.
+Cada imagem local casa com no máximo uma do destino, sempre pelo MD5. Imagens
+do destino sem um MD5 utilizável (ETag de upload em partes, servidor sem ETag)
+não casam com nenhuma: duas fotos diferentes podem ter o mesmo tamanho, então
+na dúvida a imagem é enviada.
+"""
+import hashlib
+import os
+import re
+
+from circuit_breaker import guarded_request
+from config import BLING_API_BASE_URL, log_message
+
+# Compara com o destino antes do upload e pula os produtos que já têm as mesmas imagens
+UPLOAD_SKIP_IDENTICAL = os.getenv("UPLOAD_SKIP_IDENTICAL", "true").lower() == "true"
+
+MD5_ETAG = re.compile(r"[0-9a-f]{32}")
+
+
+def local_signature(path):
+    '''Tamanho e MD5 de um arquivo local.'''
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return {"path": path, "size": os.path.getsize(path), "md5": digest.hexdigest()}
+
+
+def remote_signature(url):
+    '''Tamanho e MD5 (pelo ETag, se for um MD5 simples) de uma imagem remota, sem baixá-la.'''
+    response = guarded_request("GET", url, headers={"Range": "bytes=0-0"}, stream=True, timeout=30)
+    try:
+        response.raise_for_status()
+        size = None
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            size = int(content_range.rsplit("/", 1)[1])
+        elif response.status_code == 200 and response.headers.get("Content-Length", "").isdigit():
+            # Servidor ignorou o Range: Content-Length é o tamanho total
+            size = int(response.headers["Content-Length"])
+        etag = response.headers.get("ETag", "").strip('"').lower()
+        return {"link": url, "size": size, "md5": etag if MD5_ETAG.fullmatch(etag) else None}
+    finally:
+        response.close()
+
+
+def product_image_links(product_data):
+    '''Links das imagens (internas e externas) de uma ficha de produto.'''
+    midia = product_data.get('midia', {})
+    if not isinstance(midia, dict):
+        return []
+    imagens = midia.get('imagens', {})
+    return [img['link'] for img in imagens.get('internas', []) + imagens.get('externas', []) if img.get('link')]
+
+
+def destination_signatures(tokens, product_id):
+    '''Assinaturas das imagens atuais do produto `product_id` na conta de `tokens`.'''
+    url = f"{BLING_API_BASE_URL}/produtos/{product_id}"
+    log_message(f"📡 [API] GET {url} (imagens atuais em {tokens.account_name.upper()})")
+    response = tokens.request("GET", url)
+    response.raise_for_status()
+    return [remote_signature(link) for link in product_image_links(response.json().get('data', {}))]
+
+
+def missing_images(local_signatures, remote_signatures):
+    '''Imagens locais sem correspondente no destino pelo MD5 (cada imagem do destino casa uma única vez).'''
+    remaining = list(remote_signatures)
+    missing = []
+    for local in local_signatures:
+        match = next((remote for remote in remaining if remote["md5"] and remote["md5"] == local["md5"]), None)
+        if match is None:
+            missing.append(local["path"])
+        else:
+            remaining.remove(match)
+    return missing
@@ -0,0 +1,24 @@
+"""
+Configuração dos testes: os módulos de app/ se importam pelo nome (como no
+Streamlit), e o armazenamento e o banco de estado vão para um diretório
+temporário antes de qualquer importação (config.py cria STORAGE_PATH ao carregar).
+"""
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+_storage = tempfile.mkdtemp(prefix="bling-tests-")
+os.environ["STORAGE_PATH"] = _storage
+os.environ["STATE_DB_PATH"] = os.path.join(_storage, "state.db")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    '''Banco de estado novo, isolado por teste.'''
+    from state_store import StateStore
+    return StateStore(str(tmp_path / "state.db"))
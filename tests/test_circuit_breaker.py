@@ -0,0 +1,101 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+OK = SimpleNamespace(status_code=200)
+SERVER_ERROR = SimpleNamespace(status_code=503)
+
+
+def fail_connection():
+    raise requests.exceptions.ConnectionError("recusada")
+
+
+def make_breaker(**overrides):
+    options = dict(window=4, min_calls=4, error_rate=0.5, open_seconds=0.05, max_open_seconds=0.2, max_outage=5)
+    options.update(overrides)
+    return CircuitBreaker("cdn.test", **options)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.call(lambda: SERVER_ERROR)
+
+
+def test_stays_closed_below_error_rate():
+    breaker = make_breaker()
+    for response in (OK, SERVER_ERROR, OK, OK):
+        breaker.call(lambda: response)
+    assert breaker.state == CLOSED
+
+
+def test_opens_when_error_rate_is_reached():
+    breaker = make_breaker()
+    breaker.call(lambda: OK)
+    breaker.call(lambda: SERVER_ERROR)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        breaker.call(fail_connection)
+    assert breaker.state == CLOSED
+    breaker.call(lambda: SERVER_ERROR)
+    assert breaker.state == OPEN
+
+
+def test_successful_probe_closes_circuit():
+    breaker = make_breaker()
+    trip(breaker)
+    states = []
+
+    def probe():
+        states.append(breaker.state)
+        return OK
+
+    assert breaker.call(probe) is OK
+    assert states == [HALF_OPEN]
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["chamadas_recentes"] == 0
+
+
+def test_failed_probe_reopens_with_longer_wait():
+    breaker = make_breaker()
+    trip(breaker)
+
+    breaker.call(lambda: SERVER_ERROR)
+    assert breaker.state == OPEN
+    assert breaker._cooldown == pytest.approx(0.1)
+
+    started = time.monotonic()
+    breaker.call(lambda: OK)
+    assert time.monotonic() - started >= 0.08
+    assert breaker.state == CLOSED
+
+
+def test_parked_calls_wait_for_probe():
+    breaker = make_breaker(open_seconds=0.1)
+    trip(breaker)
+    calls = []
+
+    def slow_ok():
+        calls.append(breaker.state)
+        time.sleep(0.05)
+        return OK
+
+    threads = [threading.Thread(target=breaker.call, args=(slow_ok,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Só uma chamada de teste no meio-aberto; as demais passam depois que o circuito fecha
+    assert calls == [HALF_OPEN, CLOSED, CLOSED]
+    assert breaker.state == CLOSED
+
+
+def test_fails_fast_after_max_outage():
+    breaker = make_breaker(open_seconds=10, max_open_seconds=10, max_outage=0.05)
+    trip(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: OK)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from coalescing import RequestCoalescer
+
+
+def test_concurrent_calls_share_one_fetch():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"id": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.do(("produto", 1), fetch)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"id": 1}] * 5
+    assert (coalescer.misses, coalescer.hits) == (1, 4)
+
+
+def test_forgotten_key_is_fetched_again():
+    coalescer = RequestCoalescer()
+    versions = iter(["link-1", "link-2"])
+    assert coalescer.do(("renovação", 1), lambda: next(versions)) == "link-1"
+    assert coalescer.do(("renovação", 1), lambda: next(versions)) == "link-1"
+
+    coalescer.forget([("renovação", 1)])
+    assert coalescer.do(("renovação", 1), lambda: next(versions)) == "link-2"
+
+
+def test_errors_are_not_kept():
+    coalescer = RequestCoalescer()
+
+    def fail():
+        raise ConnectionError("timeout")
+
+    with pytest.raises(ConnectionError):
+        coalescer.do("chave", fail)
+    assert coalescer.do("chave", lambda: "ok") == "ok"
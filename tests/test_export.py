@@ -0,0 +1,59 @@
+import io
+import tarfile
+import zipfile
+
+from export import iter_export_stream, list_export_entries
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200 + b"\xff\xd9"
+PNG_NO_EXTENSION = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200
+TEXT = b"sku;link\n" * 50
+
+
+def export_bytes(entries, archive_format="zip"):
+    return b"".join(iter_export_stream(entries, archive_format))
+
+
+def test_zip_stores_images_and_deflates_other_files(tmp_path):
+    (tmp_path / "foto.jpg").write_bytes(JPEG)
+    (tmp_path / "imagem").write_bytes(PNG_NO_EXTENSION)
+    (tmp_path / "lista.csv").write_bytes(TEXT)
+    entries = [("A/foto.jpg", str(tmp_path / "foto.jpg")), ("A/imagem", str(tmp_path / "imagem")),
+               ("A/lista.csv", str(tmp_path / "lista.csv"))]
+
+    with zipfile.ZipFile(io.BytesIO(export_bytes(entries))) as archive:
+        methods = {info.filename: info.compress_type for info in archive.infolist()}
+        assert archive.read("A/foto.jpg") == JPEG
+        assert archive.read("A/lista.csv") == TEXT
+
+    assert methods == {"A/foto.jpg": zipfile.ZIP_STORED, "A/imagem": zipfile.ZIP_STORED,
+                       "A/lista.csv": zipfile.ZIP_DEFLATED}
+
+
+def test_zip_is_streamed_in_chunks(tmp_path):
+    (tmp_path / "grande.jpg").write_bytes(JPEG * 10_000)
+    chunks = list(iter_export_stream([("A/grande.jpg", str(tmp_path / "grande.jpg"))]))
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.read("A/grande.jpg") == JPEG * 10_000
+
+
+def test_tar_export(tmp_path):
+    (tmp_path / "foto.jpg").write_bytes(JPEG)
+    with tarfile.open(fileobj=io.BytesIO(export_bytes([("A/foto.jpg", str(tmp_path / "foto.jpg"))], "tar"))) as archive:
+        assert archive.extractfile("A/foto.jpg").read() == JPEG
+
+
+def test_entries_come_from_manifest_once_per_file(store, tmp_path):
+    sku_dir = tmp_path / "A"
+    sku_dir.mkdir()
+    (sku_dir / "1.jpg").write_bytes(JPEG)
+    store.record_images("A", [
+        {"file_name": "1.jpg", "url_key": "u1", "local_path": str(sku_dir / "1.jpg"), "size": len(JPEG)},
+        # Quase duplicada redirecionada para a cópia mantida
+        {"file_name": "2.jpg", "url_key": "u2", "local_path": str(sku_dir / "1.jpg"), "size": 0},
+    ])
+    (tmp_path / "B").mkdir()
+    (tmp_path / "B" / "x.png").write_bytes(PNG_NO_EXTENSION)
+
+    entries = list_export_entries(store, ["A", "B", "SEM_PASTA"], str(tmp_path))
+    assert entries == [("A/1.jpg", str(sku_dir / "1.jpg")), ("B/x.png", str(tmp_path / "B" / "x.png"))]
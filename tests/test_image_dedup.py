@@ -0,0 +1,72 @@
+import sys
+
+import pytest
+
+import image_dedup
+from image_dedup import find_duplicates, fingerprint_images, group_near_duplicates, unique_images
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+def photo(path, size, shapes, quality=95):
+    '''Imagem sintética: gradiente com formas (`shapes`: retângulos em coordenadas 0-1).'''
+    width, height = size
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for left, top, right, bottom, color in shapes:
+        draw.rectangle((left * width, top * height, right * width, bottom * height), fill=color)
+    image.save(path, quality=quality)
+    return str(path)
+
+
+PRODUCT = [(0.1, 0.1, 0.45, 0.6, "red"), (0.6, 0.5, 0.9, 0.9, "navy")]
+OTHER = [(0.5, 0.05, 0.95, 0.35, "white"), (0.05, 0.55, 0.4, 0.95, "black")]
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    return {
+        "original": photo(tmp_path / "original.jpg", (800, 600), PRODUCT),
+        "reduzida": photo(tmp_path / "reduzida.jpg", (400, 300), PRODUCT),
+        "recomprimida": photo(tmp_path / "recomprimida.jpg", (800, 600), PRODUCT, quality=40),
+        "outra": photo(tmp_path / "outra.jpg", (800, 600), OTHER),
+    }
+
+
+def test_copies_are_grouped_and_largest_is_kept(gallery):
+    paths = [gallery["reduzida"], gallery["outra"], gallery["original"], gallery["recomprimida"]]
+    fingerprints = fingerprint_images(paths)
+
+    assert group_near_duplicates(fingerprints) == [[0, 2, 3]]
+    # Empate de resolução entre original e recomprimida: fica o arquivo maior
+    assert find_duplicates(fingerprints) == {gallery["reduzida"]: gallery["original"],
+                                             gallery["recomprimida"]: gallery["original"]}
+    assert unique_images(paths) == [gallery["outra"], gallery["original"]]
+
+
+def test_unrelated_images_stay_apart(gallery):
+    fingerprints = fingerprint_images([gallery["original"], gallery["outra"]])
+    assert group_near_duplicates(fingerprints) == []
+    assert find_duplicates(fingerprints) == {}
+
+
+def test_unreadable_image_is_left_out(gallery, tmp_path):
+    broken = tmp_path / "quebrada.jpg"
+    broken.write_bytes(b"\xff\xd8\xff nada")
+    fingerprints = fingerprint_images([gallery["original"], str(broken)])
+    assert [fp["path"] for fp in fingerprints] == [gallery["original"]]
+
+
+def test_missing_numpy_disables_with_warning(monkeypatch):
+    logged = []
+    monkeypatch.setattr(image_dedup, "PHASH_DEDUP", True)
+    monkeypatch.setattr(image_dedup, "_missing_dependency_logged", False)
+    monkeypatch.setattr(image_dedup, "log_message", logged.append)
+    monkeypatch.setitem(sys.modules, "numpy", None)
+
+    assert not image_dedup.is_phash_enabled()
+    assert not image_dedup.is_phash_enabled()
+    assert len(logged) == 1
+    assert "numpy" in logged[0]
@@ -0,0 +1,87 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+from image_integrity import CorruptImageError, detect_format, validate_image, validate_image_file
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100 + b"\xff\xd9"
+S3_ERROR = (b'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>AccessDenied</Code>'
+            b'<Message>Request has expired</Message></Error>')
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+PNG = (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+       + png_chunk(b"IDAT", zlib.compress(b"\x00\x00")) + png_chunk(b"IEND", b""))
+
+
+@pytest.mark.parametrize("content, image_format", [
+    (JPEG, "jpeg"),
+    (JPEG + b"\x00\r\n", "jpeg"),
+    (PNG, "png"),
+    (b"GIF89a" + b"\x00" * 20 + b"\x3b", "gif"),
+    (b"RIFF" + struct.pack("<I", 12) + b"WEBPVP8 " + b"\x00" * 4, "webp"),
+])
+def test_valid_images(content, image_format):
+    assert validate_image(content, {"Content-Type": "image/" + image_format}) == image_format
+
+
+@pytest.mark.parametrize("content", [JPEG[:-2], JPEG[:50], PNG[:-12], PNG[:30]])
+def test_truncated_images_are_rejected(content):
+    with pytest.raises(CorruptImageError, match="incompleto"):
+        validate_image(content)
+
+
+def test_body_shorter_than_content_length_is_rejected():
+    with pytest.raises(CorruptImageError, match="truncada"):
+        validate_image(JPEG, {"Content-Length": str(len(JPEG) + 10)})
+
+
+def test_content_length_ignored_for_compressed_responses():
+    assert validate_image(JPEG, {"Content-Length": "10", "Content-Encoding": "gzip"}) == "jpeg"
+
+
+def test_s3_xml_error_is_rejected_by_content_type():
+    with pytest.raises(CorruptImageError, match="Content-Type"):
+        validate_image(S3_ERROR, {"Content-Type": "application/xml"})
+
+
+def test_s3_xml_error_is_rejected_without_content_type():
+    with pytest.raises(CorruptImageError, match="texto"):
+        validate_image(b"  " + S3_ERROR, {"Content-Type": "binary/octet-stream"})
+
+
+def test_empty_body_is_rejected():
+    with pytest.raises(CorruptImageError, match="vazio"):
+        validate_image(b"")
+
+
+def test_unknown_binary_format_passes():
+    assert detect_format(b"\x00\x00\x00\x1cftypavif") is None
+    assert validate_image(b"\x00\x00\x00\x1cftypavif") is None
+
+
+def test_full_decode_catches_damaged_pixels():
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, "PNG")
+    valid = buffer.getvalue()
+    assert validate_image(valid, full_decode=True) == "png"
+
+    # Estrutura íntegra, dados comprimidos corrompidos
+    idat = valid.index(b"IDAT")
+    damaged = valid[:idat + 4] + b"\xff" * 8 + valid[idat + 12:]
+    assert validate_image(damaged) == "png"
+    with pytest.raises(CorruptImageError, match="decodificar"):
+        validate_image(damaged, full_decode=True)
+
+
+def test_validate_image_file(tmp_path):
+    path = tmp_path / "1.jpg"
+    path.write_bytes(JPEG[:-2])
+    with pytest.raises(CorruptImageError):
+        validate_image_file(str(path))
@@ -0,0 +1,50 @@
+import pytest
+
+from image_workers import flatten_transparency, transform_image
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.mark.parametrize("image", [
+    Image.new("RGBA", (4, 4), (255, 0, 0, 0)),
+    Image.new("LA", (4, 4), (0, 0)),
+])
+def test_transparent_pixels_become_white(image):
+    flat = flatten_transparency(image)
+    assert flat.mode == "RGB"
+    assert flat.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_palette_transparency_becomes_white():
+    image = Image.new("P", (4, 4), 0)
+    image.putpalette([255, 0, 0] + [0, 0, 0] * 255)
+    image.info["transparency"] = 0
+    assert flatten_transparency(image).getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_opaque_pixels_keep_their_color():
+    image = Image.new("RGBA", (4, 4), (255, 0, 0, 255))
+    assert flatten_transparency(image).getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_transparent_png_to_jpeg(tmp_path):
+    source = tmp_path / "1.png"
+    Image.new("RGBA", (32, 32), (255, 0, 0, 0)).save(source)
+
+    result = transform_image(str(source), str(tmp_path / "1.jpg"), max_dimension=0, quality=90,
+                             output_format="jpeg", strip_metadata=True)
+
+    assert not source.exists()
+    with Image.open(result["path"]) as converted:
+        red, green, blue = converted.convert("RGB").getpixel((16, 16))
+    assert min(red, green, blue) >= 250
+
+
+@pytest.mark.parametrize("quota, workers, expected", [(None, 2, 2), (0.5, 2, 1), (1.5, 4, 2), (8.0, 2, 2)])
+def test_pool_size_is_capped_by_cpu_quota(monkeypatch, quota, workers, expected):
+    import image_workers
+    import resource_governor
+
+    monkeypatch.setattr(resource_governor, "container_cpu_quota", lambda: quota)
+    monkeypatch.setattr(image_workers, "IMAGE_WORKERS", workers)
+    assert image_workers.process_pool_size() == expected
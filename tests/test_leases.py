@@ -0,0 +1,107 @@
+import threading
+
+from leases import LeaseWorker
+
+
+def queued_job(store, skus, storage_path="/data"):
+    job_id = store.create_job("download", skus, account="lojahi")
+    store.enqueue_job(job_id, storage_path, "normal")
+    return job_id
+
+
+def test_claim_reserves_pending_skus_in_order(store):
+    job_id = queued_job(store, ["A", "B", "C"])
+
+    claim = store.claim_skus("w1", 2, 60)
+
+    assert claim == {"job_id": job_id, "account": "lojahi", "storage_path": "/data", "priority": "normal",
+                     "skus": ["A", "B"]}
+    assert store.claim_skus("w2", 5, 60)["skus"] == ["C"]
+    assert store.claim_skus("w3", 5, 60) is None
+
+
+def test_concurrent_workers_never_share_a_sku(store):
+    skus = [f"S{i}" for i in range(60)]
+    queued_job(store, skus)
+    claimed, lock = [], threading.Lock()
+
+    def claim_all(owner):
+        while True:
+            claim = store.claim_skus(owner, 3, 60)
+            if claim is None:
+                return
+            with lock:
+                claimed.extend(claim["skus"])
+
+    threads = [threading.Thread(target=claim_all, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(claimed) == sorted(skus)
+
+
+def test_expired_lease_is_reclaimed(store):
+    job_id = queued_job(store, ["A", "B"])
+    store.claim_skus("parado", 2, -1)
+
+    claim = store.claim_skus("vivo", 5, 60)
+
+    assert claim["skus"] == ["A", "B"]
+    assert store.leased_skus(job_id) == [("A", "vivo"), ("B", "vivo")]
+
+
+def test_renewed_lease_is_not_reclaimed(store):
+    queued_job(store, ["A"])
+    store.claim_skus("w1", 1, -1)
+    assert store.renew_leases("w1", 60) == 1
+    assert store.claim_skus("w2", 1, 60) is None
+
+
+def test_complete_requires_current_owner(store):
+    job_id = queued_job(store, ["A"])
+    store.claim_skus("antigo", 1, -1)
+    store.claim_skus("novo", 1, 60)
+
+    # O worker cuja reserva venceu não sobrescreve o resultado de quem assumiu
+    assert not store.complete_leased_sku("antigo", job_id, "A", "erro", error="timeout")
+    assert store.job_results(job_id) == {"A": ("pendente", 0)}
+
+    assert store.complete_leased_sku("novo", job_id, "A", "ok", image_count=3)
+    assert store.job_results(job_id) == {"A": ("ok", 3)}
+    assert store.leased_skus(job_id) == []
+
+
+def test_released_skus_return_to_queue(store):
+    job_id = queued_job(store, ["A", "B"])
+    store.claim_skus("w1", 2, 60)
+    store.release_leases("w1", job_id, ["B"])
+    assert store.claim_skus("w2", 5, 60)["skus"] == ["B"]
+
+
+def test_job_finishes_when_no_sku_is_pending(store):
+    job_id = queued_job(store, ["A", "B"])
+    store.claim_skus("w1", 2, 60)
+    store.complete_leased_sku("w1", job_id, "A", "ok", image_count=1)
+    assert not store.finish_job_if_done(job_id)
+
+    store.complete_leased_sku("w1", job_id, "B", "vazio")
+    assert store.finish_job_if_done(job_id)
+    assert store.recent_jobs(1)[0]["status"] == "concluido"
+    assert store.claim_skus("w2", 5, 60) is None
+
+
+def test_worker_releases_unfinished_skus_after_chunk(store):
+    job_id = queued_job(store, ["A", "B"])
+
+    def process_chunk(claim, owner):
+        store.complete_leased_sku(owner, claim["job_id"], claim["skus"][0], "ok", image_count=2)
+        raise RuntimeError("falha no meio do lote")
+
+    claim = LeaseWorker(store, process_chunk, worker_id="w1").run_once()
+
+    assert claim["skus"] == ["A", "B"]
+    assert store.job_results(job_id) == {"A": ("ok", 2), "B": ("pendente", 0)}
+    assert store.leased_skus(job_id) == []
+    assert store.claim_skus("w2", 5, 60)["skus"] == ["B"]
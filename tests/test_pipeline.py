@@ -0,0 +1,71 @@
+import threading
+import time
+
+from pipeline import PipelineEngine, Stage
+
+
+def test_outputs_flow_through_all_stages():
+    outputs = []
+    engine = PipelineEngine(
+        [Stage("dobrar", lambda n: [n, n], concurrency=2), Stage("somar", lambda n: [n + 1], concurrency=2)],
+        on_output=outputs.append)
+    engine.run_sync(range(5))
+    assert sorted(outputs) == sorted([n + 1 for n in range(5)] * 2)
+
+
+def test_handler_error_is_reported_and_other_items_continue():
+    outputs, errors = [], []
+
+    def parse(item):
+        if item == 3:
+            raise ValueError("item inválido")
+        return [item]
+
+    engine = PipelineEngine([Stage("ler", parse), Stage("gravar", lambda n: [n * 10])],
+                            on_output=outputs.append,
+                            on_error=lambda stage, item, error: errors.append((stage, item, error)))
+    engine.run_sync(range(6))
+
+    assert sorted(outputs) == [0, 10, 20, 40, 50]
+    assert len(errors) == 1
+    stage, item, error = errors[0]
+    assert (stage, item) == ("ler", 3)
+    assert isinstance(error, ValueError)
+
+
+def test_error_in_later_stage_reports_that_stage():
+    errors = []
+
+    def fail(item):
+        raise RuntimeError("disco cheio")
+
+    engine = PipelineEngine([Stage("baixar", lambda n: [n]), Stage("gravar", fail)],
+                            on_error=lambda stage, item, error: errors.append((stage, item)))
+    engine.run_sync([1, 2])
+    assert sorted(errors) == [("gravar", 1), ("gravar", 2)]
+
+
+def test_bounded_queues_hold_back_fast_stage():
+    lock = threading.Lock()
+    produced, consumed, leads = [0], [0], []
+
+    def fast(item):
+        with lock:
+            produced[0] += 1
+        return [item]
+
+    def slow(item):
+        with lock:
+            leads.append(produced[0] - consumed[0])
+        time.sleep(0.01)
+        with lock:
+            consumed[0] += 1
+        return []
+
+    engine = PipelineEngine([Stage("rapida", fast), Stage("lenta", slow)], queue_size=1)
+    engine.run_sync(range(30))
+
+    assert consumed[0] == 30
+    # Um item na etapa lenta, um na fila e um aguardando vaga na fila: a etapa rápida não dispara na frente
+    assert max(leads) <= 3
+
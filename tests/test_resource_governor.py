@@ -0,0 +1,93 @@
+import resource_governor
+from resource_governor import LEVEL_CRITICAL, LEVEL_NORMAL, ResourceGovernor, describe_pressure
+from storage_budget import StorageBudget
+
+
+class FakeBudget:
+    '''Orçamento que libera `freed` bytes por chamada de make_room.'''
+
+    def __init__(self, governor, freed):
+        self.governor = governor
+        self.freed = freed
+        self.calls = []
+
+    def make_room(self, free_bytes):
+        self.calls.append(free_bytes)
+        self.governor.extra_free += self.freed
+        return True
+
+
+class FakeDiskGovernor(ResourceGovernor):
+    def __init__(self, free, **kwargs):
+        super().__init__(storage_paths=("/data",), sample_seconds=0, **kwargs)
+        self.free = free
+        self.extra_free = 0
+
+    def _free_space(self):
+        return self.free + self.extra_free
+
+
+def test_critical_disk_pauses_without_budget():
+    governor = FakeDiskGovernor(free=10, min_free_bytes=100)
+    assert governor.status()["nivel"] == LEVEL_CRITICAL
+    assert "livres no volume" in describe_pressure(governor.status())
+
+
+def test_critical_disk_evicts_through_budget():
+    governor = FakeDiskGovernor(free=10, min_free_bytes=100)
+    budget = FakeBudget(governor, freed=200)
+    governor.watch_path("/data", budget)
+
+    status = governor.status()
+
+    assert budget.calls == [100]
+    assert status["nivel"] == LEVEL_NORMAL
+    assert status["livre_bytes"] == 210
+
+
+def test_budget_untouched_with_enough_space():
+    governor = FakeDiskGovernor(free=500, min_free_bytes=100)
+    budget = FakeBudget(governor, freed=200)
+    governor.watch_path("/data", budget)
+    governor.status()
+    assert budget.calls == []
+
+
+def test_make_room_evicts_until_target(store, tmp_path, monkeypatch):
+    for sku in ("A", "B", "C"):
+        (tmp_path / sku).mkdir()
+        path = tmp_path / sku / "1.jpg"
+        path.write_bytes(b"x" * 100)
+        store.record_images(sku, [{"file_name": "1.jpg", "url_key": sku, "local_path": str(path), "size": 100}])
+        store.mark_sku_exported([sku])
+        store.touch_skus([sku])
+    budget = StorageBudget(store, str(tmp_path), quota_bytes=10_000, min_free_bytes=0)
+    # Espaço livre simulado: cresce com o que foi despejado
+    monkeypatch.setattr(budget, "free_bytes", lambda: 1000 + 100 * sum(
+        not (tmp_path / sku).exists() for sku in ("A", "B", "C")))
+
+    assert budget.make_room(1150)
+
+    assert not (tmp_path / "A").exists()
+    assert not (tmp_path / "B").exists()
+    assert (tmp_path / "C" / "1.jpg").exists()
+
+
+def test_cpu_quota_from_cgroup_v2(tmp_path, monkeypatch):
+    cpu_max = tmp_path / "cpu.max"
+    monkeypatch.setattr(resource_governor, "CGROUP_CPU_MAX_FILE", str(cpu_max))
+    cpu_max.write_text("50000 100000\n")
+    assert resource_governor.container_cpu_quota() == 0.5
+    cpu_max.write_text("max 100000\n")
+    assert resource_governor.container_cpu_quota() is None
+
+
+def test_cpu_quota_from_cgroup_v1(tmp_path, monkeypatch):
+    quota, period = tmp_path / "cpu.cfs_quota_us", tmp_path / "cpu.cfs_period_us"
+    monkeypatch.setattr(resource_governor, "CGROUP_CPU_MAX_FILE", str(tmp_path / "ausente"))
+    monkeypatch.setattr(resource_governor, "CGROUP_V1_CPU_FILES", (str(quota), str(period)))
+    quota.write_text("200000\n")
+    period.write_text("100000\n")
+    assert resource_governor.container_cpu_quota() == 2.0
+    quota.write_text("-1\n")
+    assert resource_governor.container_cpu_quota() is None
@@ -0,0 +1,104 @@
+import threading
+from types import SimpleNamespace
+
+import scheduler
+from scheduler import JobScheduler, ScheduledTokens, priority_for_batch
+
+
+def compete(sched, tickets, total):
+    '''Cada job pede requisições sem parar até o total ser atingido; retorna as concedidas por prioridade.'''
+    lock = threading.Lock()
+    granted = [0]
+
+    def loop(ticket):
+        while True:
+            sched.acquire(ticket)
+            sched.release(ticket)
+            with lock:
+                granted[0] += 1
+                if granted[0] >= total:
+                    return
+
+    threads = [threading.Thread(target=loop, args=(ticket,)) for ticket in tickets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return {ticket.priority: ticket.granted for ticket in tickets}
+
+
+def test_budget_is_split_by_priority_weight():
+    # Espaçamento curto: os dois jobs ficam esperando a vez e o peso decide quem passa
+    sched = JobScheduler(rate_limit=400)
+    high = sched.register(1, "lojahi", "alta")
+    low = sched.register(2, "lojahi", "baixa")
+
+    granted = compete(sched, [high, low], 90)
+
+    # Pesos 8 e 1: a alta recebe a maior parte, a baixa nunca fica parada
+    assert granted["alta"] >= 5 * granted["baixa"]
+    assert granted["baixa"] >= 1
+
+
+def test_accounts_do_not_share_budget():
+    sched = JobScheduler(rate_limit=400)
+    a = sched.register(1, "lojahi", "alta")
+    b = sched.register(2, "select", "baixa")
+
+    compete(sched, [a, b], 40)
+
+    # Contas diferentes não disputam a vez: a baixa não é reduzida pela alta de outra conta
+    assert abs(a.granted - b.granted) <= 10
+
+
+def test_new_job_starts_at_active_virtual_time():
+    sched = JobScheduler(rate_limit=0)
+    first = sched.register(1, "lojahi", "normal")
+    for _ in range(10):
+        sched.acquire(first)
+        sched.release(first)
+
+    late = sched.register(2, "lojahi", "normal")
+    assert late.vtime == first.vtime
+
+
+def test_small_batches_are_interactive():
+    assert priority_for_batch(1) == "alta"
+    assert priority_for_batch(scheduler.SCHEDULER_INTERACTIVE_MAX_SKUS + 1) == "normal"
+
+
+def test_each_http_attempt_takes_a_slot(monkeypatch):
+    sched = JobScheduler(rate_limit=0)
+    ticket = sched.register(1, "lojahi", "normal")
+    in_flight = []
+
+    def fake_request(method, url, **kwargs):
+        in_flight.append(ticket.in_flight)
+        return SimpleNamespace(status_code=200)
+
+    class RetryingTokens:
+        # Como o TokenManager: repete a requisição (após um 401) pelo mesmo `send`
+        def request(self, method, url, send, **kwargs):
+            send(method, url, **kwargs)
+            return send(method, url, **kwargs)
+
+    monkeypatch.setattr(scheduler, "guarded_request", fake_request)
+    ScheduledTokens(RetryingTokens(), sched, ticket).request("GET", "https://www.bling.com.br/Api/v3/produtos")
+
+    assert ticket.granted == 2
+    assert in_flight == [1, 1]
+    assert ticket.in_flight == 0
+
+
+def test_429_backs_off_the_account(monkeypatch):
+    sched = JobScheduler(rate_limit=0)
+    ticket = sched.register(1, "lojahi", "normal")
+    backoffs = []
+    monkeypatch.setattr(scheduler, "guarded_request", lambda method, url, **kwargs: SimpleNamespace(status_code=429))
+    monkeypatch.setattr(sched, "backoff", backoffs.append)
+
+    tokens = SimpleNamespace(request=lambda method, url, send, **kwargs: send(method, url, **kwargs))
+    response = ScheduledTokens(tokens, sched, ticket).request("GET", "https://www.bling.com.br/Api/v3/produtos")
+
+    assert response.status_code == 429
+    assert backoffs == ["lojahi"]
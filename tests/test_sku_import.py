@@ -0,0 +1,91 @@
+import io
+
+import pytest
+
+from sku_import import SkuImportError, format_import_report, import_skus, iter_sku_values, normalize_sku
+
+
+def values(content, file_name, column=None):
+    return [value for _, value in iter_sku_values(io.BytesIO(content), file_name, column)]
+
+
+def xlsx_bytes(rows):
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("raw, sku", [
+    (" ABC-1 ", "ABC-1"),
+    ('"ABC-1"', "ABC-1"),
+    ("\ufeffABC\u200b", "ABC"),
+    ("12345.0", "12345"),
+    ("12345.00", "12345"),
+    (12345.0, "12345"),
+    (12345, "12345"),
+    ("12345.5", "12345.5"),
+    ("1.0A", "1.0A"),
+    (None, ""),
+])
+def test_normalize_sku(raw, sku):
+    assert normalize_sku(raw) == sku
+
+
+def test_csv_finds_sku_column_by_header_and_delimiter():
+    content = "nome;código;preço\nCamisa;ABC-1;10\nCalça;12345.0;20\n".encode("utf-8-sig")
+    assert [normalize_sku(v) for v in values(content, "lista.csv")] == ["ABC-1", "12345"]
+
+
+def test_csv_without_header_uses_first_column():
+    assert values(b"ABC-1,x\nABC-2,y\n", "lista.csv") == ["ABC-1", "ABC-2"]
+
+
+def test_csv_column_by_number():
+    assert values(b"x,ABC-1\ny,ABC-2\n", "lista.csv", column="2") == ["ABC-1", "ABC-2"]
+
+
+def test_csv_unknown_column_name():
+    with pytest.raises(SkuImportError):
+        values(b"sku\nA\n", "lista.csv", column="referencia_pai")
+
+
+def test_txt_one_sku_per_line():
+    assert [normalize_sku(v) for v in values(b"ABC-1\r\n\r\n 12345.0 \n", "lista.txt")] == ["ABC-1", "", "12345"]
+
+
+def test_xlsx_numeric_cells():
+    content = xlsx_bytes([["Código", "Nome"], [12345, "Camisa"], [678.0, "Calça"], ["ABC-1", "Meia"]])
+    assert [normalize_sku(v) for v in values(content, "lista.xlsx")] == ["12345", "678", "ABC-1"]
+
+
+def test_invalid_xlsx():
+    pytest.importorskip("openpyxl")
+    with pytest.raises(SkuImportError, match="XLSX"):
+        values(b"nao e planilha", "lista.xlsx")
+
+
+def test_unsupported_format():
+    with pytest.raises(SkuImportError):
+        values(b"", "lista.pdf")
+
+
+def test_import_report_and_job(store):
+    content = "sku\nABC-1\n\nABC 2\n12345.0\n12345\nABC-1\n".encode()
+    report = import_skus(store, io.BytesIO(content), "lista.csv", "lojahi", chunk_size=2)
+
+    assert store.job_skus(report["job_id"]) == ["ABC-1", "12345"]
+    assert {key: report[key] for key in ("read", "blank", "invalid", "duplicates", "imported")} == \
+        {"read": 6, "blank": 1, "invalid": 1, "duplicates": 2, "imported": 2}
+    assert report["invalid_samples"] == [{"linha": 4, "valor": "ABC 2", "motivo": "contém espaços ou caracteres de controle"}]
+    assert format_import_report(report).startswith("2 SKUs importados de 6 linhas")
+
+
+def test_dry_run_writes_nothing(store):
+    report = import_skus(store, io.BytesIO(b"A\nB\n"), "lista.txt", "lojahi", dry_run=True)
+    assert report["job_id"] is None
+    assert report["imported"] == 2
+    assert store.recent_jobs() == []
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from storage_budget import StorageBudget, StorageFullError, unique_file_bytes
+
+
+def save_sku(store, base, sku, files):
+    '''Grava os arquivos (nome → bytes ou caminho a vincular) e registra no manifesto.'''
+    sku_dir = base / sku
+    sku_dir.mkdir(exist_ok=True)
+    images = []
+    for name, content in files.items():
+        path = sku_dir / name
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            os.link(content, path)
+        images.append({"file_name": name, "url_key": f"{sku}/{name}", "local_path": str(path),
+                       "size": path.stat().st_size})
+    store.record_images(sku, images)
+    return sku_dir
+
+
+def budget_for(store, base, quota):
+    return StorageBudget(store, str(base), quota_bytes=quota, min_free_bytes=0)
+
+
+def test_hard_links_count_once(store, tmp_path):
+    first = save_sku(store, tmp_path, "A", {"1.jpg": b"x" * 1000})
+    save_sku(store, tmp_path, "B", {"1.jpg": str(first / "1.jpg"), "2.jpg": b"y" * 500})
+
+    assert store.total_image_bytes() == 2500
+    assert unique_file_bytes(store.image_files()) == 1500
+    assert budget_for(store, tmp_path, 10_000).used_bytes() == 1500
+
+
+def test_missing_files_do_not_count(store, tmp_path):
+    sku_dir = save_sku(store, tmp_path, "A", {"1.jpg": b"x" * 1000, "2.jpg": b"y" * 300})
+    os.remove(sku_dir / "1.jpg")
+    assert unique_file_bytes(store.image_files()) == 300
+
+
+def test_reserve_evicts_least_recently_used_finished_sku(store, tmp_path):
+    save_sku(store, tmp_path, "ANTIGO", {"1.jpg": b"a" * 600})
+    save_sku(store, tmp_path, "RECENTE", {"1.jpg": b"b" * 600})
+    store.mark_sku_uploaded(["ANTIGO"])
+    store.mark_sku_uploaded(["RECENTE"])
+    store.touch_skus(["RECENTE"])
+    budget = budget_for(store, tmp_path, 1500)
+
+    budget.reserve(500)
+
+    assert not (tmp_path / "ANTIGO").exists()
+    assert (tmp_path / "RECENTE" / "1.jpg").exists()
+    assert store.sku_manifest("ANTIGO") == {}
+    assert budget.used_bytes() == 1100
+
+
+def test_reserve_raises_when_nothing_can_be_evicted(store, tmp_path):
+    save_sku(store, tmp_path, "PENDENTE", {"1.jpg": b"a" * 600})
+    budget = budget_for(store, tmp_path, 1000)
+
+    with pytest.raises(StorageFullError):
+        budget.reserve(500)
+    assert (tmp_path / "PENDENTE" / "1.jpg").exists()
+
+
+def test_protection_is_counted_per_job(store, tmp_path):
+    save_sku(store, tmp_path, "A", {"1.jpg": b"a" * 600})
+    store.mark_sku_exported(["A"])
+    budget = budget_for(store, tmp_path, 1000)
+
+    budget.protect(["A"])
+    budget.protect(["A"])
+    budget.unprotect(["A"])
+    with pytest.raises(StorageFullError):
+        budget.reserve(500)
+
+    budget.unprotect(["A"])
+    budget.reserve(500)
+    assert not (tmp_path / "A").exists()
+
+
+def test_eviction_keeps_files_linked_from_other_skus(store, tmp_path):
+    kept = save_sku(store, tmp_path, "MANTIDO", {"1.jpg": b"x" * 1000})
+    save_sku(store, tmp_path, "ANTIGO", {"1.jpg": str(kept / "1.jpg"), "2.jpg": b"y" * 500})
+    store.mark_sku_uploaded(["ANTIGO"])
+    budget = budget_for(store, tmp_path, 1600)
+
+    budget.reserve(500)
+
+    assert (kept / "1.jpg").read_bytes() == b"x" * 1000
+    assert not (tmp_path / "ANTIGO").exists()
+    # Só o arquivo sem outro link foi liberado
+    assert budget.used_bytes() == 1500
+
+
+def test_usage_is_tracked_without_rescanning(store, tmp_path, monkeypatch):
+    import storage_budget
+
+    save_sku(store, tmp_path, "ANTIGO", {"1.jpg": b"a" * 600})
+    store.mark_sku_uploaded(["ANTIGO"])
+    budget = budget_for(store, tmp_path, 1000)
+
+    def rescan(files):
+        raise AssertionError("o volume não deve ser percorrido de novo")
+
+    monkeypatch.setattr(storage_budget, "unique_file_bytes", rescan)
+    budget.reserve(300)
+    budget.release(100)
+    assert budget.used_bytes() == 800
+    budget.reserve(500)
+    assert budget.used_bytes() == 700
+    assert not (tmp_path / "ANTIGO").exists()
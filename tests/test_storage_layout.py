@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import storage_layout
+from storage_layout import FileIndex, ensure_sku_directory, shard_prefix, sku_directory
+
+
+@pytest.fixture
+def scandirs(monkeypatch):
+    '''Pastas listadas com os.scandir durante o teste.'''
+    listed = []
+    original = os.scandir
+
+    def counting(path="."):
+        listed.append(os.path.normpath(path))
+        return original(path)
+
+    monkeypatch.setattr(os, "scandir", counting)
+    return listed
+
+
+def test_flat_directories_come_from_root_listing(tmp_path, scandirs):
+    (tmp_path / "ANTIGO").mkdir()
+    (tmp_path / "ANTIGO" / "1.jpg").write_bytes(b"x")
+    index = FileIndex()
+    index.preload([str(tmp_path)])
+
+    assert sku_directory(str(tmp_path), "ANTIGO", index) == str(tmp_path / "ANTIGO")
+    assert index.is_dir(str(tmp_path / "ANTIGO"))
+    assert scandirs == [str(tmp_path)]
+
+    # O conteúdo da pasta só é listado quando consultado
+    assert index.exists(str(tmp_path / "ANTIGO" / "1.jpg"))
+    assert scandirs == [str(tmp_path), str(tmp_path / "ANTIGO")]
+
+
+def test_file_is_not_a_directory(tmp_path):
+    (tmp_path / "NOME").write_bytes(b"x")
+    index = FileIndex()
+    assert not index.is_dir(str(tmp_path / "NOME"))
+    assert index.exists(str(tmp_path / "NOME"))
+
+
+def test_new_sku_goes_to_sharded_directory(tmp_path, monkeypatch, scandirs):
+    monkeypatch.setattr(storage_layout, "STORAGE_LAYOUT", "sharded")
+    index = FileIndex()
+    index.preload([str(tmp_path)])
+
+    sku_path = sku_directory(str(tmp_path), "NOVO", index)
+    assert sku_path == os.path.join(str(tmp_path), shard_prefix("NOVO"), "NOVO")
+    assert not index.is_dir(sku_path)
+
+    ensure_sku_directory(sku_path, index)
+    assert os.path.isdir(sku_path)
+    listed = len(scandirs)
+    assert index.is_dir(sku_path)
+    assert not index.exists(os.path.join(sku_path, "1.jpg"))
+    assert len(scandirs) == listed
+
+
+def test_added_files_are_seen_without_listing_again(tmp_path, scandirs):
+    index = FileIndex()
+    assert not index.exists(str(tmp_path / "1.jpg"))
+    (tmp_path / "1.jpg").write_bytes(b"x")
+    index.add(str(tmp_path / "1.jpg"))
+    assert index.exists(str(tmp_path / "1.jpg"))
+    index.discard(str(tmp_path / "1.jpg"))
+    assert not index.exists(str(tmp_path / "1.jpg"))
+    assert scandirs == [str(tmp_path)]
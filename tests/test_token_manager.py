@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import token_manager
+from token_manager import TokenManager, TokenRefreshError, load_tokens, save_tokens, token_file_path
+
+ACCOUNT = "lojahi"
+
+
+class FakeTokenEndpoint:
+    '''Endpoint de renovação do Bling: emite tokens numerados e conta as chamadas.'''
+
+    def __init__(self, delay=0.0, status_code=200):
+        self.delay = delay
+        self.status_code = status_code
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url, headers=None, data=None):
+        with self._lock:
+            self.calls.append(data["refresh_token"])
+            number = len(self.calls)
+        time.sleep(self.delay)
+        if self.status_code != 200:
+            response = SimpleNamespace(status_code=self.status_code, text="invalid_grant")
+            response.raise_for_status = lambda: (_ for _ in ()).throw(requests.exceptions.HTTPError(response=response))
+            return response
+        payload = {"access_token": f"novo-{number}", "refresh_token": f"refresh-{number}", "expires_in": 21600}
+        return SimpleNamespace(status_code=200, json=lambda: payload, raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeTokenEndpoint()
+    monkeypatch.setattr(token_manager.requests, "post", fake)
+    return fake
+
+
+def authenticate(storage_path, access_token="antigo", expires_in=timedelta(hours=6)):
+    save_tokens(str(storage_path), ACCOUNT, {"access_token": access_token, "refresh_token": "refresh-0",
+                                              "expires_at": (datetime.now() + expires_in).isoformat()})
+
+
+def manager(storage_path):
+    return TokenManager(ACCOUNT, "client", "secret", str(storage_path))
+
+
+def test_401_refreshes_once_and_retries(tmp_path, endpoint):
+    authenticate(tmp_path)
+    sent = []
+
+    def send(method, url, headers=None, **kwargs):
+        sent.append(headers["Authorization"])
+        return SimpleNamespace(status_code=401 if len(sent) == 1 else 200)
+
+    response = manager(tmp_path).request("GET", "https://www.bling.com.br/Api/v3/produtos", send=send)
+
+    assert response.status_code == 200
+    assert sent == ["Bearer antigo", "Bearer novo-1"]
+    assert endpoint.calls == ["refresh-0"]
+    assert load_tokens(str(tmp_path), ACCOUNT)["refresh_token"] == "refresh-1"
+
+
+def test_second_401_is_returned_without_another_refresh(tmp_path, endpoint):
+    authenticate(tmp_path)
+    sent = []
+
+    def send(method, url, headers=None, **kwargs):
+        sent.append(headers["Authorization"])
+        return SimpleNamespace(status_code=401)
+
+    response = manager(tmp_path).request("GET", "https://www.bling.com.br/Api/v3/produtos", send=send)
+
+    assert response.status_code == 401
+    assert len(sent) == 2
+    assert len(endpoint.calls) == 1
+
+
+def test_token_close_to_expiry_is_renewed_before_use(tmp_path, endpoint):
+    authenticate(tmp_path, expires_in=timedelta(seconds=60))
+    assert manager(tmp_path).get_access_token() == "novo-1"
+    assert manager(tmp_path).get_access_token() == "novo-1"
+    assert len(endpoint.calls) == 1
+
+
+def test_concurrent_refreshes_reuse_the_renewed_token(tmp_path, endpoint):
+    endpoint.delay = 0.05
+    authenticate(tmp_path)
+    # Dois gerenciadores simulam processos diferentes: só a trava de arquivo os serializa
+    managers = [manager(tmp_path), manager(tmp_path)]
+    results = []
+
+    def refresh(tokens):
+        results.append(tokens.refresh(stale_access_token="antigo")["access_token"])
+
+    threads = [threading.Thread(target=refresh, args=(managers[i % 2],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert endpoint.calls == ["refresh-0"]
+    assert results == ["novo-1"] * 8
+
+
+def test_refresh_failure_raises_token_refresh_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_manager.requests, "post", FakeTokenEndpoint(status_code=400))
+    authenticate(tmp_path)
+    with pytest.raises(TokenRefreshError):
+        manager(tmp_path).refresh()
+    assert load_tokens(str(tmp_path), ACCOUNT, force_check=True)["access_token"] == "antigo"
+
+
+def test_unauthenticated_account(tmp_path, endpoint):
+    with pytest.raises(TokenRefreshError):
+        manager(tmp_path).get_access_token()
+    assert endpoint.calls == []
+
+
+def test_failed_save_keeps_previous_file(tmp_path, monkeypatch):
+    authenticate(tmp_path)
+
+    def broken_dump(tokens, f, **kwargs):
+        f.write('{"access_token": "pela met')
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(token_manager.json, "dump", broken_dump)
+    with pytest.raises(OSError):
+        save_tokens(str(tmp_path), ACCOUNT, {"access_token": "novo"})
+
+    with open(token_file_path(str(tmp_path), ACCOUNT), encoding="utf-8") as f:
+        assert json.load(f)["access_token"] == "antigo"
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_readers_never_see_a_partial_file(tmp_path):
+    authenticate(tmp_path)
+    token_file = token_file_path(str(tmp_path), ACCOUNT)
+    stop = threading.Event()
+    errors = []
+
+    def read_loop():
+        while not stop.is_set():
+            try:
+                with open(token_file, encoding="utf-8") as f:
+                    json.load(f)
+            except ValueError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read_loop)
+    reader.start()
+    for number in range(200):
+        save_tokens(str(tmp_path), ACCOUNT, {"access_token": f"token-{number}" * 50, "refresh_token": "r"})
+    stop.set()
+    reader.join(10)
+    assert errors == []
+
+
+def test_cache_rereads_file_only_when_it_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_manager, "TOKEN_CACHE_CHECK_INTERVAL", 60)
+    authenticate(tmp_path)
+    reads = []
+    original_read = token_manager._read_token_file
+
+    def counting_read(*args):
+        reads.append(args[0])
+        return original_read(*args)
+
+    monkeypatch.setattr(token_manager, "_read_token_file", counting_read)
+    token_file = token_file_path(str(tmp_path), ACCOUNT)
+
+    # Escrito por este processo: servido pelo cache, mesmo conferindo o arquivo
+    assert load_tokens(str(tmp_path), ACCOUNT)["access_token"] == "antigo"
+    assert load_tokens(str(tmp_path), ACCOUNT, force_check=True)["access_token"] == "antigo"
+    assert reads == []
+
+    # Outro processo reescreve o arquivo: dentro do intervalo vale o cache; conferindo, relê
+    with open(token_file, "w", encoding="utf-8") as f:
+        json.dump({"access_token": "de-outra-replica", "refresh_token": "r"}, f)
+    stat = os.stat(token_file)
+    os.utime(token_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_tokens(str(tmp_path), ACCOUNT)["access_token"] == "antigo"
+    assert load_tokens(str(tmp_path), ACCOUNT, force_check=True)["access_token"] == "de-outra-replica"
+    assert reads == [token_file]
+
+
+def test_cache_returns_copies(tmp_path):
+    authenticate(tmp_path)
+    load_tokens(str(tmp_path), ACCOUNT)["access_token"] = "alterado"
+    assert load_tokens(str(tmp_path), ACCOUNT)["access_token"] == "antigo"
+
+
+def test_legacy_file_expiry_from_mtime(tmp_path):
+    token_file = token_file_path(str(tmp_path), ACCOUNT)
+    with open(token_file, "w", encoding="utf-8") as f:
+        json.dump({"access_token": "legado", "refresh_token": "r", "expires_in": 3600}, f)
+
+    expires_at = datetime.fromisoformat(load_tokens(str(tmp_path), ACCOUNT, force_check=True)["expires_at"])
+    saved_at = datetime.fromtimestamp(os.stat(token_file).st_mtime)
+    assert expires_at == saved_at + timedelta(seconds=3600)
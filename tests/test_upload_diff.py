@@ -0,0 +1,27 @@
+from upload_diff import local_signature, missing_images
+
+
+def remote(md5, size=100):
+    return {"link": f"https://s3.test/{md5}", "size": size, "md5": md5}
+
+
+def test_local_signature(tmp_path):
+    path = tmp_path / "1.jpg"
+    path.write_bytes(b"abc")
+    assert local_signature(str(path)) == {"path": str(path), "size": 3, "md5": "900150983cd24fb0d6963f7d28e17f72"}
+
+
+def test_matches_by_md5_once_per_remote_image():
+    local = [{"path": "a.jpg", "size": 100, "md5": "a" * 32}, {"path": "b.jpg", "size": 100, "md5": "a" * 32}]
+    assert missing_images(local, [remote("a" * 32)]) == ["b.jpg"]
+
+
+def test_same_size_without_md5_is_not_a_match():
+    local = [{"path": "a.jpg", "size": 100, "md5": "a" * 32}]
+    # ETag de upload em partes (sem MD5 utilizável) com o mesmo tamanho: a imagem é enviada
+    assert missing_images(local, [remote(None, size=100)]) == ["a.jpg"]
+
+
+def test_different_md5_is_missing():
+    local = [{"path": "a.jpg", "size": 100, "md5": "a" * 32}]
+    assert missing_images(local, [remote("b" * 32, size=100)]) == ["a.jpg"]